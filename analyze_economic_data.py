@@ -11,9 +11,17 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
+from datastore import CrawlStore
+from history_loader import load_history
+from numeric_parsing import ECONOMIC_NUMERIC_COLUMNS, EARNINGS_NUMERIC_COLUMNS, parse_numeric_columns
 
 def load_latest_data(data_dir="./data"):
     """加载最新的经济和财报数据"""
+    store_path = os.path.join(data_dir, "crawl_data.db")
+    if os.path.exists(store_path):
+        return load_latest_from_store(store_path)
+    
+    # 兼容旧版本写出的 latest_*.csv
     economic_data_path = os.path.join(data_dir, "latest_economic_data.csv")
     earnings_data_path = os.path.join(data_dir, "latest_earnings_data.csv")
     
@@ -34,8 +42,38 @@ def load_latest_data(data_dir="./data"):
         
     return economic_data, earnings_data
 
-def generate_summary_report(economic_data, earnings_data, output_dir="./reports"):
-    """生成数据摘要报告"""
+def load_latest_from_store(store_path):
+    """从增量数据库查询最新的经济和财报数据"""
+    store = CrawlStore(store_path)
+    try:
+        economic_rows = store.latest("economic_data")
+        earnings_rows = store.latest("earnings_data")
+    finally:
+        store.close()
+    
+    economic_data = pd.DataFrame(economic_rows) if economic_rows else None
+    earnings_data = pd.DataFrame(earnings_rows) if earnings_rows else None
+    
+    if economic_data is not None:
+        print(f"已加载经济数据: {economic_data.shape[0]} 条记录")
+    else:
+        print("数据库中没有经济数据")
+    if earnings_data is not None:
+        print(f"已加载财报数据: {earnings_data.shape[0]} 条记录")
+    else:
+        print("数据库中没有财报数据")
+    
+    return economic_data, earnings_data
+
+def load_history_data(data_dir="./data", since=None):
+    """加载所有历史快照（使用增量更新的列式缓存）"""
+    economic_history, earnings_history = load_history(data_dir, since=since)
+    print(f"已加载历史快照: 经济数据 {economic_history['snapshot_file'].nunique()} 个快照 / {economic_history.shape[0]} 条记录，"
+          f"财报数据 {earnings_history['snapshot_file'].nunique()} 个快照 / {earnings_history.shape[0]} 条记录")
+    return economic_history, earnings_history
+
+def generate_summary_report(economic_data, earnings_data, output_dir="./reports", history=None):
+    """生成数据摘要报告，history 为 load_history_data 的返回值时附带历史快照统计"""
     os.makedirs(output_dir, exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d")
     report_path = os.path.join(output_dir, f"economic_summary_{timestamp}.html")
@@ -67,6 +105,18 @@ def generate_summary_report(economic_data, earnings_data, output_dir="./reports"
                 country_counts = earnings_data['country'].value_counts()
                 f.write(country_counts.to_frame().to_html())
         
+        # 历史快照统计
+        if history is not None:
+            f.write("<h2>历史快照</h2>")
+            for name, frame in zip(("经济数据", "财报数据"), history):
+                if frame.empty:
+                    continue
+                f.write(f"<h3>{name}</h3>")
+                f.write(f"<p>快照数量: {frame['snapshot_file'].nunique()}，记录总数: {frame.shape[0]}，"
+                        f"时间范围: {frame['snapshot_time'].min()} ~ {frame['snapshot_time'].max()}</p>")
+                per_day = frame.groupby(frame['snapshot_time'].dt.date).size().tail(10)
+                f.write(per_day.rename("records").to_frame().to_html())
+        
         f.write("</body></html>")
     
     print(f"摘要报告已生成: {report_path}")
@@ -93,14 +143,29 @@ def visualize_data(economic_data, earnings_data, output_dir="./reports"):
         plt.close()
         print(f"已生成图表: {chart_path}")
     
+    # 每股收益实际值与预测值的差异
+    if earnings_data is not None and 'eps_actual' in earnings_data.columns and 'eps_forecast' in earnings_data.columns:
+        earnings_data = parse_numeric_columns(earnings_data, EARNINGS_NUMERIC_COLUMNS)
+        eps_surprise = (earnings_data['eps_actual_value'] - earnings_data['eps_forecast_value']).dropna()
+        if not eps_surprise.empty:
+            plt.figure(figsize=(12, 6))
+            sns.histplot(eps_surprise, kde=True)
+            plt.title('Distribution of EPS Surprises')
+            plt.xlabel('EPS Surprise (Actual - Forecast)')
+            plt.tight_layout()
+            chart_path = os.path.join(output_dir, f"earnings_eps_surprise_{timestamp}.png")
+            plt.savefig(chart_path)
+            plt.close()
+            print(f"已生成图表: {chart_path}")
+    
     # 可视化经济数据
     if economic_data is not None and 'actual' in economic_data.columns and 'forecast' in economic_data.columns:
-        # 清洗数据，转换为数值类型
-        economic_data['actual'] = pd.to_numeric(economic_data['actual'], errors='coerce')
-        economic_data['forecast'] = pd.to_numeric(economic_data['forecast'], errors='coerce')
+        # 清洗数据，解析带单位的数值（3.2%、215K、-1.5B 等）
+        economic_data = parse_numeric_columns(economic_data, ECONOMIC_NUMERIC_COLUMNS)
         
-        # 计算预测与实际值的差异
-        economic_data['difference'] = economic_data['actual'] - economic_data['forecast']
+        # 计算预测与实际值的差异，只比较单位相同的记录
+        same_unit = economic_data['actual_unit'] == economic_data['forecast_unit']
+        economic_data['difference'] = (economic_data['actual_value'] - economic_data['forecast_value']).where(same_unit)
         
         plt.figure(figsize=(12, 6))
         sns.histplot(economic_data['difference'].dropna(), kde=True)
@@ -116,8 +181,9 @@ def main():
     """主函数"""
     print("开始分析经济数据...")
     economic_data, earnings_data = load_latest_data()
+    history = load_history_data()
     if economic_data is not None or earnings_data is not None:
-        report_path = generate_summary_report(economic_data, earnings_data)
+        report_path = generate_summary_report(economic_data, earnings_data, history=history)
         visualize_data(economic_data, earnings_data)
         print(f"分析完成，报告已保存到 {report_path}")
     else:
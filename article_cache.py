@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Google Finance 文章正文的磁盘缓存
+以规范化后的链接（去掉跟踪参数、锚点等）为键，保存提取到的正文、抓取时间和内容哈希，
+支持按 TTL 过期和按条目数/总大小淘汰。top stories 变化很慢，
+命中缓存的文章不再打开浏览器页面。
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger("article_cache")
+
+# 常见的跟踪参数，规范化链接时去掉
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid",
+    "ocid", "cmpid", "cmp", "ncid", "sr_share", "smid", "soc_src", "soc_trk",
+    "guccounter", "guce_referrer", "guce_referrer_sig", "_ga", "_gl",
+    "ref", "ref_src", "taid", "yptr"
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "at_")
+
+
+def canonicalize_url(url):
+    """
+    规范化文章链接
+    - scheme 和 host 转小写，去掉默认端口
+    - 去掉锚点和跟踪参数，其余参数排序
+    - 去掉路径末尾的 /
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or
+                           (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    path = parts.path
+    if len(path) > 1:
+        path = path.rstrip("/")
+    return urlunsplit((scheme, host, path or "/", urlencode(sorted(query)), ""))
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ArticleCache:
+    def __init__(self, path="./data/article_cache.db", ttl_hours=72,
+                 max_entries=5000, max_size_mb=200):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.max_bytes = max_size_mb * 1024 * 1024
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS articles (
+                url TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self.reset_stats()
+
+    @classmethod
+    def from_config(cls, config_path="config.json"):
+        """根据 config.json 中的 article_cache 配置创建"""
+        try:
+            with open(config_path, 'r') as f:
+                cache_config = json.load(f).get("article_cache", {})
+        except Exception as e:
+            logger.warning(f"加载文章缓存配置失败，使用默认配置: {str(e)}")
+            cache_config = {}
+        return cls(**cache_config)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        # 本次运行中已计为未命中的链接，同一链接出现在多张卡片上时只计一次
+        self._missed = set()
+
+    def get(self, link):
+        """返回缓存中未过期的正文，未命中时返回 None"""
+        url = canonicalize_url(link)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, fetched_at FROM articles WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if url not in self._missed:
+                    self._missed.add(url)
+                    self.misses += 1
+                return None
+            self._conn.execute("UPDATE articles SET accessed_at = ? WHERE url = ?", (now, url))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, link, content):
+        """缓存正文；空内容（抓取失败）不缓存，下次运行会重新抓取"""
+        if not content:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?)",
+                (canonicalize_url(link), content, content_hash(content),
+                 len(content.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """删除过期条目，再按最近访问时间淘汰直到满足条目数和大小限制"""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM articles WHERE fetched_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM articles"
+            ).fetchone()
+            if count > self.max_entries or total > self.max_bytes:
+                doomed = []
+                for url, size in self._conn.execute(
+                        "SELECT url, size FROM articles ORDER BY accessed_at"):
+                    if count <= self.max_entries and total <= self.max_bytes:
+                        break
+                    doomed.append((url,))
+                    count -= 1
+                    total -= size
+                self._conn.executemany("DELETE FROM articles WHERE url = ?", doomed)
+                removed += len(doomed)
+            self._conn.commit()
+
+        if removed:
+            logger.info(f"文章缓存淘汰 {removed} 条")
+        return removed
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
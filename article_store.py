@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Google Finance 文章库
+文章的元数据（标题、来源、时间、链接、图片）和正文保存在同一个 SQLite 文件中，
+按规范化链接去重，一次运行的文章在一个事务中批量写入；
+FTS5 全文索引（标题权重更高）支持按关键词排序检索，并按来源和时间过滤。
+取代原来以标题命名的 .txt 文件（标题中的 / 和换行会导致路径错误，也只能用 grep 查找）。
+
+用法：
+python article_store.py "fed rate cut" --source Reuters --since 2026-10-01
+python article_store.py --import-dir google_finance_data   # 导入旧的 .txt 文件
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from article_cache import canonicalize_url, content_hash
+
+logger = logging.getLogger("article_store")
+
+# 卡片上的相对时间，如 "3 hours ago"、"1 day ago"
+RELATIVE_TIME_PATTERN = re.compile(r"(\d+)\s*(minute|min|hour|hr|day|week)s?\s+ago", re.IGNORECASE)
+RELATIVE_UNITS = {"minute": "minutes", "min": "minutes", "hour": "hours", "hr": "hours",
+                  "day": "days", "week": "weeks"}
+FTS_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def resolve_published(text, fetched_at):
+    """把卡片上的相对时间换算为绝对时间（ISO 格式），无法解析时使用抓取时间"""
+    text = (text or "").strip()
+    match = RELATIVE_TIME_PATTERN.search(text)
+    if match:
+        delta = timedelta(**{RELATIVE_UNITS[match.group(2).lower()]: int(match.group(1))})
+        return (fetched_at - delta).isoformat(timespec="seconds")
+    if text.lower() == "yesterday":
+        return (fetched_at - timedelta(days=1)).isoformat(timespec="seconds")
+    return fetched_at.isoformat(timespec="seconds")
+
+
+def match_expression(query):
+    """
+    把普通关键词转换为 FTS5 查询，每个词加引号，避免 - : 等字符被当作语法；
+    以 fts: 开头时原样使用 FTS5 语法（OR、NEAR、前缀 * 等）
+    """
+    if query.startswith("fts:"):
+        return query[4:]
+    return " ".join(f'"{token}"' for token in FTS_TOKEN_PATTERN.findall(query))
+
+
+class ArticleStore:
+    def __init__(self, path="./data/articles.db"):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL UNIQUE,
+                    link TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    source TEXT NOT NULL DEFAULT '',
+                    time TEXT NOT NULL DEFAULT '',
+                    published_at TEXT NOT NULL,
+                    image TEXT NOT NULL DEFAULT '',
+                    content TEXT NOT NULL DEFAULT '',
+                    content_hash TEXT NOT NULL DEFAULT '',
+                    duplicate_of TEXT,
+                    first_seen TEXT NOT NULL,
+                    last_updated TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_published ON articles (published_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_source ON articles (source, published_at)")
+            # 外部内容表：索引只保存词项，正文只存一份，由触发器保持同步
+            self._conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+                    title, content, content='articles', content_rowid='id', tokenize='porter unicode61'
+                )
+            """)
+            self._conn.executescript("""
+                CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+                    INSERT INTO articles_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+                    INSERT INTO articles_fts (articles_fts, rowid, title, content)
+                    VALUES ('delete', old.id, old.title, old.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE OF title, content ON articles BEGIN
+                    INSERT INTO articles_fts (articles_fts, rowid, title, content)
+                    VALUES ('delete', old.id, old.title, old.content);
+                    INSERT INTO articles_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+                END;
+            """)
+
+    @classmethod
+    def from_config(cls, config_path="config.json"):
+        """根据 config.json 中的 article_store 配置创建"""
+        try:
+            with open(config_path, 'r') as f:
+                store_config = json.load(f).get("article_store", {})
+        except Exception as e:
+            logger.warning(f"加载文章库配置失败，使用默认配置: {str(e)}")
+            store_config = {}
+        return cls(**store_config)
+
+    def save(self, stories, fetched_at=None):
+        """
+        在一个事务中写入一批文章（get_top_story 的结果），返回新增/更新/未变化的篇数
+        已有文章只有标题、正文等内容变化时才更新；抓取失败的空正文不会覆盖已有正文
+        """
+        fetched_at = fetched_at or datetime.now()
+        result = self._save_batch([(story, fetched_at) for story in stories])
+        logger.info(f"文章库：新增 {result['inserted']} 篇，更新 {result['updated']} 篇，"
+                    f"未变化 {result['unchanged']} 篇")
+        return result
+
+    def _save_batch(self, batch):
+        """batch 为 [(文章, 抓取时间), ...]，在一个事务中写入"""
+        inserted = updated = unchanged = 0
+        with self._lock, self._conn:
+            for story, fetched_at in batch:
+                now = fetched_at.isoformat(timespec="seconds")
+                url = canonicalize_url(story["link"])
+                # 重复文章（near_duplicates）只保存元数据，正文从原文读取，检索结果中不会重复出现
+                content = "" if story.get("duplicate_of") else story.get("content") or ""
+                row = self._conn.execute(
+                    "SELECT id, title, source, image, content, duplicate_of FROM articles WHERE url = ?",
+                    (url,)).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO articles (url, link, title, source, time, published_at, image, content, "
+                        "content_hash, duplicate_of, first_seen, last_updated) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (url, story["link"], story.get("title") or "", story.get("source") or "",
+                         story.get("time") or "", resolve_published(story.get("time"), fetched_at),
+                         story.get("image") or "", content, content_hash(content) if content else "",
+                         story.get("duplicate_of"), now, now))
+                    inserted += 1
+                    continue
+
+                values = {
+                    "title": story.get("title") or row["title"],
+                    "source": story.get("source") or row["source"],
+                    "image": story.get("image") or row["image"],
+                    "content": content or row["content"],
+                    "duplicate_of": story.get("duplicate_of") or row["duplicate_of"]
+                }
+                if all(values[key] == row[key] for key in values):
+                    unchanged += 1
+                    continue
+                self._conn.execute(
+                    "UPDATE articles SET title = ?, source = ?, image = ?, content = ?, content_hash = ?, "
+                    "duplicate_of = ?, last_updated = ? WHERE id = ?",
+                    (values["title"], values["source"], values["image"], values["content"],
+                     content_hash(values["content"]) if values["content"] else "",
+                     values["duplicate_of"], now, row["id"]))
+                updated += 1
+        return {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+
+    @staticmethod
+    def _filters(source, since, until, include_duplicates=False, alias="a"):
+        conditions, params = [], []
+        if not include_duplicates:
+            # 近似重复的文章只作为原文的别名保存，默认不出现在结果中
+            conditions.append(f"COALESCE({alias}.duplicate_of, '') = ''")
+        for column, op, value in (("source", "=", source), ("published_at", ">=", since),
+                                  ("published_at", "<", until)):
+            if value is not None:
+                conditions.append(f"{alias}.{column} {op} ?")
+                params.append(value)
+        return conditions, params
+
+    def search(self, query, source=None, since=None, until=None, limit=20, title_weight=5.0,
+               include_duplicates=False):
+        """
+        按关键词检索，返回按相关度（bm25，标题中的匹配权重更高）排序的文章，不含正文
+        since / until 为 ISO 格式的发布时间，source 为来源名称
+        include_duplicates 为 False 时不返回近似重复的文章（duplicate_of 不为空）
+        """
+        expression = match_expression(query)
+        if not expression:
+            return self.recent(source, since, until, limit, include_duplicates)
+        conditions, params = self._filters(source, since, until, include_duplicates)
+        conditions.insert(0, "articles_fts MATCH ?")
+        params.insert(0, expression)
+        sql = (f"SELECT a.id, a.url, a.title, a.source, a.time, a.published_at, a.image, a.duplicate_of, "
+               f"bm25(articles_fts, {float(title_weight)}, 1.0) AS rank, "
+               f"snippet(articles_fts, 1, '[', ']', '…', 12) AS snippet "
+               f"FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid "
+               f"WHERE {' AND '.join(conditions)} ORDER BY rank LIMIT ?")
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params + [limit])]
+
+    def recent(self, source=None, since=None, until=None, limit=20, include_duplicates=False):
+        """按发布时间倒序列出文章，不含正文，默认不包括近似重复的文章"""
+        conditions, params = self._filters(source, since, until, include_duplicates)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = (f"SELECT a.id, a.url, a.title, a.source, a.time, a.published_at, a.image, a.duplicate_of "
+               f"FROM articles a {where} ORDER BY a.published_at DESC LIMIT ?")
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params + [limit])]
+
+    def get(self, link):
+        """按链接读取一篇文章（含正文，重复文章使用原文的正文），不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM articles WHERE url = ?", (canonicalize_url(link),)).fetchone()
+            if row is None:
+                return None
+            article = dict(row)
+            if not article["content"] and article["duplicate_of"]:
+                original = self._conn.execute("SELECT content FROM articles WHERE url = ?",
+                                              (article["duplicate_of"],)).fetchone()
+                if original is not None:
+                    article["content"] = original["content"]
+        return article
+
+    def import_text_files(self, directory, source="", batch_size=500):
+        """导入旧版本保存的 <标题>.txt 文件，标题取自文件名，时间取文件修改时间"""
+        imported, batch = 0, []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not name.endswith(".txt") or not os.path.isfile(path):
+                continue
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                content = f.read()
+            title = " ".join(name[:-4].split())
+            fetched_at = datetime.fromtimestamp(os.path.getmtime(path))
+            # 旧文件没有保存链接，用文件路径作为唯一标识
+            batch.append(({"link": f"file://{os.path.abspath(path)}", "title": title, "source": source,
+                           "content": content}, fetched_at))
+            if len(batch) >= batch_size:
+                imported += self._save_batch(batch)["inserted"]
+                batch = []
+        if batch:
+            imported += self._save_batch(batch)["inserted"]
+        return imported
+
+    def stats(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS articles, COUNT(DISTINCT source) AS sources, "
+                "MIN(published_at) AS oldest, MAX(published_at) AS newest FROM articles").fetchone()
+        return dict(row)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ArticleWriter:
+    """
+    在后台线程中把文章写入文章库，和抓取同时进行
+    put 在队列已满（max_pending 篇）时阻塞，内存中最多保留 max_pending + batch_size 篇正文；
+    每 batch_size 篇或 flush_seconds 秒提交一次事务，已提交的文章不受之后中断的影响
+
+    with ArticleWriter(store) as writer:
+        for story in iter_top_stories():
+            writer.put(story)
+    """
+
+    _STOP = object()
+
+    def __init__(self, store, max_pending=8, batch_size=4, flush_seconds=2.0):
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._thread = None
+        self.inserted = self.updated = self.unchanged = self.failed = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="article-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, story):
+        if self._thread is None or not self._thread.is_alive():
+            raise RuntimeError("文章写入线程未启动或已停止")
+        self._queue.put(story)
+
+    def _run(self):
+        batch, deadline = [], None
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                break
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_seconds
+                batch.append(item)
+            # 批次已满，或等待超过 flush_seconds
+            if batch and (len(batch) >= self.batch_size or item is None):
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            result = self.store.save(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"写入 {len(batch)} 篇文章失败: {str(e)}")
+            return
+        self.inserted += result["inserted"]
+        self.updated += result["updated"]
+        self.unchanged += result["unchanged"]
+
+    def close(self):
+        """写入队列中剩余的文章并停止线程，返回写入统计"""
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+        return self.stats()
+
+    def stats(self):
+        return {"inserted": self.inserted, "updated": self.updated,
+                "unchanged": self.unchanged, "failed": self.failed}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        # 出错或中断时也写入已抓取的文章
+        self.close()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索 Google Finance 文章库")
+    parser.add_argument("query", nargs="?", default="", help="关键词；以 fts: 开头时使用 FTS5 查询语法")
+    parser.add_argument("--path", default=None, help="文章库文件，默认使用 config.json 中的 article_store.path")
+    parser.add_argument("--source", default=None, help="只检索该来源的文章")
+    parser.add_argument("--since", default=None, help="发布时间不早于，如 2026-10-01")
+    parser.add_argument("--until", default=None, help="发布时间早于")
+    parser.add_argument("--limit", type=int, default=20, help="最多返回的文章数")
+    parser.add_argument("--content", action="store_true", help="同时输出正文")
+    parser.add_argument("--include-duplicates", action="store_true", help="结果中包括近似重复的文章")
+    parser.add_argument("--import-dir", default=None, help="导入旧版本保存的 .txt 文件目录")
+    parser.add_argument("--stats", action="store_true", help="输出文章库统计信息")
+    args = parser.parse_args()
+
+    store = ArticleStore(args.path) if args.path else ArticleStore.from_config()
+    try:
+        if args.import_dir:
+            print(f"导入 {store.import_text_files(args.import_dir)} 篇文章")
+        if args.stats:
+            print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+        if args.import_dir or args.stats:
+            return
+
+        started = datetime.now()
+        results = store.search(args.query, args.source, args.since, args.until, args.limit,
+                               include_duplicates=args.include_duplicates)
+        elapsed = (datetime.now() - started).total_seconds() * 1000
+        for article in results:
+            print(f"{article['published_at']}  [{article['source']}] {article['title']}")
+            print(f"    {article['url']}")
+            if article.get("snippet"):
+                print(f"    {' '.join(article['snippet'].split())}")
+            if args.content:
+                print((store.get(article["url"]) or {}).get("content", ""))
+            print("-" * 50)
+        print(f"共 {len(results)} 篇，用时 {elapsed:.1f} ms")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+MarketWatch 和 Investing.com 的异步爬虫
+AsyncMarketWatchCrawler / AsyncInvestingEarningsCrawler 继承同步爬虫的存储、会话和限速逻辑，
+页面加载改为异步：
+- 传入异步 Playwright 的 context 时在该 context 中渲染页面
+- 否则使用 crawl4ai 的 AsyncWebCrawler 渲染，得到的 HTML 用同一份提取规则解析（html_extraction）
+run_async() 是异步入口，run() 保留为 asyncio.run(run_async()) 的同步包装。
+
+run_sources 在同一个事件循环中并发执行多个数据源，组合运行的耗时约等于最慢的数据源，
+而不是各数据源之和；每个数据源有单独的超时，超时时只取消该数据源。
+
+用法：
+python async_crawlers.py --sources marketwatch investing --timeout investing=180
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CacheMode, CrawlerRunConfig
+
+from marketwatch_crawler import MarketWatchCrawler
+from investing_crawler import InvestingEarningsCrawler
+from extraction_schemas import INVESTING_SCHEMA, MARKETWATCH_SCHEMA
+from html_extraction import extract_from_html
+from page_extraction import extract_from_page_async
+from datastore import CrawlStore
+from change_capture import load_change_log
+from rate_limiter import THROTTLE_STATUSES, goto_async, is_challenge, retry_after_seconds
+from session_pool import SessionBlocked
+from page_archive import archive_response_async, get_page_archive
+import instrumentation
+
+logger = logging.getLogger("async_crawlers")
+
+TITLE_PATTERN = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+
+class _AsyncCrawlMixin:
+    """两个异步爬虫共用的会话租用和页面加载"""
+
+    source = None
+    schema = None
+    wait_selector = None
+
+    @asynccontextmanager
+    async def _session_scope_async(self):
+        """
+        使用传入的会话，没有时从会话池租用一个（在线程中等待，不阻塞事件循环）
+        被取消（例如超时）时只归还会话，不计为会话失败
+        """
+        if self.session is not None:
+            yield self.session
+            return
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self.sessions.acquire))
+        try:
+            session = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # 线程中的等待无法取消，拿到会话后立即归还
+            acquiring.add_done_callback(self._release_acquired)
+            raise
+        started = time.monotonic()
+        try:
+            yield session
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            self.sessions.report(session, ok=False, unless_reported=True)
+            raise
+        else:
+            self.sessions.report(session, ok=True, latency=time.monotonic() - started, unless_reported=True)
+        finally:
+            self.sessions.release(session)
+
+    def _release_acquired(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.sessions.release(future.result())
+
+    async def _render(self, session):
+        """渲染页面并执行提取规则"""
+        if self.context is not None:
+            page = await self._open_page_async(session)
+            try:
+                with instrumentation.stage(self.source, "extraction"):
+                    return await extract_from_page_async(page, self.schema)
+            finally:
+                await page.close()
+        html = await self._fetch_html(session)
+        with instrumentation.stage(self.source, "extraction"):
+            return extract_from_html(html, self.schema)
+
+    async def _open_page_async(self, session):
+        """
+        在异步 Playwright 的 context 中打开页面，调用方负责关闭页面
+        会话被封（限流状态码或验证页面）时立即抛出 SessionBlocked，不再等待表格超时
+        """
+        await self.blocker.attach_async(self.context)
+        await self.context.add_cookies(session.browser_cookies(self.host))
+        page = await self.context.new_page()
+        started = time.monotonic()
+        try:
+            await page.set_extra_http_headers(dict(self.headers, **session.headers()))
+            with instrumentation.stage(self.source, "navigation"):
+                response = await goto_async(page, self.url, limiter=self.rate_limiter,
+                                            timeout=self.timeout * 1000)
+            await archive_response_async(response, self.source)
+            if response is not None and (response.status in THROTTLE_STATUSES or is_challenge(await page.title())):
+                raise SessionBlocked(f"会话 {session.id} 被封: HTTP {response.status}")
+            with instrumentation.stage(self.source, "wait_for"):
+                await page.wait_for_selector(self.wait_selector, timeout=self.timeout * 1000)
+        except asyncio.CancelledError:
+            await page.close()
+            raise
+        except Exception as e:
+            await page.close()
+            self.sessions.report(session, ok=False, blocked=isinstance(e, SessionBlocked))
+            raise
+        self.sessions.report(session, ok=True, latency=time.monotonic() - started)
+        session.update_from_browser(await self.context.cookies())
+        return page
+
+    async def _fetch_html(self, session):
+        """
+        使用 crawl4ai 的 AsyncWebCrawler 渲染页面，返回渲染后的 HTML
+        会话的 User-Agent、Cookie 和代理通过 BrowserConfig 传给浏览器
+        """
+        browser_config = BrowserConfig(
+            headless=True,
+            user_agent=session.user_agent,
+            headers=dict(self.headers),
+            cookies=session.browser_cookies(self.host),
+            proxy=session.proxy
+        )
+        run_config = CrawlerRunConfig(
+            wait_for=f"css:{self.wait_selector}",
+            page_timeout=self.timeout * 1000,
+            cache_mode=CacheMode.BYPASS
+        )
+        async with AsyncWebCrawler(config=browser_config) as crawler:
+            self.blocker.install_on_crawler(crawler)
+            await self.rate_limiter.acquire_async(self.url)
+            started = time.monotonic()
+            try:
+                # crawl4ai 内部完成导航和等待，无法分开计时
+                with instrumentation.stage(self.source, "navigation"):
+                    result = await crawler.arun(url=self.url, config=run_config)
+                latency = time.monotonic() - started
+                html = result.html or ""
+                status = result.status_code or 200
+                title = TITLE_PATTERN.search(html[:20000])
+                challenge = bool(title) and is_challenge(title.group(1))
+                self.rate_limiter.record(self.url, status, latency, challenge=challenge,
+                                         retry_after=retry_after_seconds(result.response_headers))
+                self._archive_html(html, status)
+                if status in THROTTLE_STATUSES or challenge:
+                    raise SessionBlocked(f"会话 {session.id} 被封: HTTP {status}")
+                if not result.success:
+                    raise RuntimeError(result.error_message or f"HTTP {status}")
+            except Exception as e:
+                self.sessions.report(session, ok=False, blocked=isinstance(e, SessionBlocked))
+                raise
+        self.sessions.report(session, ok=True, latency=latency)
+        return html
+
+    def _archive_html(self, html, status):
+        archive = get_page_archive()
+        if archive is None or not html:
+            return
+        try:
+            archive.store(self.url, html, self.source, status=status)
+        except Exception as e:
+            logger.warning(f"保存页面 {self.url} 失败: {str(e)}")
+
+    def run(self):
+        """同步入口，保持与同步爬虫相同的用法"""
+        return asyncio.run(self.run_async())
+
+
+class AsyncMarketWatchCrawler(_AsyncCrawlMixin, MarketWatchCrawler):
+    """
+    MarketWatchCrawler 的异步版本，参数相同；
+    context 为异步 Playwright 的 BrowserContext（不传时使用 crawl4ai 的 AsyncWebCrawler）
+    """
+
+    source = "marketwatch"
+    schema = MARKETWATCH_SCHEMA
+    wait_selector = "table.calendar__table"
+
+    async def extract_economic_data_async(self):
+        """提取经济日历数据"""
+        logger.info(f"开始爬取 {self.url}")
+        try:
+            async with self._session_scope_async() as session:
+                results = await self._render(session)
+            logger.info(f"成功爬取数据，获取到 {len(results.get('reports', []))} 条报告")
+            instrumentation.count("marketwatch", "rows_extracted", len(results.get("reports", [])))
+            return results
+        except Exception as e:
+            logger.error(f"爬取过程中发生错误: {str(e)}")
+            return {"reports": [], "date_range": ""}
+
+    async def run_async(self):
+        """执行爬虫流程，返回爬取到的记录条数，保存失败时抛出异常以便执行器重试"""
+        logger.info("开始执行 MarketWatch 经济日历爬虫任务")
+        data = await self.extract_economic_data_async()
+        if not await asyncio.to_thread(self.save_data, data):
+            raise RuntimeError("MarketWatch 数据保存失败")
+        self.blocker.log_stats()
+        self.rate_limiter.log_stats()
+        self.sessions.log_stats()
+        logger.info("爬虫任务完成")
+        return len(self.records_to_save(data))
+
+
+class AsyncInvestingEarningsCrawler(_AsyncCrawlMixin, InvestingEarningsCrawler):
+    """
+    InvestingEarningsCrawler 的异步版本，参数相同（lease 不适用于异步模式）
+    筛选接口快速通道在线程中执行，失败时再渲染页面
+    """
+
+    source = "investing"
+    schema = INVESTING_SCHEMA
+    wait_selector = ".earningsCalendarDiv table"
+
+    async def extract_earnings_data_async(self):
+        """提取财报日历数据"""
+        logger.info(f"开始爬取 {self.url}")
+
+        if self.fetcher is not None:
+            # 线程中的请求无法被取消，超时后由连接池的超时结束
+            results = await asyncio.to_thread(self._crawl_fast_path)
+            if results is not None:
+                return results
+
+        try:
+            async with self._session_scope_async() as session:
+                results = await self._render(session)
+            logger.info(f"成功爬取数据，获取到 {len(results.get('earnings_dates', []))} 条财报记录")
+            instrumentation.count("investing", "rows_extracted", len(results.get("earnings_dates", [])))
+            return results
+        except Exception as e:
+            logger.error(f"爬取过程中发生错误: {str(e)}")
+            return {"earnings_dates": [], "current_period": ""}
+
+    async def run_async(self):
+        """执行爬虫流程，返回爬取到的记录条数，保存失败时抛出异常以便执行器重试"""
+        logger.info("开始执行 Investing.com 财报日历爬虫任务")
+        data = await self.extract_earnings_data_async()
+        if not await asyncio.to_thread(self.save_data, data):
+            raise RuntimeError("Investing.com 数据保存失败")
+        self.blocker.log_stats()
+        self.rate_limiter.log_stats()
+        self.sessions.log_stats()
+        logger.info("爬虫任务完成")
+        return len(self.records_to_save(data))
+
+
+CRAWLERS = {
+    "marketwatch": AsyncMarketWatchCrawler,
+    "investing": AsyncInvestingEarningsCrawler
+}
+
+
+async def run_source(source, crawler, timeout=None):
+    """执行一个数据源，超过 timeout 秒时取消，返回 {"status", "rows", "seconds", "error"}"""
+    started = time.monotonic()
+    rows, error, cause = 0, None, None
+    try:
+        rows = await asyncio.wait_for(crawler.run_async(), timeout)
+        if not rows:
+            error, cause = "未获取到数据", "NoData"
+    except asyncio.TimeoutError:
+        error, cause = f"超过 {timeout}s，已取消", "JobTimeout"
+    except Exception as e:
+        error, cause = str(e), type(e).__name__
+    seconds = time.monotonic() - started
+    status = "success" if cause is None else "timeout" if cause == "JobTimeout" else "failed"
+    instrumentation.emit({"type": "job", "job": source, "source": source, "status": status,
+                          "seconds": seconds, "attempt": 0, "cause": cause})
+    if status == "success":
+        logger.info(f"{source} 完成，{rows} 条记录，用时 {seconds:.1f}s")
+    else:
+        logger.error(f"{source} {status}: {error}（用时 {seconds:.1f}s）")
+    return {"status": status, "rows": rows, "seconds": round(seconds, 2), "error": error}
+
+
+async def run_sources(sources=None, timeouts=None, default_timeout=600, crawler_options=None):
+    """
+    在同一个事件循环中并发执行多个数据源，返回 {数据源: 结果}
+    timeouts 为 {数据源: 秒数}，单个数据源超时只取消该数据源；
+    run_sources 本身被取消时所有数据源一起取消
+    """
+    sources = list(sources or CRAWLERS)
+    unknown = [source for source in sources if source not in CRAWLERS]
+    if unknown:
+        raise ValueError(f"未知的数据源: {', '.join(unknown)}")
+    timeouts = timeouts or {}
+    crawlers = {source: CRAWLERS[source](**(crawler_options or {})) for source in sources}
+    results = await asyncio.gather(*[
+        run_source(source, crawlers[source], timeouts.get(source, default_timeout)) for source in sources
+    ])
+    return dict(zip(sources, results))
+
+
+def crawler_options_from_config(config):
+    """各数据源共用的存储和变更流"""
+    output_dir = config.get("output_directory", "./data")
+    storage_config = config.get("storage", {})
+    return {
+        "output_dir": output_dir,
+        "store": CrawlStore(storage_config.get("path", os.path.join(output_dir, "crawl_data.db"))),
+        "change_log": load_change_log(config),
+        "write_csv_snapshots": storage_config.get("write_csv_snapshots", False)
+    }
+
+
+def run_all(sources=None, config=None):
+    """run_sources 的同步入口，超时时间读取 config.json 的 async_engine 配置"""
+    if config is None:
+        with open("config.json", 'r') as f:
+            config = json.load(f)
+    engine_config = config.get("async_engine", {})
+    return asyncio.run(run_sources(
+        sources or engine_config.get("sources"),
+        timeouts=engine_config.get("timeouts"),
+        default_timeout=engine_config.get("default_timeout", 600),
+        crawler_options=crawler_options_from_config(config)
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在一个事件循环中并发执行多个爬虫")
+    parser.add_argument("--sources", nargs="+", choices=sorted(CRAWLERS), default=None,
+                        help="要执行的数据源，默认全部")
+    parser.add_argument("--timeout", action="append", default=[], metavar="SOURCE=SECONDS",
+                        help="单个数据源的超时时间，可重复指定")
+    args = parser.parse_args()
+
+    with open("config.json", 'r') as f:
+        config = json.load(f)
+    engine_config = config.setdefault("async_engine", {})
+    timeouts = engine_config.setdefault("timeouts", {})
+    for item in args.timeout:
+        source, _, seconds = item.partition("=")
+        timeouts[source] = float(seconds)
+
+    results = run_all(args.sources, config)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
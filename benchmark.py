@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+爬虫离线基准测试
+启动本地回放服务器（replay_server）回放录制的 MarketWatch、Investing.com、Google Finance
+页面和文章，端到端运行各爬虫，统计：
+    pages_per_sec       每秒完成的页面数（页面导航、筛选接口请求、文章加载）
+    stages              各阶段（navigation、wait_for、extraction、fetch、article、save）耗时的 p50 / p95
+    peak_rss_mb         本进程及浏览器子进程的内存峰值
+    bytes_transferred   回放服务器发送的字节数
+结果保存为 JSON，可以用 --compare 与之前的结果对比，发现性能退化
+
+录制目录结构（每个数据源一个 replay_server 录制目录）：
+    benchmarks/recordings/marketwatch/index.json
+    benchmarks/recordings/investing/index.json
+    benchmarks/recordings/google_finance/index.json
+仓库中自带一份最小的录制：Google Finance 首页取自 google_finance_data/1.html，文章页面、
+MarketWatch 和 Investing.com 的页面是按提取规则合成的，不需要联网即可运行；
+需要贴近真实页面的结果时用 record 重新录制。没有任何数据源运行时退出码为 1。
+浏览器中的请求按路径转发到回放服务器（忽略主机名），见 replay_server.route_to_replay
+
+用法：
+录制（访问真实网站）
+python benchmark.py record --recordings benchmarks/recordings
+运行基准测试
+python benchmark.py run --recordings benchmarks/recordings --iterations 5
+与基线对比，p95 或吞吐量变差超过 20% 时退出码为 1
+python benchmark.py run --compare benchmarks/results/baseline.json --threshold 0.2
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+
+import instrumentation
+from rate_limiter import RateLimiter, set_rate_limiter
+from session_pool import DEFAULT_USER_AGENTS, Session, SessionPool, set_session_pool
+from page_archive import PageArchive, set_page_archive
+from replay_server import Recorder, ReplayServer, route_to_replay
+
+try:
+    import psutil
+except ImportError:  # 没有 psutil 时使用 getrusage 的峰值（子进程只统计已退出的）
+    psutil = None
+
+logger = logging.getLogger("benchmark")
+
+BENCHMARK_SOURCES = ("marketwatch", "investing", "google_finance")
+
+# 计入 pages_per_sec 的阶段
+PAGE_STAGES = ("navigation", "fetch", "article")
+
+MARKETWATCH_URL = "https://www.marketwatch.com/economy-politics/calendar"
+INVESTING_URL = "https://www.investing.com/earnings-calendar/"
+GOOGLE_FINANCE_URL = "https://www.google.com/finance"
+
+
+def percentile(values, pct):
+    """最近秩法计算百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class StageCollector:
+    """订阅 instrumentation 事件，按数据源和阶段收集耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.durations = defaultdict(lambda: defaultdict(list))
+            self.failures = defaultdict(lambda: defaultdict(int))
+            self.counts = defaultdict(lambda: defaultdict(int))
+
+    def __call__(self, event):
+        with self._lock:
+            if event["type"] == "stage":
+                self.durations[event["source"]][event["stage"]].append(event["seconds"])
+                if not event["ok"]:
+                    self.failures[event["source"]][event["stage"]] += 1
+            elif event["type"] == "count":
+                self.counts[event["source"]][event["name"]] += event["value"]
+
+    def summary(self, source):
+        with self._lock:
+            stages = {}
+            for name, values in self.durations[source].items():
+                stages[name] = {
+                    "count": len(values),
+                    "failed": self.failures[source][name],
+                    "p50_ms": round(percentile(values, 50) * 1000, 2),
+                    "p95_ms": round(percentile(values, 95) * 1000, 2),
+                    "mean_ms": round(sum(values) / len(values) * 1000, 2)
+                }
+            pages = sum(len(self.durations[source][name]) for name in PAGE_STAGES)
+            return stages, pages, dict(self.counts[source])
+
+
+class RssSampler:
+    """后台线程定期采样本进程及子进程（浏览器）的 RSS，记录峰值"""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        if psutil is None:
+            usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            # Linux 上单位是 KB，macOS 上是字节
+            scale = 1 if sys.platform == "darwin" else 1024
+            return (usage + children) * scale
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_bytes = self._sample()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self._sample())
+
+
+class BenchmarkRunner:
+    def __init__(self, recordings_dir, iterations=5, warmup=1, headless=True):
+        self.recordings_dir = recordings_dir
+        self.iterations = iterations
+        self.warmup = warmup
+        self.headless = headless
+        self.collector = StageCollector()
+        self.work_dir = tempfile.mkdtemp(prefix="crawler_benchmark_")
+        self.pool = None
+        self.store = None
+
+    def _get_pool(self):
+        if self.pool is None:
+            from browser_pool import BrowserPool
+            self.pool = BrowserPool(browsers=1, max_contexts=1, headless=self.headless)
+        return self.pool
+
+    def _get_store(self):
+        # 写入临时数据库，不影响正式数据
+        if self.store is None:
+            from datastore import CrawlStore
+            self.store = CrawlStore(os.path.join(self.work_dir, "crawl_data.db"))
+        return self.store
+
+    @contextmanager
+    def _routed_lease(self, replay, **context_options):
+        with self._get_pool().lease(**context_options) as context:
+            route_to_replay(context, replay.url)
+            yield context
+
+    def _run_marketwatch(self, replay, iteration):
+        from marketwatch_crawler import MarketWatchCrawler
+        with self._routed_lease(replay) as context:
+            crawler = MarketWatchCrawler(output_dir=self.work_dir, context=context, store=self._get_store())
+            return crawler.run()
+
+    def _run_investing(self, replay, iteration):
+        from investing_crawler import InvestingEarningsCrawler
+        from investing_fastpath import InvestingAjaxFetcher
+        fetcher = InvestingAjaxFetcher(base_url=replay.url)
+        try:
+            crawler = InvestingEarningsCrawler(output_dir=self.work_dir, store=self._get_store(),
+                                               fetcher=fetcher, lease=lambda **options: self._routed_lease(replay, **options))
+            return crawler.run()
+        finally:
+            fetcher.close()
+
+    def _run_google_finance(self, replay, iteration):
+        from article_cache import ArticleCache
+        from google_finance import get_top_story
+        from near_duplicates import NearDuplicateIndex
+        # 每轮使用新的文章缓存和查重索引，保证每轮都会加载文章
+        cache = ArticleCache(path=os.path.join(self.work_dir, f"article_cache_{iteration}.db"))
+        dedupe = NearDuplicateIndex(path=os.path.join(self.work_dir, f"near_duplicates_{iteration}.db"))
+        with self._routed_lease(replay) as context:
+            return len(get_top_story(context=context, cache=cache, dedupe=dedupe))
+
+    def run_source(self, source):
+        recordings = os.path.join(self.recordings_dir, source)
+        if not os.path.exists(os.path.join(recordings, "index.json")):
+            logger.warning(f"{source}: 没有找到录制目录 {recordings}，跳过")
+            return None
+
+        run_once = getattr(self, f"_run_{source}")
+        replay = ReplayServer(recordings).start()
+        try:
+            for i in range(self.warmup):
+                try:
+                    run_once(replay, -1 - i)
+                except Exception as e:
+                    logger.error(f"{source}: 第 {i + 1} 轮预热失败: {str(e)}")
+
+            self.collector.reset()
+            replay.requests_served = 0
+            replay.bytes_served = 0
+            failed_runs = 0
+            records = 0
+            with RssSampler() as sampler:
+                started = time.perf_counter()
+                for i in range(self.iterations):
+                    try:
+                        result = run_once(replay, i)
+                        records += result or 0
+                        if not result:
+                            failed_runs += 1
+                    except Exception as e:
+                        failed_runs += 1
+                        logger.error(f"{source}: 第 {i + 1} 轮运行失败: {str(e)}")
+                wall = time.perf_counter() - started
+        finally:
+            replay.stop()
+
+        stages, pages, counts = self.collector.summary(source)
+        result = {
+            "iterations": self.iterations,
+            "failed_runs": failed_runs,
+            "records": records,
+            "wall_seconds": round(wall, 3),
+            "pages": pages,
+            "pages_per_sec": round(pages / wall, 3) if wall > 0 else None,
+            "requests": replay.requests_served,
+            "bytes_transferred": replay.bytes_served,
+            "peak_rss_mb": round(sampler.peak_bytes / (1024 * 1024), 1),
+            "stages": stages,
+            "counts": counts
+        }
+        logger.info(f"{source}: {result['pages_per_sec']} pages/s，"
+                    f"{result['bytes_transferred'] / 1024:.1f} KB，峰值内存 {result['peak_rss_mb']} MB")
+        return result
+
+    def run(self, sources=BENCHMARK_SOURCES):
+        # 回放服务器在本地，测量的是爬虫本身的吞吐量，不做限速
+        set_rate_limiter(RateLimiter(enabled=False))
+        # 使用不保存状态的会话，避免回放结果影响真实会话的健康度
+        set_session_pool(SessionPool([Session("benchmark", DEFAULT_USER_AGENTS[0])]))
+        # 回放的页面写入临时存档，不混入真实的页面存档
+        set_page_archive(PageArchive(os.path.join(self.work_dir, "page_archive")))
+        instrumentation.subscribe(self.collector)
+        try:
+            results = {}
+            for source in sources:
+                result = self.run_source(source)
+                if result is not None:
+                    results[source] = result
+            return results
+        finally:
+            instrumentation.unsubscribe(self.collector)
+            if self.pool is not None:
+                self.pool.close()
+            if self.store is not None:
+                self.store.close()
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    对比两次结果，返回退化项列表
+    pages_per_sec 下降或任一阶段 p95 上升超过 threshold（比例）视为退化
+    """
+    regressions = [f"{source}: 基线中有结果，本次没有运行" for source in baseline.get("sources", {})
+                   if source not in current["sources"]]
+    for source, result in current["sources"].items():
+        base = baseline.get("sources", {}).get(source)
+        if not base:
+            continue
+        if base.get("pages_per_sec") and result.get("pages_per_sec") is not None:
+            change = result["pages_per_sec"] / base["pages_per_sec"] - 1
+            if change < -threshold:
+                regressions.append(f"{source}: pages_per_sec {base['pages_per_sec']} -> "
+                                   f"{result['pages_per_sec']} ({change:+.0%})")
+        for stage, stats in result["stages"].items():
+            base_stats = base.get("stages", {}).get(stage)
+            if not base_stats or not base_stats.get("p95_ms"):
+                continue
+            change = stats["p95_ms"] / base_stats["p95_ms"] - 1
+            if change > threshold:
+                regressions.append(f"{source}/{stage}: p95 {base_stats['p95_ms']}ms -> "
+                                   f"{stats['p95_ms']}ms ({change:+.0%})")
+    return regressions
+
+
+def _http_get(url, headers):
+    request = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.read(), response.headers.get("Content-Type", "text/html; charset=utf-8")
+
+
+def _record_page(recorder, url, headers):
+    body, content_type = _http_get(url, headers)
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    match = dict(parse_qsl(parts.query, keep_blank_values=True))
+    recorder.add("GET", path, body, headers={"Content-Type": content_type}, match=match)
+    return body
+
+
+def record(recordings_dir, sources=BENCHMARK_SOURCES):
+    """访问真实网站，把基准测试需要的页面保存到录制目录"""
+    from extraction_schemas import GOOGLE_FINANCE_SCHEMA
+    from html_extraction import extract_from_html
+    from investing_fastpath import InvestingAjaxFetcher
+
+    headers = {
+        "User-Agent": DEFAULT_USER_AGENTS[0],
+        "Accept-Language": "en-US,en;q=0.9"
+    }
+
+    if "marketwatch" in sources:
+        _record_page(Recorder(os.path.join(recordings_dir, "marketwatch")), MARKETWATCH_URL, headers)
+        logger.info("已录制 MarketWatch 经济日历")
+
+    if "investing" in sources:
+        recorder = Recorder(os.path.join(recordings_dir, "investing"))
+        _record_page(recorder, INVESTING_URL, headers)
+        fetcher = InvestingAjaxFetcher(headers=headers, recorder=recorder)
+        try:
+            fetcher.fetch_current()
+        finally:
+            fetcher.close()
+        logger.info("已录制 Investing.com 财报日历和筛选接口")
+
+    if "google_finance" in sources:
+        recorder = Recorder(os.path.join(recordings_dir, "google_finance"))
+        html = _record_page(recorder, GOOGLE_FINANCE_URL, headers)
+        stories = extract_from_html(html, GOOGLE_FINANCE_SCHEMA)["stories"] or []
+        for story in stories:
+            if not story.get("link"):
+                continue
+            try:
+                _record_page(recorder, story["link"], headers)
+            except Exception as e:
+                logger.warning(f"录制文章失败 {story['link']}: {str(e)}")
+        logger.info(f"已录制 Google Finance 首页和 {len(stories)} 篇文章")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="爬虫离线基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="对回放服务器运行基准测试")
+    run_parser.add_argument("--recordings", default="benchmarks/recordings", help="录制目录")
+    run_parser.add_argument("--sources", nargs="+", choices=BENCHMARK_SOURCES, default=list(BENCHMARK_SOURCES))
+    run_parser.add_argument("--iterations", type=int, default=5, help="每个数据源运行的轮数")
+    run_parser.add_argument("--warmup", type=int, default=1, help="不计入结果的预热轮数")
+    run_parser.add_argument("--output", default="benchmarks/results", help="结果 JSON 保存目录")
+    run_parser.add_argument("--compare", default=None, help="作为基线的结果 JSON")
+    run_parser.add_argument("--threshold", type=float, default=0.2, help="判定退化的变化比例")
+
+    record_parser = subparsers.add_parser("record", help="从真实网站录制页面")
+    record_parser.add_argument("--recordings", default="benchmarks/recordings", help="录制目录")
+    record_parser.add_argument("--sources", nargs="+", choices=BENCHMARK_SOURCES, default=list(BENCHMARK_SOURCES))
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "record":
+        record(args.recordings, args.sources)
+        return 0
+
+    runner = BenchmarkRunner(args.recordings, iterations=args.iterations, warmup=args.warmup)
+    current = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "sources": runner.run(args.sources)
+    }
+
+    if not current["sources"]:
+        logger.error(f"没有运行任何数据源，请检查录制目录 {args.recordings}")
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    output_file = os.path.join(args.output, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_file, 'w') as f:
+        json.dump(current, f, indent=4, ensure_ascii=False)
+    logger.info(f"结果已保存到 {output_file}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            logger.warning(f"性能退化: {regression}")
+        if regressions:
+            return 1
+        logger.info("与基线相比没有发现性能退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
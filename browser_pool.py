@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+进程级共享浏览器池
+调度器持有一个 BrowserPool，任务通过 lease() 租用一个 BrowserContext，
+而不是每次都冷启动 Chromium。浏览器在任务之间保持运行，
+累计打开的页面数超过 max_pages_per_browser 或内存超过 max_memory_mb 时回收重启。
+
+Playwright 同步 API 的对象只能在创建它的线程中使用，因此每个线程各自持有
+Playwright 实例和预热的浏览器（调度器的工作线程长期存在，浏览器在任务之间复用），
+max_contexts 对所有线程生效
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from playwright.sync_api import sync_playwright
+
+try:
+    import psutil
+except ImportError:  # 没有 psutil 时不做内存检查
+    psutil = None
+
+logger = logging.getLogger("browser_pool")
+
+# 启动浏览器时比较启动前后的子进程来找出浏览器主进程；
+# Playwright 驱动和浏览器在各线程中串行启动，避免把其他线程同时启动的进程算进来
+_launch_lock = threading.Lock()
+
+
+def _child_processes():
+    if psutil is None:
+        return {}
+    try:
+        return {p.pid: p for p in psutil.Process().children(recursive=True)}
+    except psutil.Error:
+        return {}
+
+
+def _new_root_pids(before):
+    """启动后新出现的进程中，父进程不是新进程的那些（即新浏览器的主进程）"""
+    new = {pid: p for pid, p in _child_processes().items() if pid not in before}
+    roots = []
+    for pid, process in new.items():
+        try:
+            if process.ppid() not in new:
+                roots.append(pid)
+        except psutil.Error:
+            continue
+    return roots
+
+
+class _BrowserSlot:
+    """池中的一个浏览器及其使用计数"""
+
+    def __init__(self, browser, pids=None):
+        self.browser = browser
+        # 浏览器主进程，内存检查只统计这些进程及其子进程
+        self.pids = list(pids or [])
+        self.active_contexts = 0
+        self.pages_opened = 0
+        self.retiring = False
+
+
+class _ThreadState:
+    """某个线程持有的 Playwright 实例和浏览器"""
+
+    def __init__(self):
+        self.playwright = None
+        self.slots = []
+
+
+class BrowserPool:
+    def __init__(self, browsers=1, max_contexts=2, max_pages_per_browser=100,
+                 max_memory_mb=1500, headless=True, launch_options=None):
+        self.browsers = max(1, browsers)
+        self.max_contexts = max(1, max_contexts)
+        self.max_pages_per_browser = max_pages_per_browser
+        self.max_memory_mb = max_memory_mb
+        self.launch_options = dict(launch_options or {})
+        self.launch_options.setdefault("headless", headless)
+
+        self._local = threading.local()
+        self._states = []
+        self._lock = threading.Lock()
+        self._context_slots = threading.BoundedSemaphore(self.max_contexts)
+
+    @classmethod
+    def from_config(cls, config):
+        """根据 config.json 中的 browser_pool 配置创建"""
+        pool_config = dict(config.get("browser_pool", {}))
+        pool_config.pop("enabled", None)
+        return cls(**pool_config)
+
+    def _state(self):
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = _ThreadState()
+            self._local.state = state
+            with self._lock:
+                self._states.append(state)
+        return state
+
+    def start(self):
+        """在当前线程启动 Playwright 并预热浏览器，只在该线程第一次租用时调用"""
+        state = self._state()
+        if state.playwright is not None:
+            return
+        logger.info(f"[{threading.current_thread().name}] 启动浏览器池: {self.browsers} 个浏览器，"
+                    f"最多 {self.max_contexts} 个并发上下文")
+        with _launch_lock:
+            state.playwright = sync_playwright().start()
+        state.slots = [self._launch(state) for _ in range(self.browsers)]
+
+    def _launch(self, state):
+        with _launch_lock:
+            before = _child_processes()
+            browser = state.playwright.chromium.launch(**self.launch_options)
+            pids = _new_root_pids(before) if psutil is not None else []
+        return _BrowserSlot(browser, pids)
+
+    def _memory_mb(self, slot):
+        """slot 的浏览器进程树占用的内存 (MB)，无法获取时返回 None"""
+        if psutil is None or not slot.pids:
+            return None
+        total = 0
+        for pid in slot.pids:
+            try:
+                root = psutil.Process(pid)
+                processes = [root] + root.children(recursive=True)
+            except psutil.Error:
+                continue
+            for process in processes:
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    continue
+        return total / (1024 * 1024)
+
+    def _pick_slot(self, state):
+        candidates = [s for s in state.slots if not s.retiring]
+        if not candidates:
+            # 所有浏览器都在等待回收时补充一个新浏览器
+            slot = self._launch(state)
+            state.slots.append(slot)
+            return slot
+        return min(candidates, key=lambda s: (s.active_contexts, s.pages_opened))
+
+    def _on_page(self, slot):
+        def handler(page):
+            slot.pages_opened += 1
+        return handler
+
+    def _maybe_recycle(self, state, slot):
+        if not slot.retiring:
+            if slot.pages_opened >= self.max_pages_per_browser:
+                logger.info(f"浏览器已打开 {slot.pages_opened} 个页面，准备回收")
+                slot.retiring = True
+            else:
+                memory = self._memory_mb(slot)
+                if memory is not None and memory > self.max_memory_mb:
+                    logger.info(f"浏览器内存 {memory:.0f} MB 超过阈值 {self.max_memory_mb} MB，准备回收")
+                    slot.retiring = True
+
+        if slot.retiring and slot.active_contexts == 0:
+            try:
+                slot.browser.close()
+            except Exception as e:
+                logger.warning(f"关闭浏览器时出错: {str(e)}")
+            index = state.slots.index(slot)
+            if len(state.slots) > self.browsers:
+                del state.slots[index]
+                logger.info("浏览器已回收")
+            else:
+                state.slots[index] = self._launch(state)
+                logger.info("浏览器已回收并重新启动")
+
+    @contextmanager
+    def lease(self, **context_options):
+        """
+        租用一个 BrowserContext，使用结束后自动关闭
+        同时打开的上下文数量不超过 max_contexts
+        """
+        self.start()
+        state = self._state()
+        self._context_slots.acquire()
+        try:
+            slot = self._pick_slot(state)
+            slot.active_contexts += 1
+            context = slot.browser.new_context(**context_options)
+            context.on("page", self._on_page(slot))
+            try:
+                yield context
+            finally:
+                try:
+                    context.close()
+                except Exception as e:
+                    logger.warning(f"关闭浏览器上下文时出错: {str(e)}")
+                slot.active_contexts -= 1
+                self._maybe_recycle(state, slot)
+        finally:
+            self._context_slots.release()
+
+    def close_thread(self):
+        """关闭当前线程持有的浏览器，用于不再复用的短期线程"""
+        state = getattr(self._local, "state", None)
+        if state is None:
+            return
+        with self._lock:
+            if state in self._states:
+                self._states.remove(state)
+        self._close_state(state)
+        self._local.state = None
+
+    def _close_state(self, state):
+        for slot in state.slots:
+            try:
+                slot.browser.close()
+            except Exception:
+                pass
+        state.slots = []
+        if state.playwright is not None:
+            try:
+                state.playwright.stop()
+            except Exception:
+                pass
+            state.playwright = None
+
+    def close(self):
+        """
+        关闭所有线程的浏览器
+        其他线程创建的对象可能无法在当前线程关闭，出错时忽略，随进程退出一起结束
+        """
+        with self._lock:
+            states, self._states = self._states, []
+        for state in states:
+            self._close_state(state)
+        self._local = threading.local()
+        logger.info("浏览器池已关闭")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+日历数据的变更流
+爬虫保存数据时，CrawlStore.upsert 把与数据库中已有数据相比的逐行变化和数据在同一个事务中
+写入 change_outbox 表，drain 再把 outbox 中的变化追加写入 JSONL 文件（只追加，不修改），每行一个事件：
+    {"seq": 12, "time": "...", "source": "marketwatch", "table": "economic_data", "outbox_id": 7,
+     "op": "update", "key": {...}, "row": {...}, "changed": {"actual": {"old": "", "new": "3.2%"}}}
+op 为 insert / update / delete。
+写变更流失败时事件留在 outbox 中，下一次 drain 时重新写入；写入成功但删除 outbox 之前进程退出时
+同一事件会被再写一次（至少一次），消费者可以按 outbox_id 去重。
+
+事件在文件中的字节位置就是偏移量，消费者记下读到的偏移量，下次从该位置继续读取，
+不需要重新读取和比较整份快照。ConsumerOffsets 按消费者名称保存偏移量。
+
+用法：
+python change_capture.py --consumer alerts --follow
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只保证单进程内的写入顺序
+    fcntl = None
+
+logger = logging.getLogger("change_capture")
+
+
+class ChangeLog:
+    def __init__(self, path="./data/changes.jsonl"):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+
+    def _last_seq(self, f):
+        """读取文件最后一个事件的序号，文件为空时返回 0"""
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end == 0:
+            return 0
+        # 从末尾向前找最后一个完整的行
+        block = min(end, 65536)
+        f.seek(end - block)
+        lines = f.read(block).rstrip(b"\n").split(b"\n")
+        try:
+            return json.loads(lines[-1])["seq"]
+        except (ValueError, KeyError):
+            logger.warning(f"变更流 {self.path} 最后一行无法解析，序号从行数重新计算")
+            f.seek(0)
+            return sum(1 for _ in f)
+
+    def append(self, source, table, changes):
+        """
+        追加一批变化，返回写入的事件数
+        同一批事件一次写入，多个进程同时写入时用文件锁保证序号连续
+        """
+        if not changes:
+            return 0
+        now = datetime.now().isoformat()
+        with self._lock, open(self.path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                seq = self._last_seq(f)
+                lines = []
+                for change in changes:
+                    seq += 1
+                    event = {"seq": seq, "time": now, "source": source, "table": table}
+                    event.update(change)
+                    lines.append(json.dumps(event, ensure_ascii=False))
+                f.seek(0, os.SEEK_END)
+                f.write(("\n".join(lines) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        logger.info(f"{source}/{table} 写入 {len(changes)} 条变更事件")
+        return len(changes)
+
+    def drain(self, store, batch_size=1000):
+        """
+        把 store 的 change_outbox 中的变化依次写入变更流并从 outbox 删除，返回写入的事件数
+        写入失败时只记录警告，未写入的事件留在 outbox 中，下次 drain 时重试
+        """
+        written = 0
+        with self._drain_lock:
+            try:
+                while True:
+                    pending = store.pending_changes(batch_size)
+                    if not pending:
+                        break
+                    # 连续的同一数据源、同一张表的变化一起写入
+                    start = 0
+                    for end in range(1, len(pending) + 1):
+                        if end == len(pending) or (pending[end]["source"], pending[end]["table"]) != \
+                                (pending[start]["source"], pending[start]["table"]):
+                            group = pending[start:end]
+                            written += self.append(group[0]["source"], group[0]["table"],
+                                                   [dict(item["change"], outbox_id=item["id"]) for item in group])
+                            store.ack_changes(group[-1]["id"])
+                            start = end
+            except Exception as e:
+                logger.warning(f"写入变更流失败，未写入的事件保留在数据库中，下次保存时重试: {str(e)}")
+        return written
+
+    def read(self, offset=0, limit=None):
+        """
+        从偏移量 offset 开始读取事件，返回 [(下一个偏移量, 事件), ...]
+        末尾没有换行符的行（正在写入）不会被读取
+        """
+        events = []
+        if not os.path.exists(self.path):
+            return events
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while limit is None or len(events) < limit:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                events.append((offset, json.loads(line)))
+        return events
+
+    def follow(self, offset=0, poll_interval=0.2, stop=None):
+        """持续读取新事件的生成器，产生 (下一个偏移量, 事件)；stop 为 threading.Event 时可以停止"""
+        while stop is None or not stop.is_set():
+            events = self.read(offset)
+            for offset, event in events:
+                yield offset, event
+            if not events:
+                time.sleep(poll_interval)
+
+
+class ConsumerOffsets:
+    """按消费者名称保存读取到的偏移量"""
+
+    def __init__(self, path="./data/change_offsets.json"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get(self, consumer):
+        with self._lock:
+            return self._load().get(consumer, 0)
+
+    def commit(self, consumer, offset):
+        with self._lock:
+            offsets = self._load()
+            offsets[consumer] = offset
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(offsets, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def load_change_log(config):
+    """根据 config.json 的 change_capture 配置创建变更流"""
+    capture_config = config.get("change_capture", {})
+    default_path = os.path.join(config.get("output_directory", "./data"), "changes.jsonl")
+    return ChangeLog(capture_config.get("path", default_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="读取日历数据的变更流")
+    parser.add_argument("--path", default="./data/changes.jsonl", help="变更流文件")
+    parser.add_argument("--consumer", default=None, help="消费者名称，指定时从上次的偏移量继续并保存偏移量")
+    parser.add_argument("--offset", type=int, default=None, help="从指定偏移量开始读取")
+    parser.add_argument("--follow", action="store_true", help="持续等待新事件")
+    args = parser.parse_args()
+
+    change_log = ChangeLog(args.path)
+    offsets = ConsumerOffsets(os.path.join(os.path.dirname(args.path) or ".", "change_offsets.json"))
+    offset = args.offset
+    if offset is None:
+        offset = offsets.get(args.consumer) if args.consumer else 0
+
+    events = change_log.follow(offset) if args.follow else iter(change_log.read(offset))
+    try:
+        for offset, event in events:
+            print(json.dumps(event, ensure_ascii=False))
+            if args.consumer:
+                offsets.commit(args.consumer, offset)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
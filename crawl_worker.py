@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+爬取任务工作进程
+从工作队列（work_queue）租用调度器放入的任务并执行，可以在多台机器 / 多个进程上同时运行。
+执行期间按 heartbeat_interval 续约；执行超过 job_timeout 后停止续约，租约过期后
+任务会被其他工作进程重新执行。失败的任务按 retry_interval * 2^n 退避后重新排队。
+
+用法：
+python crawl_worker.py --concurrency 2 --worker-id host-1
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+
+import economic_data_scheduler
+import instrumentation
+from economic_data_scheduler import crawl_investing, crawl_marketwatch, load_config, source_jobs
+from work_queue import create_queue
+
+logger = logging.getLogger("crawl_worker")
+
+# 任务类型与执行函数，任务类型与调度器提交的数据源名称一致
+HANDLERS = {
+    "marketwatch": crawl_marketwatch,
+    "investing": crawl_investing
+}
+
+
+class CrawlWorker:
+    def __init__(self, queue, handlers=None, worker_id=None, concurrency=1, lease_seconds=300,
+                 heartbeat_interval=30, job_timeout=600, retry_interval=5, max_retry_interval=300,
+                 poll_interval=2):
+        self.queue = queue
+        self.handlers = dict(handlers or HANDLERS)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.job_timeout = job_timeout
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config, queue, **overrides):
+        queue_config = config.get("work_queue", {})
+        options = {
+            "lease_seconds": queue_config.get("lease_seconds", 300),
+            "heartbeat_interval": queue_config.get("heartbeat_interval", 30),
+            "job_timeout": config.get("executor", {}).get("job_timeout", 600),
+            "retry_interval": config.get("retry_interval", 5),
+            "max_retry_interval": config.get("executor", {}).get("max_retry_interval", 300)
+        }
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(queue, **options)
+
+    def _heartbeat(self, task, done):
+        """定期续约；执行超过 job_timeout 或租约已被接手时停止"""
+        started = time.monotonic()
+        while not done.wait(self.heartbeat_interval):
+            if time.monotonic() - started > self.job_timeout:
+                logger.error(f"任务 {task.id} ({task.task_type}) 执行超过 {self.job_timeout}s，停止续约")
+                return
+            if not self.queue.heartbeat(task, self.lease_seconds):
+                logger.warning(f"任务 {task.id} 的租约已失效")
+                return
+
+    def _emit(self, task, status, seconds, cause=None):
+        instrumentation.emit({
+            "type": "job",
+            "job": task.task_type,
+            "source": task.task_type,
+            "status": status,
+            "seconds": seconds,
+            "attempt": task.attempts - 1,
+            "cause": cause
+        })
+
+    def run_task(self, task):
+        handler = self.handlers.get(task.task_type)
+        if handler is None:
+            self.queue.fail(task, f"未知的任务类型: {task.task_type}")
+            return
+
+        logger.info(f"[{self.worker_id}] 开始执行任务 {task.id} ({task.task_type})，第 {task.attempts} 次")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(task, done),
+                                     name=f"heartbeat-{task.id}", daemon=True)
+        heartbeat.start()
+        started = time.monotonic()
+        try:
+            handler(**task.payload)
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            delay = min(self.retry_interval * (2 ** (task.attempts - 1)), self.max_retry_interval)
+            logger.error(f"任务 {task.id} ({task.task_type}) 执行失败: {str(e)}，{delay}s 后重试")
+            self._emit(task, "failed", elapsed, cause=type(e).__name__)
+            if self.queue.fail(task, f"{type(e).__name__}: {str(e)}", retry_delay=delay):
+                instrumentation.emit({"type": "retry", "job": task.task_type, "source": task.task_type,
+                                      "attempt": task.attempts, "delay": delay})
+            return
+        finally:
+            done.set()
+            heartbeat.join()
+
+        elapsed = time.monotonic() - started
+        if self.queue.complete(task):
+            logger.info(f"任务 {task.id} ({task.task_type}) 执行成功，用时 {elapsed:.1f}s")
+            self._emit(task, "success", elapsed)
+        else:
+            # 租约已过期，任务可能已被其他工作进程重新执行
+            logger.warning(f"任务 {task.id} 执行完成时租约已失效，结果可能重复")
+            self._emit(task, "timeout", elapsed, cause="LeaseExpired")
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                task = self.queue.lease(self.worker_id, list(self.handlers), self.lease_seconds)
+            except Exception as e:
+                logger.error(f"租用任务失败: {str(e)}")
+                task = None
+            if task is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self.run_task(task)
+
+    def run(self):
+        """启动 concurrency 个执行线程，阻塞直到 stop() 或 Ctrl+C"""
+        logger.info(f"工作进程 {self.worker_id} 已启动，并发数 {self.concurrency}")
+        threads = [threading.Thread(target=self._loop, name=f"crawl-worker-{i}", daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            logger.info("收到中断信号，等待正在执行的任务结束")
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从工作队列租用并执行爬取任务")
+    parser.add_argument("--worker-id", default=None, help="工作进程标识，默认为 主机名-进程号")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时执行的任务数")
+    parser.add_argument("--metrics-port", type=int, default=None, help="在该端口输出监控指标")
+    args = parser.parse_args()
+
+    config = load_config()
+    queue = create_queue(config)
+    if queue is None:
+        raise SystemExit("config.json 中没有启用 work_queue")
+
+    metrics_server = None
+    if args.metrics_port is not None:
+        from metrics import start_metrics
+        metrics_server = start_metrics({"metrics": {"enabled": True, "port": args.metrics_port}})
+
+    # 启用 pipeline 时也执行流水线中声明的数据源
+    worker = CrawlWorker.from_config(config, queue, handlers=source_jobs(config), worker_id=args.worker_id,
+                                     concurrency=args.concurrency)
+    try:
+        worker.run()
+    finally:
+        queue.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if economic_data_scheduler.browser_pool is not None:
+            economic_data_scheduler.browser_pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+爬虫数据的增量存储
+按自然键 upsert 到 SQLite，只写入新增或内容变化的行：
+    economic_data: (date, time, event)   —— MarketWatch 经济日历
+    earnings_data: (date, symbol)        —— Investing.com 财报日历
+每行记录 first_seen / last_updated，每次爬取在 crawl_runs 中记一条元数据，
+"最新数据" 由查询得到，不再额外写一份 latest_*.csv
+upsert 同时返回逐行的变化（新增、更新的字段、删除）；传入 change_source 时这些变化在同一个事务中
+写入 change_outbox 表，再由 change_capture.ChangeLog.drain 转写到变更流，写变更流失败不会丢失事件
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger("datastore")
+
+TABLES = {
+    "economic_data": {
+        "source": "marketwatch",
+        "key": ["date", "time", "event"],
+        "fields": ["date", "time", "event", "actual", "forecast", "previous"]
+    },
+    "earnings_data": {
+        "source": "investing",
+        "key": ["date", "symbol"],
+        "fields": ["date", "country", "company_name", "symbol", "eps_forecast",
+                   "eps_actual", "revenue_forecast", "revenue_actual", "market_cap"]
+    }
+}
+
+
+def _clean(value):
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+class CrawlStore:
+    def __init__(self, path="./data/crawl_data.db"):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._conn:
+            for table, spec in TABLES.items():
+                self._create_table(table, spec)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    crawl_time TEXT NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    inserted INTEGER NOT NULL,
+                    updated INTEGER NOT NULL,
+                    dates TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS change_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    change TEXT NOT NULL
+                )
+            """)
+
+    def _create_table(self, table, spec):
+        columns = ", ".join(f"{field} TEXT NOT NULL DEFAULT ''" for field in spec["fields"])
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {columns},
+                first_seen TEXT NOT NULL,
+                last_updated TEXT NOT NULL,
+                PRIMARY KEY ({", ".join(spec["key"])})
+            )
+        """)
+
+    def register_table(self, table, key, fields, source=None):
+        """
+        注册新的数据表（例如流水线中在配置里声明的数据源），已注册的表不变
+        key 的第一个字段必须是 date，upsert 按日期读取已有行，remove_missing 和 latest 也按日期判断范围
+        """
+        if table in TABLES:
+            return TABLES[table]
+        if not re.fullmatch(r"[A-Za-z_]\w*", table) or not all(re.fullmatch(r"[A-Za-z_]\w*", f) for f in fields):
+            raise ValueError(f"表名或字段名不合法: {table}")
+        if not key or key[0] != "date":
+            raise ValueError(f"{table} 的自然键必须以 date 开头")
+        missing = [k for k in key if k not in fields]
+        if missing:
+            raise ValueError(f"{table} 的自然键字段不在 fields 中: {', '.join(missing)}")
+        spec = {"source": source or table, "key": list(key), "fields": list(fields)}
+        with self._lock, self._conn:
+            self._create_table(table, spec)
+        TABLES[table] = spec
+        return spec
+
+    def upsert(self, table, rows, remove_missing=False, change_source=None):
+        """
+        按自然键写入数据，返回新增/更新/未变化/删除的行数和逐行的变化（changes）
+        已存在且内容相同的行不会产生写入
+        remove_missing 为 True 时，本批数据覆盖的日期中已有但本次没有出现的行视为已从日历移除并删除，
+        只应在爬取结果完整覆盖这些日期时使用
+        change_source 不为 None 时，变化与数据在同一个事务中写入 change_outbox，等待转写到变更流
+        """
+        spec = TABLES[table]
+        key_fields, fields = spec["key"], spec["fields"]
+        value_fields = [f for f in fields if f not in key_fields]
+        now = datetime.now().isoformat()
+
+        # 同一批数据中重复的键以最后一条为准
+        incoming = {}
+        for row in rows:
+            record = {field: _clean(row.get(field)) for field in fields}
+            incoming[tuple(record[k] for k in key_fields)] = record
+
+        inserts, updates, removed, changes = [], [], [], []
+        with self._lock, self._conn:
+            existing = self._existing(table, key_fields, fields, incoming.keys())
+            for key, record in incoming.items():
+                old = existing.get(key)
+                values = [record[field] for field in fields]
+                if old is None:
+                    inserts.append(values + [now, now])
+                    changes.append({"op": "insert", "key": dict(zip(key_fields, key)), "row": record})
+                elif old != record:
+                    updates.append([record[f] for f in value_fields] + [now] + list(key))
+                    changes.append({
+                        "op": "update",
+                        "key": dict(zip(key_fields, key)),
+                        "row": record,
+                        "changed": {f: {"old": old[f], "new": record[f]} for f in value_fields if old[f] != record[f]}
+                    })
+            if remove_missing:
+                removed = [key for key in existing if key not in incoming]
+                changes.extend({"op": "delete", "key": dict(zip(key_fields, key)), "row": existing[key]}
+                               for key in removed)
+
+            if inserts:
+                placeholders = ", ".join("?" for _ in range(len(fields) + 2))
+                self._conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(fields)}, first_seen, last_updated) "
+                    f"VALUES ({placeholders})", inserts)
+            if updates:
+                assignments = ", ".join(f"{f} = ?" for f in value_fields)
+                conditions = " AND ".join(f"{k} = ?" for k in key_fields)
+                self._conn.executemany(
+                    f"UPDATE {table} SET {assignments}, last_updated = ? WHERE {conditions}", updates)
+            if removed:
+                conditions = " AND ".join(f"{k} = ?" for k in key_fields)
+                self._conn.executemany(f"DELETE FROM {table} WHERE {conditions}", removed)
+            if change_source is not None and changes:
+                self._conn.executemany(
+                    "INSERT INTO change_outbox (source, table_name, change) VALUES (?, ?, ?)",
+                    [(change_source, table, json.dumps(change, ensure_ascii=False)) for change in changes])
+
+        return {
+            "inserted": len(inserts),
+            "updated": len(updates),
+            "unchanged": len(incoming) - len(inserts) - len(updates),
+            "removed": len(removed),
+            "dates": sorted({key[0] for key in incoming}),
+            "changes": changes
+        }
+
+    def _existing(self, table, key_fields, fields, keys):
+        """按日期批量读取可能冲突的已有行"""
+        dates = sorted({key[0] for key in keys})
+        existing = {}
+        for i in range(0, len(dates), 500):
+            batch = dates[i:i + 500]
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(fields)} FROM {table} "
+                f"WHERE date IN ({', '.join('?' for _ in batch)})", batch)
+            for row in cursor:
+                record = {field: row[field] for field in fields}
+                existing[tuple(record[k] for k in key_fields)] = record
+        return existing
+
+    def pending_changes(self, limit=1000):
+        """change_outbox 中尚未转写到变更流的变化，按写入顺序返回"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, source, table_name, change FROM change_outbox ORDER BY id LIMIT ?", (limit,))
+            return [{"id": row["id"], "source": row["source"], "table": row["table_name"],
+                     "change": json.loads(row["change"])} for row in cursor]
+
+    def ack_changes(self, up_to_id):
+        """删除已转写到变更流的变化（id 不大于 up_to_id）"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM change_outbox WHERE id <= ?", (up_to_id,))
+
+    def record_run(self, source, table, result, metadata=None):
+        """记录一次爬取的元数据，替代原来的 metadata_*.json"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO crawl_runs (source, table_name, crawl_time, row_count, inserted, "
+                "updated, dates, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, table, datetime.now().isoformat(),
+                 result["inserted"] + result["updated"] + result["unchanged"],
+                 result["inserted"], result["updated"],
+                 json.dumps(result["dates"]), json.dumps(metadata or {}, ensure_ascii=False)))
+
+    def latest(self, table):
+        """
+        最近一次日常爬取覆盖的日期范围内的当前数据，相当于原来的 latest_*.csv
+        历史回填等其他来源的写入不影响 "最新" 的范围
+        """
+        fields = TABLES[table]["fields"]
+        with self._lock:
+            run = self._conn.execute(
+                "SELECT dates FROM crawl_runs WHERE table_name = ? AND source = ? "
+                "ORDER BY id DESC LIMIT 1",
+                (table, TABLES[table]["source"])).fetchone()
+            if run is None:
+                return []
+            dates = json.loads(run["dates"])
+            if not dates:
+                return []
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(fields)}, first_seen, last_updated FROM {table} "
+                f"WHERE date IN ({', '.join('?' for _ in dates)}) ORDER BY rowid", dates)
+            return [dict(row) for row in cursor]
+
+    def history(self, table, since=None):
+        """所有记录（可按 last_updated 过滤）"""
+        fields = TABLES[table]["fields"]
+        sql = f"SELECT {', '.join(fields)}, first_seen, last_updated FROM {table}"
+        params = []
+        if since:
+            sql += " WHERE last_updated >= ?"
+            params.append(since)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql + " ORDER BY rowid", params)]
+
+    def export_csv(self, table, csv_file, rows=None):
+        """把查询结果导出为 CSV，默认导出最新数据"""
+        if rows is None:
+            rows = self.latest(table)
+        with open(csv_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=TABLES[table]["fields"], extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        return csv_file
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -12,8 +12,19 @@ import json
 import os
 import schedule
 from datetime import datetime
+from functools import partial
 from marketwatch_crawler import MarketWatchCrawler
 from investing_crawler import InvestingEarningsCrawler
+from browser_pool import BrowserPool
+from datastore import CrawlStore
+from job_executor import JobExecutor
+from investing_fastpath import InvestingAjaxFetcher
+from metrics import start_metrics
+from session_pool import get_session_pool
+from change_capture import load_change_log
+from release_poller import ReleasePoller
+from work_queue import create_queue
+from pipeline_engine import PipelineEngine
 
 # 设置日志
 logging.basicConfig(
@@ -44,56 +55,209 @@ def load_config():
             }
         }
 
+# 进程级共享浏览器池，第一次任务时启动，之后的任务复用已预热的浏览器
+browser_pool = None
+
+def get_browser_pool(config):
+    """返回共享浏览器池，配置中关闭时返回 None"""
+    global browser_pool
+    if not config.get("browser_pool", {}).get("enabled", True):
+        return None
+    if browser_pool is None:
+        browser_pool = BrowserPool.from_config(config)
+    return browser_pool
+
+# 所有任务共用的增量数据存储
+crawl_store = None
+
+def get_crawl_store(config):
+    global crawl_store
+    if crawl_store is None:
+        storage_config = config.get("storage", {})
+        default_path = os.path.join(config.get("output_directory", "./data"), "crawl_data.db")
+        crawl_store = CrawlStore(storage_config.get("path", default_path))
+    return crawl_store
+
+# 所有任务共用的变更流
+change_log = None
+
+def get_change_log(config):
+    global change_log
+    if change_log is None:
+        change_log = load_change_log(config)
+    return change_log
+
+def crawler_options(config):
+    return {
+        "output_dir": config.get("output_directory", "./data"),
+        "store": get_crawl_store(config),
+        "change_log": get_change_log(config),
+        "write_csv_snapshots": config.get("storage", {}).get("write_csv_snapshots", False)
+    }
+
+def run_crawler(crawler_class, config):
+    """
+    按健康度租用一个会话，用会话的 User-Agent 和代理从浏览器池租用 context 运行爬虫，
+    未启用浏览器池时由爬虫自行启动浏览器
+    """
+    options = crawler_options(config)
+    pool = get_browser_pool(config)
+    if pool is None:
+        return crawler_class(**options).run()
+    sessions = get_session_pool()
+    with sessions.lease() as session, pool.lease(**session.context_options()) as context:
+        return crawler_class(context=context, sessions=sessions, session=session, **options).run()
+
+# Investing.com 筛选接口的快速通道，所有任务共用同一个 keep-alive 连接池
+investing_fetcher = None
+
+def get_investing_fetcher(config):
+    global investing_fetcher
+    investing_config = config.get("investing", {})
+    fast_path_config = dict(investing_config.get("fast_path", {}))
+    if not fast_path_config.pop("enabled", True):
+        return None
+    if investing_fetcher is None:
+        crawler_headers = investing_config.get("headers", {})
+        investing_fetcher = InvestingAjaxFetcher(headers=crawler_headers, **fast_path_config)
+    return investing_fetcher
+
 def crawl_marketwatch():
-    """执行 MarketWatch 爬虫任务"""
+    """执行 MarketWatch 爬虫任务，未获取到数据时抛出异常以便执行器重试"""
     logger.info(f"开始 MarketWatch 计划任务: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    try:
-        config = load_config()
-        crawler = MarketWatchCrawler(output_dir=config.get("output_directory", "./data"))
-        crawler.run()
-        logger.info("MarketWatch 任务完成")
-    except Exception as e:
-        logger.error(f"MarketWatch 任务执行失败: {str(e)}")
+    config = load_config()
+    if not run_crawler(MarketWatchCrawler, config):
+        raise RuntimeError("MarketWatch 未获取到数据")
+    logger.info("MarketWatch 任务完成")
 
 def crawl_investing():
-    """执行 Investing.com 爬虫任务"""
+    """
+    执行 Investing.com 爬虫任务，未获取到数据时抛出异常以便执行器重试
+    优先走筛选接口快速通道，只有回退到页面渲染时才从浏览器池租用 context
+    """
     logger.info(f"开始 Investing.com 计划任务: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    try:
-        config = load_config()
-        crawler = InvestingEarningsCrawler(output_dir=config.get("output_directory", "./data"))
-        crawler.run()
-        logger.info("Investing.com 任务完成")
-    except Exception as e:
-        logger.error(f"Investing.com 任务执行失败: {str(e)}")
+    config = load_config()
+    pool = get_browser_pool(config)
+    fetcher = get_investing_fetcher(config)
+    crawler = InvestingEarningsCrawler(fetcher=fetcher, use_fast_path=fetcher is not None,
+                                       lease=pool.lease if pool is not None else None,
+                                       **crawler_options(config))
+    if not crawler.run():
+        raise RuntimeError("Investing.com 未获取到数据")
+    logger.info("Investing.com 任务完成")
+
+def crawl_pipeline_source(name):
+    """
+    通过声明式流水线执行 pipeline.sources 中的一个数据源
+    未获取到数据，或任一阶段（包括写入数据库等输出）出错时抛出异常以便执行器重试
+    """
+    logger.info(f"开始 {name} 流水线任务: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    config = load_config()
+    engine = PipelineEngine.from_config(config, store=get_crawl_store(config), change_log=get_change_log(config),
+                                        browser_pool=get_browser_pool(config),
+                                        investing_fetcher=get_investing_fetcher(config))
+    stats = engine.run([name])[name]
+    if stats["errors"]:
+        raise RuntimeError(f"{name} 流水线出现 {stats['errors']} 个错误")
+    if not stats["records"]:
+        raise RuntimeError(f"{name} 未获取到数据")
+    logger.info(f"{name} 流水线任务完成")
+
+def source_jobs(config):
+    """
+    数据源名称与任务函数，任务类型与提交的数据源名称一致
+    启用 pipeline 时 pipeline.sources 中声明的数据源改由流水线执行
+    """
+    jobs = {"marketwatch": crawl_marketwatch, "investing": crawl_investing}
+    pipeline_config = config.get("pipeline", {})
+    if pipeline_config.get("enabled", False):
+        jobs.update({name: partial(crawl_pipeline_source, name) for name in pipeline_config.get("sources", {})})
+    return jobs
+
+# 并发执行器，按数据源限制并发，负责超时和重试
+job_executor = None
+
+# 启用 work_queue 时任务放入队列，由 crawl_worker 进程执行
+work_queue = None
+
+def submit_job(source, func):
+    """
+    把任务交给执行器，同一数据源的上一次执行未结束时跳过
+    启用工作队列时改为入队，同一数据源已有未完成的任务时跳过
+    """
+    if work_queue is not None:
+        task_id = work_queue.enqueue(source, dedupe_key=source)
+        if task_id is not None:
+            logger.info(f"任务 {source} 已放入工作队列 (id={task_id})")
+        return
+    job_executor.submit(source, source, func)
 
 def setup_schedule():
     """设置定期执行计划"""
+    global job_executor, work_queue
     config = load_config()
     schedule_config = config.get("schedule", {})
+    job_executor = JobExecutor.from_config(config)
+    work_queue = create_queue(config)
+    if work_queue is not None:
+        logger.info("已启用工作队列，爬取任务由 crawl_worker 执行")
+    # 在 /metrics 输出任务耗时、失败原因、记录数等监控指标
+    metrics_server = start_metrics(config)
+    source_job_map = source_jobs(config)
     
-    # 设置 MarketWatch 调度
-    schedule.every().day.at(schedule_config.get("marketwatch_morning", "09:00")).do(crawl_marketwatch)
-    schedule.every().day.at(schedule_config.get("marketwatch_evening", "18:00")).do(crawl_marketwatch)
+    # 设置 MarketWatch 调度：release_aware 模式按日历中的发布时间自适应爬取，否则每天固定两次
+    release_poller = None
+    if schedule_config.get("mode", "fixed") == "release_aware":
+        store = get_crawl_store(config)
+        release_poller = ReleasePoller.from_config(
+            config, lambda job=source_job_map["marketwatch"]: submit_job("marketwatch", job),
+            lambda: store.latest("economic_data"))
+        logger.info("MarketWatch 按发布时间自适应爬取")
+    else:
+        schedule.every().day.at(schedule_config.get("marketwatch_morning", "09:00")).do(submit_job, "marketwatch", source_job_map["marketwatch"])
+        schedule.every().day.at(schedule_config.get("marketwatch_evening", "18:00")).do(submit_job, "marketwatch", source_job_map["marketwatch"])
     
     # 设置 Investing.com 调度
-    schedule.every().day.at(schedule_config.get("investing_morning", "09:30")).do(crawl_investing)
-    schedule.every().day.at(schedule_config.get("investing_evening", "18:30")).do(crawl_investing)
+    schedule.every().day.at(schedule_config.get("investing_morning", "09:30")).do(submit_job, "investing", source_job_map["investing"])
+    schedule.every().day.at(schedule_config.get("investing_evening", "18:30")).do(submit_job, "investing", source_job_map["investing"])
+    
+    # 只在流水线中声明的数据源按各自的 schedule 时间执行
+    for name, job in source_job_map.items():
+        if name not in ("marketwatch", "investing"):
+            for at in config["pipeline"]["sources"][name].get("schedule", []):
+                schedule.every().day.at(at).do(submit_job, name, job)
     
     logger.info("调度器已启动，将按计划执行爬虫任务")
     
     # 记录下一次执行的时间
-    jobs = schedule.get_jobs()
-    for job in jobs:
+    for job in schedule.get_jobs():
         logger.info(f"计划任务: {job}, 下一次执行时间: {job.next_run}")
     
-    # 立即执行一次每个爬虫
-    crawl_marketwatch()
-    crawl_investing()
-
-    # 持续运行调度器
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # 每分钟检查一次
+    # 立即执行一次每个爬虫（release_aware 模式下由 release_poller 第一次检查时执行）
+    if release_poller is None:
+        submit_job("marketwatch", source_job_map["marketwatch"])
+    submit_job("investing", source_job_map["investing"])
+    for name, job in source_job_map.items():
+        if name not in ("marketwatch", "investing"):
+            submit_job(name, job)
+
+    # 持续运行调度器，按下一个任务的时间休眠，最多 1 秒，触发精确到秒
+    try:
+        while True:
+            schedule.run_pending()
+            idle = schedule.idle_seconds()
+            if release_poller is not None:
+                poll_idle = release_poller.tick()
+                idle = poll_idle if idle is None else min(idle, poll_idle)
+            time.sleep(1 if idle is None else min(max(idle, 0), 1))
+    finally:
+        job_executor.shutdown(wait=False)
+        if work_queue is not None:
+            work_queue.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if browser_pool is not None:
+            browser_pool.close()
 
 if __name__ == "__main__":
     setup_schedule()
\ No newline at end of file
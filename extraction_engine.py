@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+离线提取引擎
+对已保存的 HTML 页面执行与爬虫相同的声明式提取规则（extraction_schemas），
+使用 lxml（C 实现的解析器），按进程池并行处理整个目录，不需要浏览器。
+修正选择器后可以直接重新解析存档页面。
+
+用法：
+python extraction_engine.py google_finance_data --output extracted.jsonl
+python extraction_engine.py archive/ --source investing --workers 8 --store data/crawl_data.db
+python extraction_engine.py data/page_archive --archive --source marketwatch --since 2026-10-01
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from extraction_schemas import (ARTICLE_SCHEMA, GOOGLE_FINANCE_SCHEMA, INVESTING_SCHEMA,
+                                MARKETWATCH_SCHEMA, fill_earnings_dates)
+from html_extraction import extract_from_html, parse_html
+
+logger = logging.getLogger("extraction_engine")
+
+SCHEMAS = {
+    "marketwatch": MARKETWATCH_SCHEMA,
+    "investing": INVESTING_SCHEMA,
+    "google_finance": GOOGLE_FINANCE_SCHEMA,
+    "article": ARTICLE_SCHEMA
+}
+
+# 自动识别来源时检查的页面特征，按顺序匹配
+SOURCE_MARKERS = [
+    ("marketwatch", b"calendar__table"),
+    ("investing", b"earningsCalendarDiv"),
+    ("google_finance", b"yY3Lee"),
+    ("article", b"<article")
+]
+
+HTML_EXTENSIONS = (".html", ".htm")
+
+
+def detect_source(html):
+    """根据页面特征判断来源，无法识别时返回 None"""
+    for source, marker in SOURCE_MARKERS:
+        if marker in html:
+            return source
+    return None
+
+
+def extract_file(path, source="auto"):
+    """解析单个文件，返回 {"file", "source", "data"} 或带 error 的记录"""
+    try:
+        with open(path, 'rb') as f:
+            html = f.read()
+        if source == "auto":
+            source = detect_source(html)
+            if source is None:
+                return {"file": path, "source": None, "error": "无法识别页面来源"}
+        data = extract_from_html(parse_html(html), SCHEMAS[source])
+        return {"file": path, "source": source, "data": data}
+    except Exception as e:
+        return {"file": path, "source": source, "error": str(e)}
+
+
+def _extract_batch(paths, source):
+    return [extract_file(path, source) for path in paths]
+
+
+def extract_archived(archive, record, source="auto"):
+    """解析页面存档中的一条记录，筛选接口的 JSON 响应先还原为表格片段"""
+    name = f"{record['url']}@{record['fetched_at']}"
+    try:
+        content = archive.read_record(record)
+        if record["source"] == "investing_ajax":
+            from investing_fastpath import FRAGMENT_WRAPPER
+            content = FRAGMENT_WRAPPER.format(rows=json.loads(content).get("data") or "").encode("utf-8")
+            source = "investing" if source == "auto" else source
+        if source == "auto":
+            source = record["source"] if record["source"] in SCHEMAS else detect_source(content)
+            if source is None:
+                return {"file": name, "source": None, "error": "无法识别页面来源"}
+        data = extract_from_html(parse_html(content), SCHEMAS[source])
+        return {"file": name, "source": source, "hash": record["hash"], "data": data}
+    except Exception as e:
+        return {"file": name, "source": source, "error": str(e)}
+
+
+def _extract_archive_batch(root, records, source):
+    from page_archive import PageArchive
+    archive = PageArchive(root)
+    try:
+        return [extract_archived(archive, record, source) for record in records]
+    finally:
+        archive.close()
+
+
+def extract_archive(root, source="auto", workers=None, since=None, until=None, batch_size=16):
+    """
+    从页面存档中按时间顺序重新解析页面，相同内容只解析一次
+    source 为 auto 时解析所有来源，否则只解析存档中该来源的页面
+    """
+    from page_archive import PageArchive
+    archive = PageArchive(root)
+    sources = [None] if source == "auto" else (["investing", "investing_ajax"] if source == "investing" else [source])
+    records = [record for name in sources
+               for record in archive.records(source=name, since=since, until=until, unique=True)]
+    records.sort(key=lambda record: (record["fetched_at"], record["id"]))
+    archive.close()
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+    if len(batches) <= 1 or workers == 1:
+        for batch in batches:
+            yield from _extract_archive_batch(root, batch, source)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_extract_archive_batch, [root] * len(batches), batches,
+                                    [source] * len(batches)):
+            yield from results
+
+
+def find_pages(root):
+    """递归查找目录下的 HTML 文件，按路径排序"""
+    if os.path.isfile(root):
+        return [root]
+    pages = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(HTML_EXTENSIONS):
+                pages.append(os.path.join(dirpath, filename))
+    return sorted(pages)
+
+
+def extract_directory(root, source="auto", workers=None, batch_size=16):
+    """
+    用进程池解析目录下所有页面，按文件顺序逐个产出结果
+    每个任务处理 batch_size 个文件，减少进程间通信
+    """
+    pages = find_pages(root)
+    batches = [pages[i:i + batch_size] for i in range(0, len(pages), batch_size)]
+    if len(batches) <= 1 or workers == 1:
+        for batch in batches:
+            yield from _extract_batch(batch, source)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_extract_batch, batches, [source] * len(batches)):
+            yield from results
+
+
+def store_result(store, result):
+    """把 MarketWatch / Investing 的提取结果写入增量数据库"""
+    data = result["data"]
+    if result["source"] == "marketwatch":
+        rows = [r for r in data.get("reports", []) if (r.get("event") or "").strip()]
+        table = "economic_data"
+    elif result["source"] == "investing":
+        rows = fill_earnings_dates(data.get("earnings_dates", []))
+        table = "earnings_data"
+    else:
+        return None
+    if not rows:
+        return None
+    return store.upsert(table, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对保存的 HTML 页面离线执行爬虫提取规则")
+    parser.add_argument("path", help="HTML 文件或目录；使用 --archive 时为页面存档目录")
+    parser.add_argument("--source", choices=["auto"] + sorted(SCHEMAS), default="auto",
+                        help="页面来源，默认根据页面内容自动识别")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为 CPU 核数")
+    parser.add_argument("--output", default=None, help="结果输出为 JSONL 文件，默认输出到标准输出")
+    parser.add_argument("--store", default=None, help="把 MarketWatch / Investing 结果写入该数据库")
+    parser.add_argument("--archive", action="store_true", help="从页面存档（page_archive）读取页面")
+    parser.add_argument("--since", default=None, help="只解析该时间之后获取的存档页面，如 2026-10-01")
+    parser.add_argument("--until", default=None, help="只解析该时间之前获取的存档页面")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    store = None
+    if args.store:
+        from datastore import CrawlStore
+        store = CrawlStore(args.store)
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    started = time.monotonic()
+    processed = failed = 0
+    try:
+        if args.archive:
+            results = extract_archive(args.path, source=args.source, workers=args.workers,
+                                      since=args.since, until=args.until)
+        else:
+            results = extract_directory(args.path, source=args.source, workers=args.workers)
+        for result in results:
+            processed += 1
+            if "error" in result:
+                failed += 1
+                logger.warning(f"解析失败 {result['file']}: {result['error']}")
+            elif store is not None:
+                store_result(store, result)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if store is not None:
+            store.close()
+
+    logger.info(f"共处理 {processed} 个页面，失败 {failed} 个，用时 {time.monotonic() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+各数据源的声明式提取规则
+crawl4ai 爬虫、Playwright 页面提取 (page_extraction) 和离线 HTML 提取 (html_extraction)
+共用同一份规则
+
+规则格式：
+    "key": "css selector"                       # 取第一个匹配元素的文本
+    "key": {"selector": ..., "attribute": ...}  # 取属性值
+    "key": {"selector": ..., "processor": "text"}
+    "key": {"selector": ..., "multiple": True, "data": {...}}  # 多条记录
+不写 selector 表示取当前元素本身
+Author: kelesit
+Date: 2026-10-18
+"""
+
+MARKETWATCH_SCHEMA = {
+    "reports": {
+        "selector": "table.calendar__table tr.calendar__row",
+        "multiple": True,
+        "data": {
+            "date": ".calendar__cell--date",
+            "time": ".calendar__cell--time",
+            "event": ".calendar__cell--event",
+            "actual": ".calendar__cell--actual",
+            "forecast": ".calendar__cell--forecast",
+            "previous": ".calendar__cell--previous"
+        }
+    },
+    # 提取日期范围信息
+    "date_range": ".calendar-range"
+}
+
+INVESTING_SCHEMA = {
+    "earnings_dates": {
+        "selector": ".earningsCalendarDiv table tbody tr",
+        "multiple": True,
+        "data": {
+            "date": {
+                "selector": ".theDay",
+                "processor": "text"
+            },
+            "country": {
+                "selector": "td:nth-child(2) span",
+                "attribute": "title"
+            },
+            "company_name": "td.symbolColumn a",
+            "symbol": {
+                "selector": "td.symbolColumn span",
+                "processor": "text"
+            },
+            "eps_forecast": "td.eps.bold",
+            "eps_actual": "td.actual.bold",
+            "revenue_forecast": "td.rev.bold",
+            "revenue_actual": "td.actualRev.bold",
+            "market_cap": "td.marketCap"
+        }
+    },
+    # 提取当前日期范围信息
+    "current_period": ".currentDateView"
+}
+
+# Google Finance 首页 Today's financial news 的 Top stories 卡片
+GOOGLE_FINANCE_SCHEMA = {
+    "stories": {
+        "selector": "div.yY3Lee",
+        "multiple": True,
+        "data": {
+            "title": "div.Yfwt5",
+            "source": {"attribute": "data-article-source-name"},
+            "time": "div.Adak",
+            "link": {"selector": "a", "attribute": "href"},
+            "image": {"selector": "img", "attribute": "src"}
+        }
+    }
+}
+
+# 文章页面正文
+ARTICLE_SCHEMA = {
+    "content": "article"
+}
+
+
+def fill_earnings_dates(rows):
+    """
+    财报表格中日期是单独的一行 (td.theDay)，其后的公司行没有日期
+    把日期向下填充到公司行，并去掉日期行本身
+    """
+    current_date = ""
+    filled = []
+    for row in rows:
+        symbol = (row.get("symbol") or "").strip()
+        date = (row.get("date") or "").strip()
+        if date and not symbol:
+            current_date = date
+            continue
+        if not symbol:
+            continue
+        filled.append(dict(row, date=date or current_date))
+    return filled
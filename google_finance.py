@@ -1,4 +1,23 @@
+import argparse
+import asyncio
+
 from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+
+from resource_blocker import ResourceBlocker
+from article_cache import ArticleCache, canonicalize_url
+from near_duplicates import load_near_duplicate_index
+from article_store import ArticleStore, ArticleWriter
+from extraction_schemas import GOOGLE_FINANCE_SCHEMA
+from page_extraction import extract_from_page, extract_from_page_async
+import instrumentation
+from rate_limiter import goto, goto_async
+from page_archive import archive_response, archive_response_async
+
+GOOGLE_FINANCE_URL = "https://www.google.com/finance"
+
+# 缺少这些字段的卡片无法抓取正文，直接跳过
+REQUIRED_CARD_FIELDS = ("title", "link")
 
 def parse_article_content(context, link):
     """
@@ -9,9 +28,10 @@ def parse_article_content(context, link):
     """
     try:
         article_page = context.new_page()
-        article_page.goto(link)
-        # article_page.wait_for_selector("article")
-        content = article_page.locator("article").first.text_content()
+        with instrumentation.stage("google_finance", "article"):
+            archive_response(goto(article_page, link), "article")
+            # article_page.wait_for_selector("article")
+            content = article_page.locator("article").first.text_content()
         article_page.close()
         print("处理成功")
         return content
@@ -19,76 +39,396 @@ def parse_article_content(context, link):
         print(f"Error parsing article content: {e}")
         return ""
 
-def get_top_story():
+def print_blocker_stats(blocker):
+    stats = blocker.stats()
+    print(f"已拦截 {stats['blocked_requests']} 个请求，"
+          f"估计节省 {stats['estimated_saved_bytes'] / 1024:.1f} KB")
+
+def print_cache_stats(cache):
+    stats = cache.stats()
+    print(f"文章缓存命中 {stats['hits']} 篇，未命中 {stats['misses']} 篇")
+
+def print_duplicate_stats(dedupe):
+    if dedupe is None:
+        return
+    stats = dedupe.stats()
+    print(f"重复文章：按链接 {stats['url_hits']} 篇，按标题 {stats['title_hits']} 篇，"
+          f"按正文 {stats['lead_hits']} 篇（已记录 {stats['stories']} 篇）")
+
+def link_duplicates(cards, dedupe):
+    """
+    按链接和标题查找与已抓取文章重复的卡片，返回每张卡片对应的已有文章（没有重复时为 None）
+    重复的卡片记录 duplicate_of，不再单独抓取正文
+    """
+    duplicates = []
+    for card in cards:
+        duplicate = None
+        if dedupe is not None:
+            duplicate = dedupe.check(card["link"], card["title"], card.get("source"))
+        if duplicate is not None:
+            card["duplicate_of"] = duplicate["url"]
+            print(f"{card['title']} 与已抓取的文章重复（{duplicate['by']}）: {duplicate['url']}")
+        duplicates.append(duplicate)
+    return duplicates
+
+def record_story(dedupe, card, content, duplicate):
+    """记录文章并按正文开头查重，重复时记录 duplicate_of"""
+    if dedupe is None:
+        return
+    match = dedupe.record(card["link"], card["title"], card.get("source"), content, duplicate)
+    if match is not None and "duplicate_of" not in card:
+        card["duplicate_of"] = match["url"]
+        print(f"{card['title']} 的正文与已抓取的文章重复: {match['url']}")
+
+def cards_from_extracted(data):
+    """
+    整理页面内一次提取得到的卡片记录
+    报告缺少字段的卡片，缺少必需字段（标题、链接）的卡片会被跳过
+    """
+    cards = []
+    for index, card in enumerate(data.get("stories") or []):
+        missing = [key for key, value in card.items() if not value]
+        if missing:
+            print(f"第 {index + 1} 张卡片缺少字段: {', '.join(missing)}")
+        if any(key in missing for key in REQUIRED_CARD_FIELDS):
+            continue
+        cards.append(card)
+    return cards
+
+def get_top_story(context=None, cache=None, url=GOOGLE_FINANCE_URL, dedupe=None):
     """
     获取 Google Finance 首页 Today's financial news 栏目的
     Top stories
+    传入 context（例如从调度器的浏览器池租用）时直接使用，不再自行启动浏览器
+    文章正文优先从缓存读取，只有新链接或已过期的链接才会打开页面
+    与已抓取文章（按链接或标题）近似重复的卡片关联到已有文章，使用已有文章的正文
+    返回全部文章的列表；需要边抓取边保存时使用 iter_top_stories
+    """
+    return list(iter_top_stories(context, cache, url, dedupe))
+
+def iter_top_stories(context=None, cache=None, url=GOOGLE_FINANCE_URL, dedupe=None):
     """
+    get_top_story 的生成器版本，每篇文章提取完成后立即产出，
+    不在内存中累积正文；中途出错或中断时，已产出的文章不受影响
+    """
+    if cache is None:
+        cache = ArticleCache.from_config()
+    if dedupe is None:
+        dedupe = load_near_duplicate_index()
+
+    if context is not None:
+        yield from _iter_top_stories(context, cache, url, dedupe)
+        return
+
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
+        try:
+            yield from _iter_top_stories(browser.new_context(), cache, url, dedupe)
+        finally:
+            browser.close()
+
+def _iter_top_stories(context, cache, url=GOOGLE_FINANCE_URL, dedupe=None):
+    blocker = ResourceBlocker.for_source("google_finance")
+    blocker.attach(context)
+    cache.reset_stats()
+    if dedupe is not None:
+        dedupe.reset_stats()
+    page = context.new_page()
+
+    try:
+        # 导航到 Google Finance 主页
+        with instrumentation.stage("google_finance", "navigation"):
+            archive_response(goto(page, url), "google_finance")
+        with instrumentation.stage("google_finance", "wait_for"):
+            page.wait_for_selector("div.yY3Lee")
+
+        print("提取数据中...")
+        # 所有卡片的字段在页面内一次提取完成
+        with instrumentation.stage("google_finance", "extraction"):
+            cards = cards_from_extracted(extract_from_page(page, GOOGLE_FINANCE_SCHEMA))
+        instrumentation.count("google_finance", "rows_extracted", len(cards))
+        for card in cards:
+            try:
+                print(f"正在处理: {card['title']}")
+                print(f"来源: {card['source']}")
+
+                duplicate = link_duplicates([card], dedupe)[0]
+                content = None
+                if duplicate is not None:
+                    content = cache.get(duplicate["url"])
+                if content is None:
+                    content = cache.get(card["link"])
+                if content is None:
+                    content = parse_article_content(context, card["link"])
+                    cache.put(card["link"], content)
+                else:
+                    print("使用缓存内容")
+
+                record_story(dedupe, card, content, duplicate)
+                print(f"已提取: {card['title']}")
+
+            except Exception as e:
+                print(f"Error processing an article: {e}")
+                continue
+
+            # 卡片本身不保存正文，产出后正文只由调用方持有
+            yield dict(card, content=content)
+
+    except TimeoutError:
+        print("页面加载超时")
+    except Exception as e:
+        print(f"出现错误: {e}")
+    finally:
+        print_blocker_stats(blocker)
+        print_cache_stats(cache)
+        print_duplicate_stats(dedupe)
+        cache.evict()
+        page.close()
+
+class AsyncPagePool:
+    """
+    可复用的文章页面池
+    固定数量的页面轮流用于加载文章，避免每篇文章都新建/关闭页面，
+    同时限制同时打开的文章页面数量
+    """
+
+    def __init__(self, context, size=5):
+        self.context = context
+        self.size = max(1, size)
+        self._pages = asyncio.Queue()
+        self._started = False
+
+    async def start(self):
+        """创建页面，重复调用时不再创建"""
+        if self._started:
+            return
+        self._started = True
+        for _ in range(self.size):
+            self._pages.put_nowait(await self.context.new_page())
+
+    async def acquire(self):
+        """
+        取一个页面；池中的空位（替换页面失败时留下）在这里重新创建页面，
+        仍然失败时把空位放回并抛出异常，池的大小不变
+        """
+        page = await self._pages.get()
+        if page is None:
+            try:
+                page = await self.context.new_page()
+            except BaseException:
+                self._pages.put_nowait(None)
+                raise
+        return page
+
+    async def release(self, page, broken=False):
+        # 超时的页面可能仍停留在未完成的导航上，换一个新页面放回池中；创建失败时放回空位
+        if broken:
+            try:
+                await page.close()
+            except Exception:
+                pass
+            try:
+                page = await self.context.new_page()
+            except BaseException as e:
+                self._pages.put_nowait(None)
+                if not isinstance(e, Exception):
+                    raise
+                print(f"替换文章页面失败: {e}")
+                return
+        self._pages.put_nowait(page)
+
+    async def close(self):
+        while not self._pages.empty():
+            page = self._pages.get_nowait()
+            if page is None:
+                continue
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+
+async def parse_article_content_async(pool, link, timeout=30):
+    """
+    异步版本的 parse_article_content
+    从页面池中取一个页面加载文章，单篇文章超过 timeout 秒则放弃，返回空字符串
+    """
+    try:
+        page = await pool.acquire()
+    except Exception as e:
+        print(f"Error parsing article content: {e}")
+        return ""
+    broken = False
+    try:
+        async def _load():
+            await archive_response_async(await goto_async(page, link, timeout=timeout * 1000), "article")
+            return await page.locator("article").first.text_content(timeout=timeout * 1000)
+
+        with instrumentation.stage("google_finance", "article"):
+            content = await asyncio.wait_for(_load(), timeout=timeout)
+        print("处理成功")
+        return content
+    except asyncio.TimeoutError:
+        broken = True
+        print(f"文章加载超时 ({timeout}s): {link}")
+        return ""
+    except Exception as e:
+        print(f"Error parsing article content: {e}")
+        return ""
+    finally:
+        await pool.release(page, broken=broken)
+
+
+async def get_top_story_async(pool_size=5, article_timeout=30, cache=None, url=GOOGLE_FINANCE_URL,
+                              dedupe=None):
+    """
+    get_top_story 的异步版本
+    先在首页收集所有卡片信息，再通过页面池并发抓取未命中缓存的文章正文，
+    返回结果保持与卡片相同的顺序
+    """
+    return [story async for story in iter_top_stories_async(pool_size, article_timeout, cache, url, dedupe)]
+
+
+async def iter_top_stories_async(pool_size=5, article_timeout=30, cache=None, url=GOOGLE_FINANCE_URL,
+                                 dedupe=None):
+    """
+    get_top_story_async 的异步生成器版本，按卡片顺序逐篇产出
+    最多提前读取 / 抓取 2 * pool_size 篇文章，内存中的正文数量不随文章总数增长
+    """
+    if cache is None:
+        cache = ArticleCache.from_config()
+    cache.reset_stats()
+    if dedupe is None:
+        dedupe = load_near_duplicate_index()
+    if dedupe is not None:
+        dedupe.reset_stats()
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context()
+        blocker = ResourceBlocker.for_source("google_finance")
+        await blocker.attach_async(context)
+        page = await context.new_page()
+        pool = AsyncPagePool(context, size=pool_size)
+        tasks = {}
 
         try:
             # 导航到 Google Finance 主页
-            page.goto("https://www.google.com/finance")
-            page.wait_for_selector("div.yY3Lee")
-            articles = page.locator("div.yY3Lee").all()
+            with instrumentation.stage("google_finance", "navigation"):
+                await archive_response_async(await goto_async(page, url), "google_finance")
+            with instrumentation.stage("google_finance", "wait_for"):
+                await page.wait_for_selector("div.yY3Lee")
 
             print("提取数据中...")
-            # 提取文章标题和链接
-            top_stories = []
-            for article in articles:
-                try:
-                    title = article.locator("div.Yfwt5").text_content().strip()
-                    source = article.get_attribute("data-article-source-name")
-                    time = article.locator("div.Adak").text_content().strip()
-                    link = article.locator("a").first.get_attribute("href")
-                    img_url = article.locator("img").get_attribute("src")
-
-                    print(f"正在处理: {title}")
-                    print(f"来源: {source}")
-
-                    content = parse_article_content(context, link)
-
-                    top_stories.append({
-                        "title": title,
-                        "source": source,
-                        "time": time,
-                        "link": link,
-                        "image": img_url,
-                        "content": content
-                    })
-
-                    print(f"已提取: {title}")
-
-                    
-                except Exception as e:
-                    print(f"Error processing an article: {e}")
-                    continue
-
-            return top_stories
-        
+            with instrumentation.stage("google_finance", "extraction"):
+                cards = cards_from_extracted(await extract_from_page_async(page, GOOGLE_FINANCE_SCHEMA))
+            instrumentation.count("google_finance", "rows_extracted", len(cards))
+
+            duplicates = link_duplicates(cards, dedupe)
+            # 重复卡片的原文在本批中时，缓存未命中的话等原文抓取后直接复用，不再单独打开页面
+            batch = {canonicalize_url(card["link"]): i for i, card in enumerate(cards)}
+            originals = {i: batch[duplicate["url"]] for i, duplicate in enumerate(duplicates)
+                         if duplicate and batch.get(duplicate["url"], i) != i}
+            followed = set(originals.values())
+            contents, following = {}, set()
+            window = pool.size * 2
+
+            async def prefetch(i):
+                """读取缓存，未命中时开始抓取"""
+                if i in contents or i in tasks or i in following:
+                    return
+                duplicate = duplicates[i]
+                content = cache.get(duplicate["url"]) if duplicate else None
+                if content is None and i in originals:
+                    following.add(i)
+                    await prefetch(originals[i])
+                    return
+                if content is None:
+                    content = cache.get(cards[i]["link"])
+                if content is not None:
+                    contents[i] = content
+                    return
+                await pool.start()
+                tasks[i] = asyncio.create_task(
+                    parse_article_content_async(pool, cards[i]["link"], timeout=article_timeout))
+
+            async def result(i):
+                if i in following:
+                    return await result(originals[i]) or ""
+                if i in tasks:
+                    contents[i] = await tasks.pop(i)
+                    cache.put(cards[i]["link"], contents[i])
+                return contents[i]
+
+            print(f"共 {len(cards)} 篇文章，使用 {pool.size} 个页面并发抓取")
+            for i, card in enumerate(cards):
+                for j in range(i, min(len(cards), i + window)):
+                    await prefetch(j)
+                content = await result(i)
+                record_story(dedupe, card, content, duplicates[i])
+                # 本批中还有重复卡片要复用的原文保留到结束，其余产出后释放
+                if i not in followed:
+                    contents.pop(i, None)
+                print(f"已提取: {card['title']}")
+                yield dict(card, content=content)
+
         except TimeoutError:
             print("页面加载超时")
-            return []
         except Exception as e:
             print(f"出现错误: {e}")
-            return []
         finally:
-            browser.close()
+            for task in tasks.values():
+                task.cancel()
+            print_blocker_stats(blocker)
+            print_cache_stats(cache)
+            print_duplicate_stats(dedupe)
+            cache.evict()
+            await pool.close()
+            await browser.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="抓取 Google Finance Top stories")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="使用异步模式并发抓取文章正文")
+    parser.add_argument("--pool-size", type=int, default=5,
+                        help="异步模式下复用的文章页面数量")
+    parser.add_argument("--article-timeout", type=float, default=30,
+                        help="异步模式下单篇文章的超时时间（秒）")
+    return parser.parse_args()
+
+
+def print_story(story):
+    print(f"Title: {story['title']}")
+    print(f"Source: {story['source']}")
+    print(f"Time: {story['time']}")
+    print(f"Link: {story['link']}")
+    print(f"Image URL: {story['image']}")
+    print("-" * 50)
+
+
+async def stream_top_stories_async(writer, pool_size=5, article_timeout=30):
+    """异步抓取并交给写入线程，队列已满时在线程中等待，不阻塞事件循环"""
+    async for story in iter_top_stories_async(pool_size=pool_size, article_timeout=article_timeout):
+        await asyncio.to_thread(writer.put, story)
+        print_story(story)
+
 
 if __name__ == "__main__":
-    save_dir = "google_finance_articles"
-    stories = get_top_story()
-    for story in stories:
-        # save as a text file
-        with open(f"{save_dir}/{story['title']}.txt", "w") as f:
-            f.write(story['content'])
-
-        print(f"Title: {story['title']}")
-        print(f"Source: {story['source']}")
-        print(f"Time: {story['time']}")
-        print(f"Link: {story['link']}")
-        print(f"Image URL: {story['image']}")
-        print("-" * 50)
\ No newline at end of file
+    args = parse_args()
+    store = ArticleStore.from_config()
+    # 每篇文章提取完成后立即交给写入线程保存，中途中断时已完成的文章不会丢失
+    writer = ArticleWriter(store)
+    try:
+        with writer:
+            if args.use_async:
+                asyncio.run(stream_top_stories_async(writer, pool_size=args.pool_size,
+                                                     article_timeout=args.article_timeout))
+            else:
+                for story in iter_top_stories():
+                    writer.put(story)
+                    print_story(story)
+    finally:
+        result = writer.stats()
+        store.close()
+        print(f"已保存到文章库 {store.path}：新增 {result['inserted']} 篇，更新 {result['updated']} 篇")
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+历史快照加载器
+扫描数据目录下所有带时间戳的 CSV 快照（marketwatch_economic_data_*.csv、
+investing_earnings_data_*.csv），合并为一份列式缓存（parquet）。
+缓存旁的 manifest 记录每个快照文件的大小和修改时间，之后只解析新增或变化的文件，
+新文件用线程池并行读取。空的快照文件（爬取没有数据时留下的 0 字节文件）记入 manifest 但不产生记录。
+
+CrawlStore 成为默认的存储后不再生成 CSV 快照，因此每次更新时还会读取 crawl_data.db 中
+last_updated 晚于上次读取位置的行追加到缓存：同一次写入（相同的 last_updated）的行视为一个快照，
+snapshot_file 为 "crawl_store:<last_updated>"。数据库中被后续爬取覆盖的旧值仍保留在缓存里。
+
+缓存目录结构：
+    history_cache/economic_data.parquet
+    history_cache/economic_data.manifest.json   {"文件名": {"size": ..., "mtime": ..., "rows": ...},
+                                                 "crawl_store": {"last_updated": ...}}
+
+没有安装 pyarrow 时退回使用 pickle 保存缓存
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from datastore import TABLES, CrawlStore
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:  # 没有 pyarrow 时用 pickle 保存缓存
+    pyarrow = None
+
+logger = logging.getLogger("history_loader")
+
+SNAPSHOT_PATTERNS = {
+    "economic_data": "marketwatch_economic_data_*.csv",
+    "earnings_data": "investing_earnings_data_*.csv"
+}
+
+# manifest 中记录 CrawlStore 读取位置的条目，快照文件名都以 .csv 结尾，不会冲突
+STORE_ENTRY = "crawl_store"
+
+_TIMESTAMP_RE = re.compile(r"_(\d{8}_\d{6})\.csv$")
+
+
+def snapshot_time(filename):
+    """从快照文件名中解析抓取时间，解析失败时返回 None"""
+    match = _TIMESTAMP_RE.search(filename)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+
+
+def _empty_frame(fields):
+    return pd.DataFrame(columns=fields + ["snapshot_file", "snapshot_time"])
+
+
+def _read_snapshot(path, fields):
+    # 爬取没有数据时可能留下 0 字节（或只有空行）的快照文件
+    if os.path.getsize(path) == 0:
+        return _empty_frame(fields)
+    try:
+        # 所有列按字符串读取，避免不同快照推断出不同的类型
+        frame = pd.read_csv(path, dtype=str, keep_default_na=False, engine="c")
+    except pd.errors.EmptyDataError:
+        return _empty_frame(fields)
+    for field in fields:
+        if field not in frame.columns:
+            frame[field] = ""
+    frame = frame[fields]
+    frame["snapshot_file"] = os.path.basename(path)
+    frame["snapshot_time"] = snapshot_time(path)
+    return frame
+
+
+class HistoryLoader:
+    def __init__(self, data_dir="./data", cache_dir=None, workers=8, store=None, store_path=None):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir or os.path.join(data_dir, "history_cache")
+        self.workers = workers
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 没有传入 store 时读取数据目录下已有的 crawl_data.db，不存在时只读取 CSV 快照
+        self.store = store
+        self._owns_store = False
+        store_path = store_path or os.path.join(data_dir, "crawl_data.db")
+        if self.store is None and os.path.exists(store_path):
+            self.store = CrawlStore(store_path)
+            self._owns_store = True
+
+    def _cache_path(self, table):
+        extension = "parquet" if pyarrow is not None else "pkl"
+        return os.path.join(self.cache_dir, f"{table}.{extension}")
+
+    def _manifest_path(self, table):
+        return os.path.join(self.cache_dir, f"{table}.manifest.json")
+
+    def _load_cache(self, table):
+        cache_path = self._cache_path(table)
+        manifest_path = self._manifest_path(table)
+        if not (os.path.exists(cache_path) and os.path.exists(manifest_path)):
+            return None, {}
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if pyarrow is not None:
+                frame = pd.read_parquet(cache_path)
+            else:
+                frame = pd.read_pickle(cache_path)
+            return frame, manifest
+        except Exception as e:
+            logger.warning(f"历史缓存损坏，将重新构建: {str(e)}")
+            return None, {}
+
+    def _save_cache(self, table, frame, manifest):
+        # 先写临时文件再替换，中途退出不会留下不完整的缓存
+        cache_path = self._cache_path(table)
+        tmp_path = cache_path + ".tmp"
+        if pyarrow is not None:
+            frame.to_parquet(tmp_path, index=False)
+        else:
+            frame.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+
+        manifest_path = self._manifest_path(table)
+        with open(manifest_path + ".tmp", 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _scan(self, table):
+        files = {}
+        for path in glob.glob(os.path.join(self.data_dir, SNAPSHOT_PATTERNS[table])):
+            stat = os.stat(path)
+            files[os.path.basename(path)] = {"size": stat.st_size, "mtime": stat.st_mtime}
+        return files
+
+    def _read_store(self, table, fields, watermark):
+        """读取 CrawlStore 中 last_updated 晚于 watermark 的行，返回 (DataFrame 或 None, 新的读取位置)"""
+        if self.store is None:
+            return None, watermark
+        rows = [row for row in self.store.history(table, since=watermark)
+                if not watermark or row["last_updated"] > watermark]
+        if not rows:
+            return None, watermark
+        frame = pd.DataFrame(rows, columns=fields + ["last_updated"])
+        frame["snapshot_file"] = STORE_ENTRY + ":" + frame["last_updated"]
+        frame["snapshot_time"] = pd.to_datetime(frame["last_updated"])
+        return frame.drop(columns=["last_updated"]), max(row["last_updated"] for row in rows)
+
+    def refresh(self, table):
+        """
+        增量更新一张表的历史缓存，返回合并后的 DataFrame
+        新增和修改过的快照重新解析，已删除的快照从缓存中移除，CrawlStore 中新写入的行追加到缓存
+        """
+        if table not in SNAPSHOT_PATTERNS:
+            raise ValueError(f"未知的数据表: {table}")
+        fields = TABLES[table]["fields"]
+
+        cached, manifest = self._load_cache(table)
+        files = self._scan(table)
+        store_state = manifest.pop(STORE_ENTRY, {})
+
+        changed = [name for name, info in files.items()
+                   if name not in manifest
+                   or manifest[name]["size"] != info["size"]
+                   or manifest[name]["mtime"] != info["mtime"]]
+        removed = [name for name in manifest if name not in files or name in changed]
+        store_rows, watermark = self._read_store(table, fields, store_state.get("last_updated"))
+        if watermark:
+            manifest[STORE_ENTRY] = {"last_updated": watermark}
+
+        if cached is not None and not changed and not removed and store_rows is None:
+            return cached
+
+        if cached is not None and removed:
+            cached = cached[~cached["snapshot_file"].isin(removed)]
+        for name in removed:
+            manifest.pop(name, None)
+
+        frames = [] if cached is None else [cached]
+        if changed:
+            started = time.monotonic()
+            paths = [os.path.join(self.data_dir, name) for name in sorted(changed)]
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                parsed = list(executor.map(lambda path: _read_snapshot(path, fields), paths))
+            for name, frame in zip(sorted(changed), parsed):
+                manifest[name] = dict(files[name], rows=len(frame))
+            frames.extend(frame for frame in parsed if not frame.empty)
+            logger.info(f"{table}: 解析了 {len(changed)} 个新快照，用时 {time.monotonic() - started:.2f}s")
+        if store_rows is not None:
+            frames.append(store_rows)
+            logger.info(f"{table}: 从数据库读取了 {len(store_rows)} 条新写入的记录")
+
+        if frames:
+            history = pd.concat(frames, ignore_index=True)
+        else:
+            history = _empty_frame(fields)
+        history = history.sort_values(["snapshot_time", "snapshot_file"], kind="stable", ignore_index=True)
+        self._save_cache(table, history, manifest)
+        return history
+
+    def load(self, table, since=None):
+        """加载一张表的全部历史快照，since 为 datetime 时只返回之后的快照"""
+        history = self.refresh(table)
+        if since is not None:
+            history = history[history["snapshot_time"] >= pd.Timestamp(since)]
+        return history
+
+    def close(self):
+        if self._owns_store:
+            self.store.close()
+
+
+def load_history(data_dir="./data", since=None, workers=8):
+    """加载经济数据和财报数据的全部历史快照，返回 (economic_history, earnings_history)"""
+    loader = HistoryLoader(data_dir, workers=workers)
+    try:
+        return loader.load("economic_data", since=since), loader.load("earnings_data", since=since)
+    finally:
+        loader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建或更新历史快照缓存")
+    parser.add_argument("--data-dir", default="./data", help="快照所在目录")
+    parser.add_argument("--workers", type=int, default=8, help="并行读取的线程数")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    started = time.monotonic()
+    economic_history, earnings_history = load_history(args.data_dir, workers=args.workers)
+    logger.info(f"经济数据 {len(economic_history)} 条，财报数据 {len(earnings_history)} 条，"
+                f"用时 {time.monotonic() - started:.2f}s")
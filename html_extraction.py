@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+对 HTML 文本执行声明式提取规则（lxml + cssselect）
+规则格式和返回结构与 page_extraction 在浏览器中执行的结果一致，见 extraction_schemas.py
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import lxml.html
+from lxml.cssselect import CSSSelector
+
+_selector_cache = {}
+
+# 文本先按 UTF-8 编码再解析（带 <?xml encoding=...?> 声明的字符串不能直接解析）。
+# 编码后的字节和存档中的页面往往没有 charset 声明，lxml 默认按 latin-1 解码，
+# 所以能按 UTF-8 解码的字节显式指定 UTF-8
+_utf8_parser = lxml.html.HTMLParser(encoding="utf-8")
+
+
+def _select(root, selector):
+    compiled = _selector_cache.get(selector)
+    if compiled is None:
+        compiled = _selector_cache[selector] = CSSSelector(selector)
+    return compiled(root)
+
+
+def _normalize(spec):
+    return {"selector": spec} if isinstance(spec, str) else spec
+
+
+def _value(element, spec):
+    if spec.get("attribute"):
+        return element.get(spec["attribute"])
+    return element.text_content().strip()
+
+
+def _record(root, data):
+    return {key: _field(root, _normalize(spec)) for key, spec in data.items()}
+
+
+def _field(root, spec):
+    selector = spec.get("selector")
+    if spec.get("multiple"):
+        elements = _select(root, selector) if selector else [root]
+        if spec.get("data"):
+            return [_record(element, spec["data"]) for element in elements]
+        return [_value(element, spec) for element in elements]
+
+    if selector:
+        matches = _select(root, selector)
+        if not matches:
+            return None
+        element = matches[0]
+    else:
+        element = root
+    return _record(element, spec["data"]) if spec.get("data") else _value(element, spec)
+
+
+def parse_html(html):
+    """把 HTML 文本解析为 lxml 文档，字节不是合法的 UTF-8 时按页面声明的编码解析"""
+    if isinstance(html, bytes):
+        try:
+            html.decode("utf-8")
+        except UnicodeDecodeError:
+            return lxml.html.document_fromstring(html)
+        return lxml.html.document_fromstring(html, parser=_utf8_parser)
+    return lxml.html.document_fromstring(html.encode("utf-8"), parser=_utf8_parser)
+
+
+def extract_from_html(html, schema):
+    """对 HTML 文本（或已解析的文档）执行提取规则，返回与规则结构相同的字典"""
+    root = parse_html(html) if isinstance(html, (str, bytes)) else html
+    return _record(root, schema)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+爬虫运行事件
+爬虫在各阶段（导航、提取、保存等）结束时发出事件，基准测试和监控指标订阅这些事件。
+没有订阅者时只有一次计时的开销。
+
+事件是一个字典：
+    {"type": "stage", "source": "marketwatch", "stage": "navigation", "seconds": 1.23, "ok": True}
+    {"type": "count", "source": "investing", "name": "rows_saved", "value": 120}
+    {"type": "gauge", "source": "www.investing.com", "name": "rate_limit", "value": 0.5}
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("instrumentation")
+
+_subscribers = []
+_lock = threading.Lock()
+
+
+def subscribe(callback):
+    """注册事件回调，回调会在发出事件的线程中被调用"""
+    with _lock:
+        if callback not in _subscribers:
+            _subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback):
+    with _lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
+
+
+def emit(event):
+    """把事件分发给所有订阅者，回调出错不影响爬虫"""
+    with _lock:
+        subscribers = list(_subscribers)
+    for callback in subscribers:
+        try:
+            callback(event)
+        except Exception as e:
+            logger.warning(f"事件回调出错: {str(e)}")
+
+
+@contextmanager
+def stage(source, name):
+    """记录一个阶段的耗时，阶段内抛出异常时 ok 为 False"""
+    started = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        emit({
+            "type": "stage",
+            "source": source,
+            "stage": name,
+            "seconds": time.perf_counter() - started,
+            "ok": ok
+        })
+
+
+def count(source, name, value=1):
+    """记录一个计数（如保存的记录数、传输的字节数）"""
+    emit({"type": "count", "source": source, "name": name, "value": value})
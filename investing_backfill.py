@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Investing.com 财报日历历史回填
+把 [start, end] 按天或按周切分成窗口，在礼貌限制内并行爬取，
+每完成一个窗口就写入检查点，中断后重新运行会跳过已完成的窗口。
+没有爬取到任何记录的窗口（可能被软封，也可能该时间段确实没有财报）单独记为 empty，
+不算作已完成，重新运行时会再次爬取。
+数据通过 InvestingEarningsCrawler.save_data 写入，与日常爬取使用同一条保存路径。
+
+用法：
+python investing_backfill.py --start 2024-01-01 --end 2024-06-30 --window week --parallel 2
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from browser_pool import BrowserPool
+from datastore import CrawlStore
+from investing_crawler import InvestingEarningsCrawler
+from session_pool import get_session_pool
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler("investing_backfill.log"),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger("investing_backfill")
+
+WINDOW_DAYS = {"day": 1, "week": 7}
+
+
+def split_windows(start, end, window="week"):
+    """把日期范围切分为 (date_from, date_to) 窗口，两端都包含"""
+    step = timedelta(days=WINDOW_DAYS[window])
+    windows = []
+    current = start
+    while current <= end:
+        window_end = min(current + step - timedelta(days=1), end)
+        windows.append((current.isoformat(), window_end.isoformat()))
+        current = window_end + timedelta(days=1)
+    return windows
+
+
+class Checkpoint:
+    """记录已完成和没有数据的窗口，每次更新都原子地写回磁盘"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.completed = set()
+        self.empty = set()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            self.completed = set(state.get("completed", []))
+            self.empty = set(state.get("empty", []))
+
+    @staticmethod
+    def key(window):
+        return f"{window[0]}_{window[1]}"
+
+    def is_done(self, window):
+        return self.key(window) in self.completed
+
+    def mark_done(self, window):
+        with self._lock:
+            self.completed.add(self.key(window))
+            self.empty.discard(self.key(window))
+            self._save()
+
+    def mark_empty(self, window):
+        """窗口没有数据，记录下来但不算作已完成"""
+        with self._lock:
+            self.empty.add(self.key(window))
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"completed": sorted(self.completed), "empty": sorted(self.empty)}, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+class EarningsBackfill:
+    def __init__(self, start, end, window="week", output_dir="./data", max_parallel=2,
+                 min_interval=3.0, checkpoint_path=None, pool=None, store=None, sessions=None):
+        self.windows = split_windows(start, end, window)
+        self.output_dir = output_dir
+        self.max_parallel = max(1, max_parallel)
+        self.min_interval = min_interval
+        self.pool = pool or BrowserPool(max_contexts=self.max_parallel)
+        self.sessions = sessions or get_session_pool()
+        self.store = store or CrawlStore(os.path.join(output_dir, "crawl_data.db"))
+
+        os.makedirs(output_dir, exist_ok=True)
+        if checkpoint_path is None:
+            checkpoint_path = os.path.join(
+                output_dir, f"investing_backfill_{start.isoformat()}_{end.isoformat()}_{window}.json")
+        self.checkpoint = Checkpoint(checkpoint_path)
+
+        # 所有线程共享的请求间隔，保证对站点的请求频率不超过 1 / min_interval
+        self._rate_lock = threading.Lock()
+        self._next_request = 0.0
+        self.failed = []
+        self.empty = []
+
+    def _wait_turn(self):
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _worker(self, pending):
+        """每个线程租用一个会话和 context、打开一次日历页面，依次处理队列中的窗口"""
+        try:
+            with self.sessions.lease() as session, self.pool.lease(**session.context_options()) as context:
+                crawler = InvestingEarningsCrawler(output_dir=self.output_dir, context=context,
+                                                   store=self.store, sessions=self.sessions, session=session)
+                page = crawler.open_calendar_page()
+                try:
+                    while True:
+                        try:
+                            window = pending.get_nowait()
+                        except queue.Empty:
+                            return
+                        self._wait_turn()
+                        try:
+                            data = crawler.extract_earnings_range(page, *window)
+                            if not crawler.fill_dates(data.get("earnings_dates", [])):
+                                logger.warning(f"窗口 {window[0]} ~ {window[1]} 没有数据，不记为完成")
+                                self.checkpoint.mark_empty(window)
+                                self.empty.append(window)
+                                continue
+                            if not crawler.save_data(data, source="investing_backfill"):
+                                raise RuntimeError("数据保存失败")
+                            self.checkpoint.mark_done(window)
+                        except Exception as e:
+                            logger.error(f"窗口 {window[0]} ~ {window[1]} 爬取失败: {str(e)}")
+                            self.failed.append(window)
+                finally:
+                    page.close()
+        finally:
+            # 回填线程结束后不再复用，关闭该线程的浏览器
+            self.pool.close_thread()
+
+    def run(self):
+        pending = queue.Queue()
+        todo = [w for w in self.windows if not self.checkpoint.is_done(w)]
+        for window in todo:
+            pending.put(window)
+
+        logger.info(f"共 {len(self.windows)} 个窗口，已完成 {len(self.windows) - len(todo)} 个，"
+                    f"待爬取 {len(todo)} 个，并发 {self.max_parallel}")
+        if not todo:
+            return True
+
+        # 每个线程独占一个会话
+        workers = min(self.max_parallel, len(todo), len(self.sessions.sessions))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as executor:
+            futures = [executor.submit(self._worker, pending) for _ in range(workers)]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"回填线程异常退出: {str(e)}")
+
+        remaining = [w for w in self.windows if not self.checkpoint.is_done(w)]
+        if self.empty:
+            logger.warning(f"{len(self.empty)} 个窗口没有数据（可能被软封，或该时间段没有财报），"
+                           f"已记录在检查点的 empty 中")
+        if remaining:
+            logger.warning(f"仍有 {len(remaining)} 个窗口未完成，重新运行即可从检查点继续")
+        else:
+            logger.info("历史回填完成")
+        return not remaining
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="回填 Investing.com 历史财报日历")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="开始日期 YYYY-MM-DD")
+    parser.add_argument("--end", required=True, type=date.fromisoformat, help="结束日期 YYYY-MM-DD")
+    parser.add_argument("--window", choices=sorted(WINDOW_DAYS), default="week", help="窗口大小")
+    parser.add_argument("--parallel", type=int, default=2, help="并行爬取的窗口数")
+    parser.add_argument("--interval", type=float, default=3.0, help="两次请求之间的最小间隔（秒）")
+    parser.add_argument("--output-dir", default="./data", help="数据目录")
+    parser.add_argument("--checkpoint", default=None, help="检查点文件路径")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    backfill = EarningsBackfill(args.start, args.end, window=args.window, output_dir=args.output_dir,
+                                max_parallel=args.parallel, min_interval=args.interval,
+                                checkpoint_path=args.checkpoint)
+    try:
+        backfill.run()
+    finally:
+        backfill.pool.close()
@@ -7,10 +7,23 @@ Date: 2025-02-26
 
 import os
 import csv
-import json
 import logging
+import re
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.parse import urlsplit
 from crawl4ai import WebCrawler
+from resource_blocker import ResourceBlocker
+from extraction_schemas import INVESTING_SCHEMA, fill_earnings_dates
+from page_extraction import extract_from_page
+from datastore import CrawlStore, TABLES
+from change_capture import ChangeLog
+from investing_fastpath import FILTER_ENDPOINT, FastPathBlocked, InvestingAjaxFetcher, range_form
+from rate_limiter import THROTTLE_STATUSES, get_rate_limiter, goto, is_challenge
+from session_pool import SessionBlocked, get_session_pool
+from page_archive import archive_response, get_page_archive
+import instrumentation
 
 # 设置日志
 logging.basicConfig(
@@ -23,131 +36,310 @@ logging.basicConfig(
 )
 logger = logging.getLogger("investing_crawler")
 
+# 在页面内调用筛选接口（带上页面的 cookies），把返回的表格行替换进日历表格
+LOAD_RANGE_JS = """
+async ({endpoint, form, maxPages}) => {
+    let html = "";
+    let truncated = true;
+    for (let pageIndex = 0; pageIndex < maxPages; pageIndex++) {
+        const body = new URLSearchParams(Object.assign({}, form, {limit_from: String(pageIndex)}));
+        const resp = await fetch(endpoint, {
+            method: "POST",
+            body: body,
+            credentials: "include",
+            headers: {"X-Requested-With": "XMLHttpRequest"}
+        });
+        if (!resp.ok) {
+            throw new Error("HTTP " + resp.status);
+        }
+        const result = await resp.json();
+        html += result.data || "";
+        if (!result.bind_scroll_handler) {
+            truncated = false;
+            break;
+        }
+    }
+    document.querySelector(".earningsCalendarDiv table tbody").innerHTML = html;
+    return truncated;
+}
+"""
+
 class InvestingEarningsCrawler:
-    def __init__(self, output_dir="./data"):
+    def __init__(self, output_dir="./data", context=None, store=None, write_csv_snapshots=False,
+                 fetcher=None, use_fast_path=True, lease=None, rate_limiter=None,
+                 sessions=None, session=None, change_log=None):
         self.url = "https://www.investing.com/earnings-calendar/"
+        self.host = urlsplit(self.url).hostname
         self.output_dir = output_dir
+        self.timeout = 90  # 增加超时时间，因为页面加载可能较慢
+        # User-Agent 和 Cookie 由会话池提供
+        self.headers = {
+            "Accept-Language": "en-US,en;q=0.9",
+            "Referer": "https://www.investing.com/"
+        }
+        
+        # 每次爬取按健康度租用一个会话（Cookie、User-Agent、代理）；
+        # 传入 session 时表示调用方已用该会话创建了 context，直接使用
+        self.sessions = sessions or get_session_pool()
+        self.session = session
         
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         
-        # 初始化爬虫
-        self.crawler = WebCrawler(
-            javascript=True,  # Investing.com需要JavaScript渲染
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Referer": "https://www.investing.com/"
-            },
-            timeout=90,  # 增加超时时间，因为页面加载可能较慢
-            cookies={
-                "adBlockerNewUserDomains": "1633094489",  # 可能需要一些cookies来避免反爬
-                "PHPSESSID": "random_session_id"
-            }
-        )
+        # 按 (date, symbol) 增量写入数据库，可选保留带时间戳的 CSV 快照
+        self.store = store or CrawlStore(os.path.join(output_dir, "crawl_data.db"))
+        self.write_csv_snapshots = write_csv_snapshots
+        
+        # 与上一次保存的数据相比的逐行变化写入变更流
+        self.change_log = change_log or ChangeLog(os.path.join(output_dir, "changes.jsonl"))
+        
+        # 屏蔽图片、字体、视频和广告/追踪请求，只保留渲染表格所需的资源
+        self.blocker = ResourceBlocker.for_source("investing")
+        
+        # 按主机自适应限速，与快速通道共用同一个限速器
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        
+        # 优先直接请求日历的筛选接口，失败时才渲染页面
+        self.fetcher = fetcher
+        if self.fetcher is None and use_fast_path:
+            self.fetcher = InvestingAjaxFetcher(headers=self.headers, rate_limiter=self.rate_limiter)
+        
+        # 传入浏览器池租用的 context 时直接复用；传入 lease（如 BrowserPool.lease）时
+        # 只在需要回退到渲染时才租用；都没有时才启动 crawl4ai 浏览器
+        self.context = context
+        self.lease = lease
+        self.crawler = None
+
+    @contextmanager
+    def _session_scope(self):
+        """使用传入的会话，没有时从会话池租用一个"""
+        if self.session is not None:
+            yield self.session
+        else:
+            with self.sessions.lease() as session:
+                yield session
+
+    def _get_crawler(self, session):
+        if self.crawler is None:
+            self.crawler = WebCrawler(
+                javascript=True,  # Investing.com需要JavaScript渲染
+                headers=dict(self.headers, **session.headers()),
+                timeout=self.timeout,
+                cookies=session.cookies_for(self.host)
+            )
+            self.blocker.install_on_crawler(self.crawler)
+        return self.crawler
 
     def extract_earnings_data(self):
         """提取财报日历数据"""
         logger.info(f"开始爬取 {self.url}")
         
-        # 配置提取规则
-        self.crawler.extract({
-            "earnings_dates": {
-                "selector": ".earningsCalendarDiv table tbody tr",
-                "multiple": True,
-                "data": {
-                    "date": {
-                        "selector": ".theDay",
-                        "processor": "text"
-                    },
-                    "country": {
-                        "selector": "td:nth-child(2) span",
-                        "attribute": "title"
-                    },
-                    "company_name": "td.symbolColumn a",
-                    "symbol": {
-                        "selector": "td.symbolColumn span",
-                        "processor": "text"
-                    },
-                    "eps_forecast": "td.eps.bold",
-                    "eps_actual": "td.actual.bold",
-                    "revenue_forecast": "td.rev.bold",
-                    "revenue_actual": "td.actualRev.bold",
-                    "market_cap": "td.marketCap"
-                }
-            },
-            # 提取当前日期范围信息
-            "current_period": ".currentDateView"
-        })
+        if self.fetcher is not None:
+            results = self._crawl_fast_path()
+            if results is not None:
+                return results
         
         # 执行爬取
         try:
-            # 等待页面加载完成
-            self.crawler.wait_for(".earningsCalendarDiv table")
-            
-            # 可能需要点击某些按钮来显示更多数据
-            # self.crawler.click(".showMoreButton")
-            
-            results = self.crawler.crawl(self.url)
+            if self.context is not None:
+                with self._session_scope() as session:
+                    results = self._crawl_with_context(session)
+            elif self.lease is not None:
+                with self._session_scope() as session, self.lease(**session.context_options()) as context:
+                    self.context = context
+                    try:
+                        results = self._crawl_with_context(session)
+                    finally:
+                        self.context = None
+            else:
+                with self._session_scope() as session:
+                    results = self._crawl_with_crawler(session)
             logger.info(f"成功爬取数据，获取到 {len(results.get('earnings_dates', []))} 条财报记录")
+            instrumentation.count("investing", "rows_extracted", len(results.get("earnings_dates", [])))
             return results
         except Exception as e:
             logger.error(f"爬取过程中发生错误: {str(e)}")
             return {"earnings_dates": [], "current_period": ""}
 
-    def save_data(self, data):
-        """保存爬取的数据"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    def _crawl_with_crawler(self, session):
+        """没有浏览器池时由 crawl4ai 启动浏览器爬取（不支持会话代理）"""
+        crawler = self._get_crawler(session)
+        crawler.extract(INVESTING_SCHEMA)
+        # 等待页面加载完成
+        crawler.wait_for(".earningsCalendarDiv table")
+        
+        # 可能需要点击某些按钮来显示更多数据
+        # crawler.click(".showMoreButton")
         
-        # 保存为CSV
-        csv_file = os.path.join(self.output_dir, f"investing_earnings_data_{timestamp}.csv")
+        # crawl4ai 内部完成导航和提取，无法分开计时
+        self.rate_limiter.acquire(self.url)
+        started = time.monotonic()
+        with instrumentation.stage("investing", "navigation"):
+            results = crawler.crawl(self.url)
+        self.rate_limiter.record(self.url, latency=time.monotonic() - started)
+        return results
+
+    def _crawl_fast_path(self):
+        """通过筛选接口获取数据，失败或没有数据时返回 None"""
         try:
-            with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-                if not data.get("earnings_dates"):
-                    logger.warning("没有数据可以保存")
-                    return
-                
-                fieldnames = ["date", "country", "company_name", "symbol", "eps_forecast", 
-                              "eps_actual", "revenue_forecast", "revenue_actual", "market_cap"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                for earning in data.get("earnings_dates", []):
-                    writer.writerow(earning)
-            
-            logger.info(f"数据已保存到 {csv_file}")
-            
-            # 同时保存一份最新数据的副本
-            latest_csv = os.path.join(self.output_dir, "latest_earnings_data.csv")
-            with open(latest_csv, 'w', newline='', encoding='utf-8') as f:
-                fieldnames = ["date", "country", "company_name", "symbol", "eps_forecast", 
-                              "eps_actual", "revenue_forecast", "revenue_actual", "market_cap"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                for earning in data.get("earnings_dates", []):
-                    writer.writerow(earning)
-            
-            # 保存元数据
-            metadata = {
-                "crawl_time": datetime.now().isoformat(),
-                "period": data.get("current_period", ""),
-                "earnings_count": len(data.get("earnings_dates", [])),
-                "source_url": self.url
-            }
+            with self._session_scope() as session:
+                started = time.monotonic()
+                try:
+                    results = self.fetcher.fetch_current(session=session)
+                except FastPathBlocked:
+                    self.sessions.report(session, ok=False, blocked=True)
+                    raise
+                self.sessions.report(session, ok=bool(results.get("earnings_dates")),
+                                     latency=time.monotonic() - started)
+        except Exception as e:
+            logger.warning(f"快速通道请求失败，回退到页面渲染: {str(e)}")
+            return None
+        if not results.get("earnings_dates"):
+            logger.warning("快速通道没有返回数据，回退到页面渲染")
+            return None
+        logger.info(f"快速通道获取到 {len(results['earnings_dates'])} 条财报记录")
+        instrumentation.count("investing", "rows_extracted", len(results["earnings_dates"]))
+        return results
+
+    def _crawl_with_context(self, session=None):
+        """使用浏览器池租用的 context 渲染页面并提取数据"""
+        page = self.open_calendar_page(session)
+        try:
+            with instrumentation.stage("investing", "extraction"):
+                return extract_from_page(page, INVESTING_SCHEMA)
+        finally:
+            page.close()
+
+    def open_calendar_page(self, session=None):
+        """
+        在租用的 context 中打开财报日历页面，调用方负责关闭页面
+        会话被封（限流状态码或验证页面）时立即抛出 SessionBlocked，不再等待表格超时
+        """
+        session = session or self.session
+        self.blocker.attach(self.context)
+        headers = dict(self.headers)
+        if session is not None:
+            self.context.add_cookies(session.browser_cookies(self.host))
+            headers.update(session.headers())
+        page = self.context.new_page()
+        started = time.monotonic()
+        try:
+            page.set_extra_http_headers(headers)
+            with instrumentation.stage("investing", "navigation"):
+                response = goto(page, self.url, limiter=self.rate_limiter, timeout=self.timeout * 1000)
+            archive_response(response, "investing")
+            if response is not None and (response.status in THROTTLE_STATUSES or is_challenge(page.title())):
+                raise SessionBlocked(f"会话 {session.id if session else '-'} 被封: HTTP {response.status}")
+            with instrumentation.stage("investing", "wait_for"):
+                page.wait_for_selector(".earningsCalendarDiv table", timeout=self.timeout * 1000)
+        except Exception as e:
+            page.close()
+            if session is not None:
+                self.sessions.report(session, ok=False, blocked=isinstance(e, SessionBlocked))
+            raise
+        if session is not None:
+            self.sessions.report(session, ok=True, latency=time.monotonic() - started)
+            session.update_from_browser(self.context.cookies())
+        return page
+
+    def extract_earnings_range(self, page, date_from, date_to, max_pages=20):
+        """
+        在已打开的日历页面中获取指定日期范围的财报数据
+        通过页面内调用筛选接口加载表格，再用同一份提取规则解析
+        """
+        logger.info(f"开始爬取 {date_from} ~ {date_to} 的财报数据")
+        self.rate_limiter.acquire(self.url)
+        started = time.monotonic()
+        try:
+            truncated = page.evaluate(LOAD_RANGE_JS, {
+                "endpoint": FILTER_ENDPOINT,
+                "form": range_form(date_from, date_to),
+                "maxPages": max_pages
+            })
+        except Exception as e:
+            # 页面内 fetch 失败时错误信息为 "HTTP <状态码>"
+            match = re.search(r"HTTP (\d{3})", str(e))
+            if match and int(match.group(1)) in THROTTLE_STATUSES:
+                self.rate_limiter.record(self.url, int(match.group(1)))
+                if self.session is not None:
+                    self.sessions.report(self.session, ok=False, blocked=True)
+            raise
+        self.rate_limiter.record(self.url, latency=time.monotonic() - started)
+        archive = get_page_archive()
+        if archive is not None:
+            # 页面内加载的表格没有单独的响应，保存渲染后的页面
+            try:
+                archive.store(f"{self.url}?dateFrom={date_from}&dateTo={date_to}", page.content(), "investing")
+            except Exception as e:
+                logger.warning(f"保存页面失败: {str(e)}")
+        results = extract_from_page(page, INVESTING_SCHEMA)
+        results["current_period"] = f"{date_from} - {date_to}"
+        results["truncated"] = truncated
+        logger.info(f"{date_from} ~ {date_to} 获取到 {len(results.get('earnings_dates', []))} 条财报记录")
+        return results
+
+    @staticmethod
+    def fill_dates(rows):
+        """把日期行的日期向下填充到公司行，见 extraction_schemas.fill_earnings_dates"""
+        return fill_earnings_dates(rows)
+
+    def records_to_save(self, data):
+        """要保存的财报记录，日期行已向下填充并去掉"""
+        return self.fill_dates(data.get("earnings_dates", []))
+
+    def save_data(self, data, source="investing"):
+        """
+        保存爬取的数据，source 用于区分日常爬取和历史回填
+        写入失败时返回 False
+        """
+        earnings = self.records_to_save(data)
+        if not earnings:
+            logger.warning("没有数据可以保存")
+            return True
+        
+        try:
+            with instrumentation.stage("investing", "save"):
+                # 只有确认数据完整（筛选接口翻页到了最后一页）时才判断移除；
+                # 页面渲染的结果可能只包含滚动加载前的部分
+                result = self.store.upsert("earnings_data", earnings,
+                                           remove_missing=data.get("truncated") is False,
+                                           change_source=source)
+                self.store.record_run(source, "earnings_data", result, {
+                    "period": data.get("current_period", ""),
+                    "source_url": self.url
+                })
+                logger.info(f"数据已保存到 {self.store.path}: 新增 {result['inserted']} 条，"
+                            f"更新 {result['updated']} 条，未变化 {result['unchanged']} 条，"
+                            f"移除 {result['removed']} 条")
+                self.change_log.drain(self.store)
             
-            with open(os.path.join(self.output_dir, f"investing_metadata_{timestamp}.json"), 'w') as f:
-                json.dump(metadata, f, indent=4)
+                if self.write_csv_snapshots:
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    csv_file = os.path.join(self.output_dir, f"investing_earnings_data_{timestamp}.csv")
+                    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
+                        writer = csv.DictWriter(f, fieldnames=TABLES["earnings_data"]["fields"],
+                                                extrasaction="ignore")
+                        writer.writeheader()
+                        writer.writerows(earnings)
+                    logger.info(f"CSV 快照已保存到 {csv_file}")
+            instrumentation.count("investing", "rows_saved", len(earnings))
+            return True
                 
         except Exception as e:
             logger.error(f"保存数据时发生错误: {str(e)}")
+            return False
 
     def run(self):
-        """执行爬虫流程"""
+        """执行爬虫流程，返回爬取到的记录条数，保存失败时抛出异常以便执行器重试"""
         logger.info("开始执行 Investing.com 财报日历爬虫任务")
         data = self.extract_earnings_data()
-        self.save_data(data)
+        if not self.save_data(data):
+            raise RuntimeError("Investing.com 数据保存失败")
+        self.blocker.log_stats()
+        self.rate_limiter.log_stats()
+        self.sessions.log_stats()
         logger.info("爬虫任务完成")
+        return len(self.records_to_save(data))
 
 
 if __name__ == "__main__":
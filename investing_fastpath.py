@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Investing.com 财报日历的免浏览器快速通道
+日历表格由 POST 筛选接口返回的 HTML 片段填充，这里直接调用该接口（复用 keep-alive 连接），
+用与 extract_earnings_data 相同的提取规则解析片段，不需要启动浏览器渲染整个页面。
+失败时由 InvestingEarningsCrawler 回退到浏览器渲染。
+
+base_url 可以指向 replay_server 启动的本地回放服务器，便于离线测试
+传入 session_pool.Session 时使用会话的 User-Agent、Cookie 和代理，并把服务器设置的 Cookie 写回会话
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import gzip
+import http.client
+import json
+import logging
+import queue
+import threading
+import time
+import zlib
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from extraction_schemas import INVESTING_SCHEMA
+from html_extraction import extract_from_html
+import instrumentation
+from page_archive import get_page_archive
+from rate_limiter import THROTTLE_STATUSES, get_rate_limiter, is_challenge, retry_after_seconds
+
+logger = logging.getLogger("investing_fastpath")
+
+FILTER_ENDPOINT = "/earnings-calendar/Service/getCalendarFilteredData"
+
+# 接口只返回 <tr> 片段，套上日历页面的外层结构后即可直接使用页面的提取规则
+FRAGMENT_WRAPPER = '<div class="earningsCalendarDiv"><table><tbody>{rows}</tbody></table></div>'
+
+
+def range_form(date_from, date_to):
+    """筛选接口按日期范围查询的表单参数，日期格式为 YYYY-MM-DD"""
+    return {"dateFrom": date_from, "dateTo": date_to, "currentTab": "custom"}
+
+
+class FastPathError(Exception):
+    """快速通道请求或解析失败"""
+
+
+class FastPathBlocked(FastPathError):
+    """筛选接口返回限流状态码或验证页面，当前会话可能已被封"""
+
+
+class ConnectionPool:
+    """同一主机的 keep-alive 连接池，proxy 为 http://host:port 时经代理连接"""
+
+    def __init__(self, base_url, size=4, timeout=30, proxy=None):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.origin = f"{self.scheme}://{parts.netloc}"
+        self.proxy = urlsplit(proxy) if proxy else None
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _new_connection(self):
+        if self.proxy is not None:
+            if self.scheme == "https":
+                # HTTPS 经代理的 CONNECT 隧道
+                conn = http.client.HTTPSConnection(self.proxy.hostname, self.proxy.port, timeout=self.timeout)
+                conn.set_tunnel(self.host, self.port)
+                return conn
+            return http.client.HTTPConnection(self.proxy.hostname, self.proxy.port, timeout=self.timeout)
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        发送请求并读取完整响应，返回 (status, headers, body)
+        headers 是 http.client.HTTPMessage，可以用 get_all 读取多个 Set-Cookie
+        复用的连接可能已被服务器关闭，失败时用新连接重试一次
+        """
+        if self.proxy is not None and self.scheme == "http":
+            # 普通 HTTP 经代理时请求行使用完整 URL
+            path = self.origin + path
+        for attempt in range(2):
+            try:
+                conn = self._idle.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn = self._new_connection()
+                reused = False
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            return response.status, response.msg, data
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _decode_body(headers, data):
+    encoding = {k.lower(): v for k, v in headers.items()}.get("content-encoding", "").lower()
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "deflate":
+        return zlib.decompress(data)
+    return data
+
+
+class InvestingAjaxFetcher:
+    def __init__(self, base_url="https://www.investing.com", headers=None, cookies=None,
+                 pool_size=4, timeout=30, max_pages=20, current_tab="thisWeek", recorder=None,
+                 rate_limiter=None, archive=None):
+        self.base_url = base_url.rstrip("/")
+        self.current_tab = current_tab
+        self.headers = dict(headers or {})
+        self.cookies = dict(cookies or {})
+        self.max_pages = max_pages
+        # 传入 replay_server.Recorder 时保存收到的响应，供之后离线回放
+        self.recorder = recorder
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        # 每个响应保存到页面存档，之后可以离线重新解析
+        self.archive = archive or get_page_archive()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.pool = ConnectionPool(self.base_url, size=pool_size, timeout=timeout)
+        # 使用代理的会话各自一个连接池
+        self._proxy_pools = {}
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.bytes_received = 0
+
+    def _pool_for(self, session):
+        if session is None or not session.proxy:
+            return self.pool
+        with self._lock:
+            pool = self._proxy_pools.get(session.proxy)
+            if pool is None:
+                pool = self._proxy_pools[session.proxy] = ConnectionPool(
+                    self.base_url, size=self.pool_size, timeout=self.timeout, proxy=session.proxy)
+            return pool
+
+    def _request_headers(self, session=None):
+        headers = {
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "Accept-Encoding": "gzip, deflate",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer": f"{self.base_url}/earnings-calendar/",
+            "Connection": "keep-alive"
+        }
+        headers.update(self.headers)
+        cookies = dict(self.cookies)
+        if session is not None:
+            headers.update(session.headers())
+            cookies.update(session.cookies_for(urlsplit(self.base_url).hostname))
+        if cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+        return headers
+
+    def _store_cookies(self, session, headers):
+        """把响应中的 Set-Cookie 写回会话"""
+        jar = SimpleCookie()
+        for value in headers.get_all("Set-Cookie") or []:
+            try:
+                jar.load(value)
+            except Exception:
+                continue
+        for morsel in jar.values():
+            domain = morsel["domain"] or urlsplit(self.base_url).hostname
+            session.update_cookies(domain, {morsel.key: morsel.value})
+
+    def _post(self, form, session=None):
+        self.rate_limiter.acquire(self.base_url)
+        started = time.monotonic()
+        try:
+            status, headers, data = self._pool_for(session).request(
+                "POST", FILTER_ENDPOINT, body=urlencode(form), headers=self._request_headers(session))
+        except Exception:
+            self.rate_limiter.record(self.base_url, None, time.monotonic() - started, error=True)
+            raise
+        latency = time.monotonic() - started
+        if session is not None:
+            self._store_cookies(session, headers)
+        with self._lock:
+            self.requests_sent += 1
+            self.bytes_received += len(data)
+        instrumentation.count("investing", "bytes_downloaded", len(data))
+        if status != 200:
+            self.rate_limiter.record(self.base_url, status, latency, retry_after=retry_after_seconds(headers))
+            if status in THROTTLE_STATUSES:
+                raise FastPathBlocked(f"筛选接口返回 HTTP {status}")
+            raise FastPathError(f"筛选接口返回 HTTP {status}")
+        body = _decode_body(headers, data)
+        if self.archive is not None:
+            try:
+                self.archive.store(f"{self.base_url}{FILTER_ENDPOINT}?{urlencode(form)}", body, "investing_ajax",
+                                   status=status, content_type=headers.get("Content-Type", ""))
+            except Exception as e:
+                logger.warning(f"保存筛选接口响应失败: {str(e)}")
+        if self.recorder is not None:
+            self.recorder.add("POST", FILTER_ENDPOINT, body, status=status, match=form,
+                              headers={"Content-Type": headers.get("Content-Type", "application/json")},
+                              extension="json")
+        try:
+            result = json.loads(body)
+        except ValueError as e:
+            challenge = is_challenge(body)
+            self.rate_limiter.record(self.base_url, status, latency, challenge=challenge)
+            if challenge:
+                raise FastPathBlocked("筛选接口返回了验证页面")
+            raise FastPathError(f"筛选接口返回的不是 JSON（可能是验证页面）: {str(e)}")
+        self.rate_limiter.record(self.base_url, status, latency)
+        return result
+
+    def fetch(self, form, period="", session=None):
+        """
+        按表单参数请求筛选接口（自动翻页），返回与 extract_earnings_data 相同结构的结果
+        """
+        with instrumentation.stage("investing", "fetch"):
+            html, truncated = self.fetch_html(form, period, session)
+        with instrumentation.stage("investing", "extraction"):
+            data = extract_from_html(html, INVESTING_SCHEMA)
+        data["current_period"] = period
+        data["truncated"] = truncated
+        return data
+
+    def fetch_html(self, form, period="", session=None):
+        """
+        请求筛选接口（自动翻页），返回 (拼接成日历表格的 HTML, 是否因达到翻页上限而不完整)
+        """
+        rows = []
+        truncated = True
+        for page_index in range(self.max_pages):
+            result = self._post(dict(form, limit_from=str(page_index)), session)
+            rows.append(result.get("data") or "")
+            if not result.get("bind_scroll_handler"):
+                truncated = False
+                break
+        if truncated:
+            logger.warning(f"{period} 翻页达到上限 {self.max_pages} 页，数据可能不完整")
+
+        return FRAGMENT_WRAPPER.format(rows="".join(rows)), truncated
+
+    def fetch_current(self, session=None):
+        """获取日历默认展示的时间段（current_tab，如 thisWeek）"""
+        return self.fetch({"currentTab": self.current_tab}, period=self.current_tab, session=session)
+
+    def fetch_range(self, date_from, date_to, session=None):
+        """获取指定日期范围（YYYY-MM-DD）的财报数据"""
+        return self.fetch(range_form(date_from, date_to), period=f"{date_from} - {date_to}", session=session)
+
+    def close(self):
+        self.pool.close()
+        with self._lock:
+            pools = list(self._proxy_pools.values())
+        for pool in pools:
+            pool.close()
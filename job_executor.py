@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+调度任务的并发执行器
+- 任务在线程池中并发执行，一个数据源卡住不会拖延其他数据源
+- 同一个任务（调度器中任务名即数据源名）同时只有一次执行
+- 每次执行有超时时间，失败后按 retry_interval * 2^n 指数退避重试 retry_times 次
+- 同一个任务上一次执行尚未结束时，跳过本次触发
+
+Python 线程无法被强制终止：执行超时后调度器不再等待该次执行、记为失败且不再重试，
+但该任务的运行标记要等这次执行真正结束后才会释放。
+线程池中的工作线程都被超时的执行占用时，新的执行在排队超过 queue_timeout 后同样记为超时
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import instrumentation
+
+logger = logging.getLogger("job_executor")
+
+
+class JobExecutor:
+    def __init__(self, max_workers=4, job_timeout=600, queue_timeout=None, retry_times=3,
+                 retry_interval=5, max_retry_interval=300):
+        self.max_workers = max_workers
+        self.job_timeout = job_timeout
+        # 在线程池中等待开始执行的最长时间，默认与 job_timeout 相同
+        self.queue_timeout = job_timeout if queue_timeout is None else queue_timeout
+        self.retry_times = retry_times
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+
+        # 工作线程长期存在，线程内的浏览器（见 browser_pool）可以在任务之间复用
+        self._workers = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawl-job")
+        self._lock = threading.Lock()
+        self._running = set()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据 config.json 创建，重试参数使用顶层的 retry_times / retry_interval"""
+        executor_config = config.get("executor", {})
+        return cls(
+            max_workers=executor_config.get("max_workers", 4),
+            job_timeout=executor_config.get("job_timeout", 600),
+            queue_timeout=executor_config.get("queue_timeout"),
+            retry_times=config.get("retry_times", 3),
+            retry_interval=config.get("retry_interval", 5),
+            max_retry_interval=executor_config.get("max_retry_interval", 300)
+        )
+
+    def is_running(self, name):
+        with self._lock:
+            return name in self._running
+
+    def submit(self, name, source, func, *args, **kwargs):
+        """
+        提交一个任务，立即返回
+        上一次执行尚未结束时跳过并返回 False
+        """
+        with self._lock:
+            if name in self._running:
+                logger.warning(f"任务 {name} 上一次执行尚未结束，跳过本次触发")
+                self._emit(name, source, "skipped")
+                return False
+            self._running.add(name)
+
+        thread = threading.Thread(target=self._supervise, args=(name, source, func, args, kwargs),
+                                  name=f"supervise-{name}", daemon=True)
+        thread.start()
+        return True
+
+    def _supervise(self, name, source, func, args, kwargs):
+        """执行任务并负责超时和重试，任务真正结束后才释放运行标记"""
+        release_on_exit = True
+        try:
+            for attempt in range(self.retry_times + 1):
+                started = threading.Event()
+
+                def attempt_job():
+                    started.set()
+                    return func(*args, **kwargs)
+
+                future = self._workers.submit(attempt_job)
+                # 超时从任务真正开始执行时计算，不包括在线程池中排队的时间；
+                # 排队超过 queue_timeout（工作线程都被超时的执行占用）时取消并记为超时
+                if not started.wait(self.queue_timeout) and future.cancel():
+                    logger.error(f"任务 {name} 排队超过 {self.queue_timeout}s 仍未开始执行，放弃本次执行")
+                    self._emit(name, source, "timeout", seconds=self.queue_timeout,
+                               attempt=attempt, cause="QueueTimeout")
+                    return
+                started.wait()
+                started_at = time.monotonic()
+                try:
+                    future.result(timeout=self.job_timeout)
+                    elapsed = time.monotonic() - started_at
+                    logger.info(f"任务 {name} 执行成功，用时 {elapsed:.1f}s")
+                    self._emit(name, source, "success", seconds=elapsed, attempt=attempt)
+                    return
+                except FutureTimeoutError:
+                    # 超时的执行仍在后台运行，等它结束后再释放运行标记
+                    logger.error(f"任务 {name} 执行超过 {self.job_timeout}s，放弃本次执行")
+                    self._emit(name, source, "timeout", seconds=time.monotonic() - started_at,
+                               attempt=attempt, cause="JobTimeout")
+                    release_on_exit = False
+                    future.add_done_callback(lambda _: self._finish_abandoned(name))
+                    return
+                except Exception as e:
+                    logger.error(f"任务 {name} 第 {attempt + 1} 次执行失败: {str(e)}")
+                    self._emit(name, source, "failed", seconds=time.monotonic() - started_at,
+                               attempt=attempt, cause=type(e).__name__)
+
+                if attempt < self.retry_times:
+                    delay = min(self.retry_interval * (2 ** attempt), self.max_retry_interval)
+                    logger.info(f"任务 {name} 将在 {delay}s 后重试")
+                    instrumentation.emit({"type": "retry", "job": name, "source": source,
+                                          "attempt": attempt + 1, "delay": delay})
+                    time.sleep(delay)
+
+            logger.error(f"任务 {name} 重试 {self.retry_times} 次后仍然失败")
+        finally:
+            if release_on_exit:
+                with self._lock:
+                    self._running.discard(name)
+
+    def _emit(self, name, source, status, seconds=None, attempt=0, cause=None):
+        """发出任务执行事件，供监控指标统计"""
+        instrumentation.emit({
+            "type": "job",
+            "job": name,
+            "source": source,
+            "status": status,
+            "seconds": seconds,
+            "attempt": attempt,
+            "cause": cause
+        })
+
+    def _finish_abandoned(self, name):
+        with self._lock:
+            self._running.discard(name)
+        logger.info(f"超时的任务 {name} 已结束")
+
+    def shutdown(self, wait=True):
+        self._workers.shutdown(wait=wait)
@@ -7,10 +7,20 @@ Date: 2025-02-26
 
 import os
 import csv
-import json
 import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from crawl4ai import WebCrawler
+from resource_blocker import ResourceBlocker
+from extraction_schemas import MARKETWATCH_SCHEMA
+from page_extraction import extract_from_page
+from datastore import CrawlStore, TABLES
+from change_capture import ChangeLog
+from rate_limiter import THROTTLE_STATUSES, get_rate_limiter, goto, is_challenge
+from session_pool import SessionBlocked, get_session_pool
+from page_archive import archive_response
+import instrumentation
 
 # 设置日志
 logging.basicConfig(
@@ -24,107 +34,170 @@ logging.basicConfig(
 logger = logging.getLogger("marketwatch_crawler")
 
 class MarketWatchCrawler:
-    def __init__(self, output_dir="./data"):
+    def __init__(self, output_dir="./data", context=None, store=None, write_csv_snapshots=False,
+                 rate_limiter=None, sessions=None, session=None, change_log=None):
         self.url = "https://www.marketwatch.com/economy-politics/calendar"
+        self.host = "www.marketwatch.com"
         self.output_dir = output_dir
+        self.timeout = 60
+        # User-Agent 和 Cookie 由会话池提供
+        self.headers = {
+            "Accept-Language": "en-US,en;q=0.9",
+            "Referer": "https://www.marketwatch.com/"
+        }
+        
+        # 每次爬取按健康度租用一个会话；传入 session 时表示调用方已用该会话创建了 context
+        self.sessions = sessions or get_session_pool()
+        self.session = session
         
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         
-        # 初始化爬虫
-        self.crawler = WebCrawler(
-            javascript=True,  # MarketWatch可能需要JavaScript渲染
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Referer": "https://www.marketwatch.com/"
-            },
-            timeout=60
-        )
+        # 按 (date, time, event) 增量写入数据库，可选保留带时间戳的 CSV 快照
+        self.store = store or CrawlStore(os.path.join(output_dir, "crawl_data.db"))
+        self.write_csv_snapshots = write_csv_snapshots
+        
+        # 与上一次保存的数据相比的逐行变化写入变更流
+        self.change_log = change_log or ChangeLog(os.path.join(output_dir, "changes.jsonl"))
+        
+        # 屏蔽图片、字体、视频和广告/追踪请求，只保留渲染表格所需的资源
+        self.blocker = ResourceBlocker.for_source("marketwatch")
+        
+        # 按主机自适应限速，所有爬虫共用同一个限速器
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        
+        # 传入浏览器池租用的 context 时直接复用，不再启动新的浏览器
+        self.context = context
+        self.crawler = None
+
+    @contextmanager
+    def _session_scope(self):
+        """使用传入的会话，没有时从会话池租用一个"""
+        if self.session is not None:
+            yield self.session
+        else:
+            with self.sessions.lease() as session:
+                yield session
 
     def extract_economic_data(self):
         """提取经济日历数据"""
         logger.info(f"开始爬取 {self.url}")
         
-        # 配置提取规则
-        self.crawler.extract({
-            "reports": {
-                "selector": "table.calendar__table tr.calendar__row",
-                "multiple": True,
-                "data": {
-                    "date": ".calendar__cell--date",
-                    "time": ".calendar__cell--time",
-                    "event": ".calendar__cell--event",
-                    "actual": ".calendar__cell--actual",
-                    "forecast": ".calendar__cell--forecast",
-                    "previous": ".calendar__cell--previous"
-                }
-            },
-            # 提取日期范围信息
-            "date_range": ".calendar-range"
-        })
-        
         # 执行爬取
         try:
-            self.crawler.wait_for("table.calendar__table")
-            results = self.crawler.crawl(self.url)
+            with self._session_scope() as session:
+                if self.context is not None:
+                    results = self._crawl_with_context(session)
+                else:
+                    results = self._crawl_with_crawler(session)
             logger.info(f"成功爬取数据，获取到 {len(results.get('reports', []))} 条报告")
+            instrumentation.count("marketwatch", "rows_extracted", len(results.get("reports", [])))
             return results
         except Exception as e:
             logger.error(f"爬取过程中发生错误: {str(e)}")
             return {"reports": [], "date_range": ""}
 
+    def _crawl_with_crawler(self, session):
+        """没有浏览器池时由 crawl4ai 启动浏览器爬取（不支持会话代理）"""
+        if self.crawler is None:
+            self.crawler = WebCrawler(
+                javascript=True,  # MarketWatch可能需要JavaScript渲染
+                headers=dict(self.headers, **session.headers()),
+                timeout=self.timeout,
+                cookies=session.cookies_for(self.host)
+            )
+            self.blocker.install_on_crawler(self.crawler)
+        self.crawler.extract(MARKETWATCH_SCHEMA)
+        self.crawler.wait_for("table.calendar__table")
+        # crawl4ai 内部完成导航和提取，无法分开计时
+        self.rate_limiter.acquire(self.url)
+        started = time.monotonic()
+        with instrumentation.stage("marketwatch", "navigation"):
+            results = self.crawler.crawl(self.url)
+        self.rate_limiter.record(self.url, latency=time.monotonic() - started)
+        return results
+
+    def _crawl_with_context(self, session):
+        """
+        使用浏览器池租用的 context 渲染页面并提取数据
+        会话被封（限流状态码或验证页面）时立即抛出 SessionBlocked，不再等待表格超时
+        """
+        self.blocker.attach(self.context)
+        self.context.add_cookies(session.browser_cookies(self.host))
+        page = self.context.new_page()
+        started = time.monotonic()
+        try:
+            page.set_extra_http_headers(dict(self.headers, **session.headers()))
+            with instrumentation.stage("marketwatch", "navigation"):
+                response = goto(page, self.url, limiter=self.rate_limiter, timeout=self.timeout * 1000)
+            archive_response(response, "marketwatch")
+            if response is not None and (response.status in THROTTLE_STATUSES or is_challenge(page.title())):
+                raise SessionBlocked(f"会话 {session.id} 被封: HTTP {response.status}")
+            with instrumentation.stage("marketwatch", "wait_for"):
+                page.wait_for_selector("table.calendar__table", timeout=self.timeout * 1000)
+            self.sessions.report(session, ok=True, latency=time.monotonic() - started)
+            session.update_from_browser(self.context.cookies())
+            with instrumentation.stage("marketwatch", "extraction"):
+                return extract_from_page(page, MARKETWATCH_SCHEMA)
+        except Exception as e:
+            self.sessions.report(session, ok=False, blocked=isinstance(e, SessionBlocked), unless_reported=True)
+            raise
+        finally:
+            page.close()
+
+    @staticmethod
+    def records_to_save(data):
+        """要保存的报告，去掉没有事件名称的行"""
+        return [report for report in data.get("reports", []) if (report.get("event") or "").strip()]
+
     def save_data(self, data):
-        """保存爬取的数据"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        """保存爬取的数据，写入失败时返回 False"""
+        reports = self.records_to_save(data)
+        if not reports:
+            logger.warning("没有数据可以保存")
+            return True
         
-        # 保存为CSV
-        csv_file = os.path.join(self.output_dir, f"marketwatch_economic_data_{timestamp}.csv")
         try:
-            with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-                if not data.get("reports"):
-                    logger.warning("没有数据可以保存")
-                    return
-                
-                fieldnames = ["date", "time", "event", "actual", "forecast", "previous"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                for report in data.get("reports", []):
-                    writer.writerow(report)
-            
-            logger.info(f"数据已保存到 {csv_file}")
-            
-            # 同时保存一份最新数据的副本
-            latest_csv = os.path.join(self.output_dir, "latest_economic_data.csv")
-            with open(latest_csv, 'w', newline='', encoding='utf-8') as f:
-                fieldnames = ["date", "time", "event", "actual", "forecast", "previous"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                for report in data.get("reports", []):
-                    writer.writerow(report)
-            
-            # 保存元数据
-            metadata = {
-                "crawl_time": datetime.now().isoformat(),
-                "date_range": data.get("date_range", ""),
-                "report_count": len(data.get("reports", [])),
-                "source_url": self.url
-            }
+            with instrumentation.stage("marketwatch", "save"):
+                # 页面展示的是完整的日历，本次没有出现的事件视为已移除
+                result = self.store.upsert("economic_data", reports, remove_missing=True,
+                                           change_source="marketwatch")
+                self.store.record_run("marketwatch", "economic_data", result, {
+                    "date_range": data.get("date_range", ""),
+                    "source_url": self.url
+                })
+                logger.info(f"数据已保存到 {self.store.path}: 新增 {result['inserted']} 条，"
+                            f"更新 {result['updated']} 条，未变化 {result['unchanged']} 条，"
+                            f"移除 {result['removed']} 条")
+                self.change_log.drain(self.store)
             
-            with open(os.path.join(self.output_dir, f"metadata_{timestamp}.json"), 'w') as f:
-                json.dump(metadata, f, indent=4)
+                if self.write_csv_snapshots:
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    csv_file = os.path.join(self.output_dir, f"marketwatch_economic_data_{timestamp}.csv")
+                    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
+                        writer = csv.DictWriter(f, fieldnames=TABLES["economic_data"]["fields"],
+                                                extrasaction="ignore")
+                        writer.writeheader()
+                        writer.writerows(reports)
+                    logger.info(f"CSV 快照已保存到 {csv_file}")
+            instrumentation.count("marketwatch", "rows_saved", len(reports))
+            return True
                 
         except Exception as e:
             logger.error(f"保存数据时发生错误: {str(e)}")
+            return False
 
     def run(self):
-        """执行爬虫流程"""
+        """执行爬虫流程，返回爬取到的记录条数，保存失败时抛出异常以便执行器重试"""
         logger.info("开始执行 MarketWatch 经济日历爬虫任务")
         data = self.extract_economic_data()
-        self.save_data(data)
+        if not self.save_data(data):
+            raise RuntimeError("MarketWatch 数据保存失败")
+        self.blocker.log_stats()
+        self.rate_limiter.log_stats()
+        self.sessions.log_stats()
         logger.info("爬虫任务完成")
+        return len(self.records_to_save(data))
 
 
 if __name__ == "__main__":
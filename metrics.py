@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Prometheus 格式的监控指标
+订阅 instrumentation 事件（爬虫各阶段耗时、记录数、下载字节数，执行器的任务结果和重试），
+汇总为计数器 / 仪表 / 直方图，通过 HTTP 接口 /metrics 以 Prometheus 文本格式输出。
+只使用标准库，不依赖 prometheus_client。
+
+config.json:
+    "metrics": {"enabled": true, "host": "0.0.0.0", "port": 9108}
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import instrumentation
+
+logger = logging.getLogger("metrics")
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+JOB_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_sample(self, key, state):
+        lines = []
+        for bound, count in zip(self.buckets, state["counts"]):
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class CrawlerMetrics:
+    """把 instrumentation 事件汇总为爬虫和调度器的监控指标"""
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.stage_duration = r.histogram(
+            "crawler_stage_duration_seconds", "Duration of crawler stages",
+            ("source", "stage"), STAGE_BUCKETS)
+        self.stage_failures = r.counter(
+            "crawler_stage_failures_total", "Crawler stages that raised an exception", ("source", "stage"))
+        self.rows_extracted = r.counter(
+            "crawler_rows_extracted_total", "Rows extracted from pages", ("source",))
+        self.rows_saved = r.counter(
+            "crawler_rows_saved_total", "Rows written to the datastore", ("source",))
+        self.bytes_downloaded = r.counter(
+            "crawler_bytes_downloaded_total", "Response bytes downloaded", ("source",))
+        self.host_rate = r.gauge(
+            "crawler_host_rate_limit", "Current request rate allowed per host (requests/second)", ("host",))
+        self.host_throttled = r.counter(
+            "crawler_host_throttled_total", "Rate limiter back-offs per host by reason", ("host", "reason"))
+        self.job_duration = r.histogram(
+            "scheduler_job_duration_seconds", "Duration of scheduler job attempts",
+            ("job", "status"), JOB_BUCKETS)
+        self.job_runs = r.counter(
+            "scheduler_job_runs_total", "Scheduler job attempts by result", ("job", "status"))
+        self.job_failures = r.counter(
+            "scheduler_job_failures_total", "Failed scheduler job attempts by cause", ("job", "cause"))
+        self.job_retries = r.counter(
+            "scheduler_job_retries_total", "Scheduler job retries", ("job",))
+        self.last_success = r.gauge(
+            "scheduler_job_last_success_timestamp_seconds", "Unix time of the last successful job run", ("job",))
+
+    def __call__(self, event):
+        kind = event.get("type")
+        if kind == "stage":
+            self.stage_duration.observe(event["seconds"], source=event["source"], stage=event["stage"])
+            if not event["ok"]:
+                self.stage_failures.inc(source=event["source"], stage=event["stage"])
+        elif kind == "count":
+            counter = {
+                "rows_extracted": self.rows_extracted,
+                "rows_saved": self.rows_saved,
+                "bytes_downloaded": self.bytes_downloaded
+            }.get(event["name"])
+            if counter is not None:
+                counter.inc(event["value"], source=event["source"])
+            elif event["name"].startswith("throttled_"):
+                self.host_throttled.inc(event["value"], host=event["source"],
+                                        reason=event["name"][len("throttled_"):])
+        elif kind == "gauge":
+            if event["name"] == "rate_limit":
+                self.host_rate.set(event["value"], host=event["source"])
+        elif kind == "job":
+            job, status = event["job"], event["status"]
+            self.job_runs.inc(job=job, status=status)
+            if event.get("seconds") is not None:
+                self.job_duration.observe(event["seconds"], job=job, status=status)
+            if status == "success":
+                self.last_success.set(time.time(), job=job)
+            elif status in ("failed", "timeout"):
+                self.job_failures.inc(job=job, cause=event.get("cause") or "unknown")
+        elif kind == "retry":
+            self.job_retries.inc(job=event["job"])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        payload = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, registry, host="0.0.0.0", port=9108):
+        super().__init__((host, port), _MetricsHandler)
+        self.registry = registry
+        self._thread = None
+
+    def start(self):
+        """在后台线程中启动服务器"""
+        self._thread = threading.Thread(target=self.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_metrics(config):
+    """
+    根据 config.json 的 metrics 配置订阅事件并启动 HTTP 接口
+    关闭或启动失败时返回 None
+    """
+    metrics_config = config.get("metrics", {})
+    if not metrics_config.get("enabled", True):
+        return None
+    collector = CrawlerMetrics()
+    instrumentation.subscribe(collector)
+    try:
+        server = MetricsServer(collector.registry, host=metrics_config.get("host", "0.0.0.0"),
+                               port=metrics_config.get("port", 9108)).start()
+    except OSError as e:
+        logger.error(f"监控接口启动失败: {str(e)}")
+        instrumentation.unsubscribe(collector)
+        return None
+    logger.info(f"监控接口已启动: http://{metrics_config.get('host', '0.0.0.0')}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Google Finance 文章的近似重复检测
+Top stories 中同一篇通讯社稿件经常以多个媒体的链接出现，这里对标题和正文开头做规范化后
+计算 64 位 SimHash，和历史文章一起保存在 SQLite 中（跨运行保留）。
+新卡片先按规范化链接、再按标题指纹查找已记录的文章，命中时直接关联到已有文章，不再打开页面；
+抓取到正文后再按正文开头（lead）的指纹查重，之后的运行按链接即可识别。
+
+查找使用分段索引：允许的最大汉明距离为 k 时把 64 位指纹分成 k + 1 段，
+距离不超过 k 的两个指纹至少有一段完全相同，只需比较某一段相同的候选文章，
+文章数增长到几十万篇时查找仍然只读取少量行。
+
+config.json:
+    "near_duplicates": {"path": "./data/near_duplicates.db", "title_max_distance": 3, "lead_max_distance": 6}
+相似度约为 1 - 汉明距离 / 64，距离越大越宽松
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from datetime import datetime
+
+from article_cache import canonicalize_url
+
+logger = logging.getLogger("near_duplicates")
+
+FINGERPRINT_BITS = 64
+
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "at", "by", "with",
+    "from", "as", "is", "are", "was", "were", "be", "its", "it", "this", "that"
+}
+
+# 通讯社稿件转载时常见的标题前缀，如 "UPDATE 2-"、"EXCLUSIVE:"
+TITLE_PREFIX_PATTERN = re.compile(
+    r"^\s*(?:update\s*\d*|exclusive|breaking|analysis|factbox|explainer|live|wrapup\s*\d*)\s*[-:]\s*",
+    re.IGNORECASE)
+TITLE_SEPARATORS = (" - ", " | ", " – ", " — ")
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize_tokens(text):
+    """NFKC 规范化、转小写后切分为词，去掉标点"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return TOKEN_PATTERN.findall(text)
+
+
+def normalize_title(title, source=None):
+    """去掉转载前缀和末尾的 " - 媒体名"，返回去掉停用词后的词列表"""
+    title = TITLE_PREFIX_PATTERN.sub("", title or "")
+    if source:
+        for separator in TITLE_SEPARATORS:
+            suffix = separator + source
+            if title.lower().endswith(suffix.lower()):
+                title = title[:-len(suffix)]
+                break
+    return [token for token in normalize_tokens(title) if token not in STOP_WORDS]
+
+
+def normalize_lead(content, words=80):
+    """正文开头的 words 个词"""
+    return normalize_tokens(content)[:words]
+
+
+def simhash(features):
+    """64 位 SimHash，没有特征时返回 None"""
+    weights = [0] * FINGERPRINT_BITS
+    count = 0
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+        count += 1
+    if not count:
+        return None
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def title_fingerprint(title, source=None):
+    """标题的指纹：单词和相邻词对，短标题也有足够的特征"""
+    tokens = normalize_title(title, source)
+    return simhash(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+
+
+def lead_fingerprint(content, words=80):
+    """正文开头的指纹：连续 3 个词的片段"""
+    tokens = normalize_lead(content, words)
+    if len(tokens) < 3:
+        return simhash(tokens)
+    return simhash(" ".join(tokens[i:i + 3]) for i in range(len(tokens) - 2))
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def band_layout(max_distance):
+    """把 64 位分成 max_distance + 1 段，返回 [(偏移, 位数), ...]"""
+    count = max(1, min(max_distance + 1, FINGERPRINT_BITS))
+    base, extra = divmod(FINGERPRINT_BITS, count)
+    layout, offset = [], 0
+    for i in range(count):
+        width = base + (1 if i < extra else 0)
+        layout.append((offset, width))
+        offset += width
+    return layout
+
+
+def _to_signed(value):
+    """SQLite 的 INTEGER 是有符号 64 位"""
+    return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value is not None and value < 0 else value
+
+
+class NearDuplicateIndex:
+    KINDS = ("title", "lead")
+
+    def __init__(self, path="./data/near_duplicates.db", title_max_distance=3,
+                 lead_max_distance=6, lead_words=80):
+        self.path = path
+        self.max_distance = {"title": title_max_distance, "lead": lead_max_distance}
+        self.lead_words = lead_words
+        self.layouts = {kind: band_layout(distance) for kind, distance in self.max_distance.items()}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS stories (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL UNIQUE,
+                    title TEXT NOT NULL,
+                    source TEXT NOT NULL DEFAULT '',
+                    title_fp INTEGER,
+                    lead_fp INTEGER,
+                    duplicate_of INTEGER,
+                    first_seen TEXT NOT NULL
+                )
+            """)
+            # 只为原始文章建立分段索引，重复文章通过 duplicate_of 关联
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS bands (
+                    kind TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    value INTEGER NOT NULL,
+                    story_id INTEGER NOT NULL,
+                    PRIMARY KEY (kind, band, value, story_id)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._ensure_bands()
+        self.reset_stats()
+
+    @classmethod
+    def from_config(cls, config_path="config.json"):
+        """根据 config.json 中的 near_duplicates 配置创建"""
+        try:
+            with open(config_path, 'r') as f:
+                index_config = dict(json.load(f).get("near_duplicates", {}))
+        except Exception as e:
+            logger.warning(f"加载查重配置失败，使用默认配置: {str(e)}")
+            index_config = {}
+        index_config.pop("enabled", None)
+        return cls(**index_config)
+
+    def reset_stats(self):
+        self.url_hits = 0
+        self.title_hits = 0
+        self.lead_hits = 0
+
+    def _ensure_bands(self):
+        """最大距离的配置改变时分段方式也会改变，按新的分段重建索引"""
+        with self._lock, self._conn:
+            for kind, layout in self.layouts.items():
+                key = f"bands:{kind}"
+                row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+                if row is not None and row["value"] == json.dumps(layout):
+                    continue
+                self._conn.execute("DELETE FROM bands WHERE kind = ?", (kind,))
+                cursor = self._conn.execute(
+                    f"SELECT id, {kind}_fp AS fp FROM stories WHERE duplicate_of IS NULL AND {kind}_fp IS NOT NULL")
+                count = 0
+                for story in cursor.fetchall():
+                    self._insert_bands(kind, story["id"], _to_unsigned(story["fp"]))
+                    count += 1
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                   (key, json.dumps(layout)))
+                if count:
+                    logger.info(f"{kind} 分段索引已按最大距离 {self.max_distance[kind]} 重建，共 {count} 篇")
+
+    def _bands(self, kind, fingerprint):
+        return [(band, fingerprint >> offset & ((1 << width) - 1))
+                for band, (offset, width) in enumerate(self.layouts[kind])]
+
+    def _insert_bands(self, kind, story_id, fingerprint):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO bands (kind, band, value, story_id) VALUES (?, ?, ?, ?)",
+            [(kind, band, value, story_id) for band, value in self._bands(kind, fingerprint)])
+
+    def _nearest(self, kind, fingerprint, exclude=None):
+        """分段索引中与指纹距离不超过最大距离的最近的原始文章"""
+        candidates = set()
+        for band, value in self._bands(kind, fingerprint):
+            candidates.update(row[0] for row in self._conn.execute(
+                "SELECT story_id FROM bands WHERE kind = ? AND band = ? AND value = ?", (kind, band, value)))
+        candidates.discard(exclude)
+        best = None
+        for story_id in candidates:
+            story = self._conn.execute(
+                f"SELECT id, url, title, source, {kind}_fp AS fp FROM stories WHERE id = ?", (story_id,)).fetchone()
+            if story is None or story["fp"] is None:
+                continue
+            distance = hamming_distance(fingerprint, _to_unsigned(story["fp"]))
+            if distance <= self.max_distance[kind] and (best is None or distance < best["distance"]):
+                best = {"id": story["id"], "url": story["url"], "title": story["title"],
+                        "source": story["source"], "distance": distance, "by": kind}
+        return best
+
+    def find(self, link, title, source=None):
+        """
+        查找卡片重复的已有文章，返回 {"id", "url", "title", "source", "distance", "by"}，没有时返回 None
+        链接本身就是已记录的原始文章时返回 None（按原来的方式读取缓存）
+        """
+        url = canonicalize_url(link)
+        with self._lock:
+            row = self._conn.execute("SELECT id, duplicate_of FROM stories WHERE url = ?", (url,)).fetchone()
+            if row is not None:
+                if row["duplicate_of"] is None:
+                    return None
+                original = self._conn.execute(
+                    "SELECT id, url, title, source FROM stories WHERE id = ?", (row["duplicate_of"],)).fetchone()
+                if original is None:
+                    return None
+                self.url_hits += 1
+                return dict(original, distance=0, by="url")
+
+            fingerprint = title_fingerprint(title, source)
+            if fingerprint is None:
+                return None
+            match = self._nearest("title", fingerprint)
+            if match is not None:
+                self.title_hits += 1
+            return match
+
+    def add(self, link, title, source=None, duplicate_of=None):
+        """记录一篇文章，链接已存在时返回已有的 id"""
+        url = canonicalize_url(link)
+        fingerprint = title_fingerprint(title, source)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM stories WHERE url = ?", (url,)).fetchone()
+            if row is not None:
+                return row["id"]
+            story_id = self._conn.execute(
+                "INSERT INTO stories (url, title, source, title_fp, duplicate_of, first_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, title or "", source or "", _to_signed(fingerprint), duplicate_of,
+                 datetime.now().isoformat())).lastrowid
+            if duplicate_of is None and fingerprint is not None:
+                self._insert_bands("title", story_id, fingerprint)
+            return story_id
+
+    def check(self, link, title, source=None):
+        """
+        find 没有找到重复时立即记录这张卡片，同一批中之后出现的重复卡片也能关联到它
+        """
+        match = self.find(link, title, source)
+        if match is None:
+            self.add(link, title, source)
+        return match
+
+    def link(self, story_id, original_id):
+        """把文章关联到原始文章，并从分段索引中移除"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE stories SET duplicate_of = ? WHERE id = ?", (original_id, story_id))
+            self._conn.execute("DELETE FROM bands WHERE story_id = ?", (story_id,))
+
+    def record(self, link, title, source=None, content=None, duplicate=None):
+        """
+        抓取（或从缓存读取）正文后记录文章，返回重复的已有文章
+        duplicate 为 find / check 的结果；没有重复时再按正文开头查重，命中时关联到已有文章
+        """
+        if duplicate is not None:
+            self.add(link, title, source, duplicate_of=duplicate["id"])
+            return duplicate
+
+        story_id = self.add(link, title, source)
+        fingerprint = lead_fingerprint(content, self.lead_words) if content else None
+        if fingerprint is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT lead_fp, duplicate_of FROM stories WHERE id = ?",
+                                     (story_id,)).fetchone()
+            if row["lead_fp"] is not None or row["duplicate_of"] is not None:
+                return None
+            match = self._nearest("lead", fingerprint, exclude=story_id)
+            if match is None:
+                with self._conn:
+                    self._conn.execute("UPDATE stories SET lead_fp = ? WHERE id = ?",
+                                       (_to_signed(fingerprint), story_id))
+                    self._insert_bands("lead", story_id, fingerprint)
+                return None
+            self.lead_hits += 1
+        self.link(story_id, match["id"])
+        return match
+
+    def stats(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS stories, COUNT(duplicate_of) AS duplicates FROM stories").fetchone()
+        return {"stories": row["stories"], "duplicates": row["duplicates"], "url_hits": self.url_hits,
+                "title_hits": self.title_hits, "lead_hits": self.lead_hits}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def load_near_duplicate_index(config_path="config.json"):
+    """按 config.json 创建查重索引，near_duplicates.enabled 为 false 时返回 None"""
+    try:
+        with open(config_path, 'r') as f:
+            enabled = json.load(f).get("near_duplicates", {}).get("enabled", True)
+    except Exception:
+        enabled = True
+    return NearDuplicateIndex.from_config(config_path) if enabled else None
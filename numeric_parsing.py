@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+带单位的数值解析（向量化）
+把 "3.2%"、"215K"、"-1.5B"、"$0.45"、"1.2T"、"(0.12)"、"−0.3%" 这类文本解析为数值和单位：
+    value   已按 K/M/B/T 换算的数值，百分数保持百分点（"3.2%" -> 3.2）
+    unit    "%"、货币符号（"$"、"€" 等）或空字符串
+无法解析的值为 NaN，unit 为 None
+
+解析只对去重后的取值执行正则，再按下标映射回原列，
+历史数据中大量重复的取值只解析一次
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import numpy as np
+import pandas as pd
+
+SUFFIX_MULTIPLIERS = {"": 1.0, "K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}
+
+# 财报和经济数据中会出现的数值列
+ECONOMIC_NUMERIC_COLUMNS = ["actual", "forecast", "previous"]
+EARNINGS_NUMERIC_COLUMNS = ["eps_forecast", "eps_actual", "revenue_forecast", "revenue_actual", "market_cap"]
+
+_NUMBER_RE = (
+    r"^(?P<open>\()?"
+    r"(?P<sign>[-+])?"
+    r"(?P<currency>[$€£¥])?"
+    r"(?P<sign2>[-+])?"
+    r"(?P<number>\d+(?:\.\d*)?|\.\d+)"
+    r"(?P<suffix>[KMBT])?"
+    r"(?P<percent>%)?"
+    r"(?P<close>\))?$"
+)
+
+# 统一为 ASCII 负号：unicode minus、en dash
+_MINUS_CHARS = {"−": "-", "–": "-", "‒": "-", "﹣": "-", "－": "-"}
+
+
+def _parse_unique(values):
+    """对去重后的文本数组执行正则解析，返回 (value, unit) 两个数组"""
+    text = pd.Series(values, dtype=object).str.strip().str.upper()
+    for char, replacement in _MINUS_CHARS.items():
+        text = text.str.replace(char, replacement, regex=False)
+    # 千分位逗号、数字和单位之间的空格
+    text = text.str.replace(r"[,\s]", "", regex=True)
+
+    parts = text.str.extract(_NUMBER_RE)
+    number = pd.to_numeric(parts["number"], errors="coerce").to_numpy(dtype=float)
+    multiplier = parts["suffix"].fillna("").map(SUFFIX_MULTIPLIERS).to_numpy(dtype=float)
+
+    # 括号必须成对出现，(0.12) 表示负数
+    paren_ok = parts["open"].notna().to_numpy() == parts["close"].notna().to_numpy()
+    negative = (parts["open"].notna() | (parts["sign"] == "-") | (parts["sign2"] == "-")).to_numpy()
+
+    value = number * multiplier
+    value = np.where(negative, -value, value)
+    value = np.where(paren_ok, value, np.nan)
+
+    unit = np.where(parts["percent"].notna(), "%", parts["currency"].fillna("").to_numpy(dtype=object))
+    unit = np.where(np.isnan(value), None, unit).astype(object)
+    return value, unit
+
+
+def parse_numeric(series):
+    """
+    解析一列带单位的数值文本，返回包含 value 和 unit 两列的 DataFrame（索引与输入一致）
+    """
+    codes, uniques = pd.factorize(series.astype("string"))
+    value_unique, unit_unique = _parse_unique(np.asarray(uniques, dtype=object))
+
+    # 多出的一个位置对应缺失值 (code == -1)
+    value_unique = np.append(value_unique, np.nan)
+    unit_unique = np.append(unit_unique, None).astype(object)
+    return pd.DataFrame({
+        "value": value_unique[codes],
+        "unit": unit_unique[codes]
+    }, index=series.index)
+
+
+def parse_numeric_columns(frame, columns):
+    """
+    为 frame 中存在的每个列添加 <列名>_value 和 <列名>_unit 两列，返回新的 DataFrame
+    """
+    frame = frame.copy()
+    for column in columns:
+        if column not in frame.columns:
+            continue
+        parsed = parse_numeric(frame[column])
+        frame[f"{column}_value"] = parsed["value"]
+        frame[f"{column}_unit"] = parsed["unit"]
+    return frame
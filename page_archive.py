@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+原始页面存档
+爬虫获取的每个 HTML / JSON 响应按内容的 SHA-256 保存为压缩块（zstd，没有安装 zstandard 时用 zlib），
+内容相同的页面只保存一份；SQLite 索引记录每次获取的 URL、时间、来源和对应的内容哈希。
+
+- iter_pages 按时间顺序逐个读取存档页面，不会一次加载全部内容
+- prune 删除超过 retention_days 的获取记录（每个 URL 保留最新一次）和不再被引用的压缩块，
+  存档大小不会随爬取次数无限增长
+- extraction_engine.py --archive 可以直接从存档重新提取，不需要重新请求网站
+
+目录结构：
+    page_archive/index.db
+    page_archive/blobs/ab/abcdef....zst
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import zstandard
+except ImportError:  # 没有 zstandard 时使用 zlib 压缩
+    zstandard = None
+
+logger = logging.getLogger("page_archive")
+
+CODEC_EXTENSIONS = {"zstd": ".zst", "zlib": ".zz"}
+
+
+class PageArchive:
+    def __init__(self, root="./data/page_archive", level=10, retention_days=90):
+        self.root = root
+        self.level = level
+        self.retention_days = retention_days
+        self.codec = "zstd" if zstandard is not None else "zlib"
+        self.index_path = os.path.join(root, "index.db")
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS fetches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    status INTEGER,
+                    content_type TEXT NOT NULL DEFAULT '',
+                    hash TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fetches_source ON fetches (source, fetched_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fetches_url ON fetches (url, fetched_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fetches_hash ON fetches (hash)")
+        self._last_prune = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        archive_config = dict(config.get("page_archive", {}))
+        archive_config.pop("enabled", None)
+        if "path" in archive_config:
+            archive_config["root"] = archive_config.pop("path")
+        return cls(**archive_config)
+
+    def _blob_path(self, digest, codec):
+        return os.path.join(self.root, "blobs", digest[:2], digest + CODEC_EXTENSIONS[codec])
+
+    def _compress(self, content):
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(content)
+        return zlib.compress(content, min(self.level, 9))
+
+    @staticmethod
+    def _decompress(data, codec):
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("读取 zstd 压缩的页面需要安装 zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def store(self, url, content, source, status=200, content_type="text/html", fetched_at=None):
+        """保存一次获取的内容，返回内容哈希；相同内容的压缩块只写一次"""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        now = fetched_at or datetime.now().isoformat()
+        with self._lock:
+            known = self._conn.execute("SELECT codec FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if known is None or not os.path.exists(self._blob_path(digest, known["codec"])):
+                data = self._compress(content)
+                path = self._blob_path(digest, self.codec)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO blobs (hash, codec, size, stored_size, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)", (digest, self.codec, len(content), len(data), now))
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO fetches (url, source, fetched_at, status, content_type, hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (url, source, now, status, content_type or "", digest))
+        self._maybe_prune()
+        return digest
+
+    def get(self, digest):
+        """按内容哈希读取页面内容，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT codec FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        with open(self._blob_path(digest, row["codec"]), 'rb') as f:
+            return self._decompress(f.read(), row["codec"])
+
+    def latest(self, url):
+        """某个 URL 最近一次获取的内容"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash FROM fetches WHERE url = ? ORDER BY fetched_at DESC, id DESC LIMIT 1",
+                (url,)).fetchone()
+        return self.get(row["hash"]) if row else None
+
+    def records(self, source=None, url=None, since=None, until=None, unique=False):
+        """
+        按时间顺序逐条产出获取记录（不含内容）
+        unique 为 True 时相同内容只产出筛选范围内第一次获取的记录
+        """
+        filters, params = [], []
+        for column, op, value in (("source", "=", source), ("url", "=", url),
+                                  ("fetched_at", ">=", since), ("fetched_at", "<", until)):
+            if value is not None:
+                filters.append(f"{column} {op} ?")
+                params.append(value)
+        conditions = [f"f.{condition}" for condition in filters]
+        if unique:
+            # 去重也只在筛选范围内进行，范围之前获取过相同内容的页面仍然产出
+            inner = f"WHERE {' AND '.join(filters)} " if filters else ""
+            conditions.append(f"f.id IN (SELECT MIN(id) FROM fetches {inner}GROUP BY hash)")
+            params = params + params
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = (f"SELECT f.id, f.url, f.source, f.fetched_at, f.status, f.content_type, f.hash, b.codec "
+               f"FROM fetches f JOIN blobs b ON b.hash = f.hash {where} ORDER BY f.fetched_at, f.id")
+        # 使用单独的只读连接，遍历期间不阻塞写入
+        conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(200)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+
+    def read_record(self, record):
+        with open(self._blob_path(record["hash"], record["codec"]), 'rb') as f:
+            return self._decompress(f.read(), record["codec"])
+
+    def iter_pages(self, source=None, url=None, since=None, until=None, unique=False):
+        """按时间顺序逐个产出 (记录, 内容)，每次只解压一个页面"""
+        for record in self.records(source, url, since, until, unique):
+            try:
+                yield record, self.read_record(record)
+            except OSError as e:
+                logger.warning(f"存档页面 {record['hash']} 读取失败: {str(e)}")
+
+    def prune(self, retention_days=None, keep_latest=True):
+        """
+        删除超过保留天数的获取记录（keep_latest 时每个 URL 保留最新一次）和不再被引用的压缩块
+        返回删除的压缩块数量
+        """
+        retention_days = self.retention_days if retention_days is None else retention_days
+        if retention_days is None:
+            return 0
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        with self._lock:
+            with self._conn:
+                keep = "AND id NOT IN (SELECT MAX(id) FROM fetches GROUP BY url)" if keep_latest else ""
+                deleted = self._conn.execute(
+                    f"DELETE FROM fetches WHERE fetched_at < ? {keep}", (cutoff,)).rowcount
+                orphans = self._conn.execute(
+                    "SELECT hash, codec FROM blobs WHERE hash NOT IN (SELECT DISTINCT hash FROM fetches)").fetchall()
+                self._conn.executemany("DELETE FROM blobs WHERE hash = ?", [(row["hash"],) for row in orphans])
+        for row in orphans:
+            try:
+                os.remove(self._blob_path(row["hash"], row["codec"]))
+            except FileNotFoundError:
+                pass
+        if deleted or orphans:
+            logger.info(f"存档清理：删除 {deleted} 条获取记录，{len(orphans)} 个压缩块")
+        return len(orphans)
+
+    def _maybe_prune(self):
+        """每个进程每天最多自动清理一次"""
+        if time.monotonic() - self._last_prune < 86400 and self._last_prune:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            self.prune()
+        except Exception as e:
+            logger.warning(f"存档清理失败: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            fetches = self._conn.execute("SELECT COUNT(*) FROM fetches").fetchone()[0]
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS size, "
+                "COALESCE(SUM(stored_size), 0) AS stored FROM blobs").fetchone()
+        return {"fetches": fetches, "blobs": row["blobs"], "size": row["size"], "stored_size": row["stored"]}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def load_archive_config(config_path="config.json"):
+    """读取 config.json 中的 page_archive 配置"""
+    try:
+        with open(config_path, 'r') as f:
+            return json.load(f).get("page_archive", {})
+    except Exception as e:
+        logger.warning(f"加载存档配置失败，使用默认配置: {str(e)}")
+        return {}
+
+
+_shared = None
+_shared_loaded = False
+_shared_lock = threading.Lock()
+
+
+def get_page_archive():
+    """进程内共享的页面存档，第一次调用时按 config.json 创建；未启用时返回 None"""
+    global _shared, _shared_loaded
+    with _shared_lock:
+        if not _shared_loaded:
+            archive_config = load_archive_config()
+            if archive_config.get("enabled", True):
+                _shared = PageArchive.from_config({"page_archive": archive_config})
+            _shared_loaded = True
+        return _shared
+
+
+def set_page_archive(archive):
+    """替换共享的页面存档（例如基准测试中写入临时目录），传入 None 时关闭存档"""
+    global _shared, _shared_loaded
+    with _shared_lock:
+        _shared = archive
+        _shared_loaded = True
+
+
+def archive_response(response, source, archive=None):
+    """保存 Playwright 页面导航的响应，失败时只记录警告"""
+    archive = archive or get_page_archive()
+    if archive is None or response is None:
+        return None
+    try:
+        return archive.store(response.url, response.body(), source, status=response.status,
+                             content_type=response.headers.get("content-type", ""))
+    except Exception as e:
+        logger.warning(f"保存页面 {response.url} 失败: {str(e)}")
+        return None
+
+
+async def archive_response_async(response, source, archive=None):
+    """archive_response 的异步版本"""
+    archive = archive or get_page_archive()
+    if archive is None or response is None:
+        return None
+    try:
+        body = await response.body()
+        return archive.store(response.url, body, source, status=response.status,
+                             content_type=response.headers.get("content-type", ""))
+    except Exception as e:
+        logger.warning(f"保存页面 {response.url} 失败: {str(e)}")
+        return None
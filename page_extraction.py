@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+在 Playwright 页面内执行声明式提取规则
+整份规则在页面内一次 evaluate 完成，只有一次与浏览器的往返
+规则格式见 extraction_schemas.py
+Author: kelesit
+Date: 2026-10-18
+"""
+
+EXTRACT_JS = """
+(schema) => {
+    const normalize = (spec) => (typeof spec === "string" ? {selector: spec} : spec);
+
+    const value = (el, spec) => {
+        if (spec.attribute) {
+            return el.getAttribute(spec.attribute);
+        }
+        return (el.textContent || "").trim();
+    };
+
+    const record = (root, data) => {
+        const out = {};
+        for (const [key, spec] of Object.entries(data)) {
+            out[key] = field(root, normalize(spec));
+        }
+        return out;
+    };
+
+    const field = (root, spec) => {
+        if (spec.multiple) {
+            const elements = spec.selector ? Array.from(root.querySelectorAll(spec.selector)) : [root];
+            return elements.map((el) => (spec.data ? record(el, spec.data) : value(el, spec)));
+        }
+        const el = spec.selector ? root.querySelector(spec.selector) : root;
+        if (!el) {
+            return null;
+        }
+        return spec.data ? record(el, spec.data) : value(el, spec);
+    };
+
+    return record(document, schema);
+}
+"""
+
+
+def extract_from_page(page, schema):
+    """在同步 API 的页面上执行提取规则，返回与规则结构相同的字典"""
+    return page.evaluate(EXTRACT_JS, schema)
+
+
+async def extract_from_page_async(page, schema):
+    """在异步 API 的页面上执行提取规则"""
+    return await page.evaluate(EXTRACT_JS, schema)
@@ -0,0 +1,648 @@
+#!/usr/bin/env python3
+"""
+声明式多数据源流水线
+数据源在 config.json 的 pipeline.sources 中声明，同名的顶层配置（如 "marketwatch" 中的
+url、headers、timeout）作为默认值合并进来：
+
+    "pipeline": {
+        "stages": {"fetch": {"workers": 2, "queue_size": 4}, ...},
+        "sources": {
+            "fed_calendar": {
+                "urls": ["https://example.com/calendar"],
+                "fetch": {"type": "http", "fallback": {"type": "browser", "wait_for": "table"}},
+                "schema": {"rows": {"selector": "table tr", "multiple": true, "data": {...}}},
+                "records": "rows",
+                "normalize": [{"op": "require", "fields": ["event"]}],
+                "sinks": [{"type": "store", "table": "fed_calendar", "key": ["date", "event"],
+                           "fields": ["date", "event", "actual"]},
+                          {"type": "jsonl"}],
+                "schedule": ["08:00", "20:00"]
+            }
+        }
+    }
+
+schema 可以直接写提取规则，也可以写 extraction_schemas 中的规则名（如 "MARKETWATCH_SCHEMA"）。
+每次运行分为四个阶段，阶段之间用有界队列连接，每个阶段有自己的工作线程数：
+    fetch      按健康度租用会话，用声明的方式（browser / http / investing_ajax）获取 HTML，
+               失败时按 fallback 依次回退
+    extract    执行提取规则，得到记录列表和页面元数据
+    normalize  去掉首尾空白后按声明的步骤清洗记录
+    sink       写入数据库和变更流、CSV 或 JSONL
+队列满时上游阶段阻塞，内存中同时存在的页面数量有上限。
+启用 pipeline.enabled 时调度器和 crawl_worker 通过流水线执行声明的数据源，
+marketwatch / investing 仍按 schedule 中的时间执行，其他数据源按各自的 schedule 执行。
+新增数据源只需要修改配置；新的获取方式、规范化步骤和输出类型用
+register_fetcher / register_normalizer / register_sink 注册。
+
+用法：
+python pipeline_engine.py --sources marketwatch investing
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from datetime import datetime
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+import extraction_schemas
+import instrumentation
+from browser_pool import BrowserPool
+from change_capture import load_change_log
+from datastore import TABLES, CrawlStore
+from html_extraction import extract_from_html
+from investing_fastpath import FastPathBlocked, FastPathError, InvestingAjaxFetcher
+from page_archive import archive_response, get_page_archive
+from rate_limiter import THROTTLE_STATUSES, get_rate_limiter, goto, is_challenge, retry_after_seconds
+from resource_blocker import ResourceBlocker
+from session_pool import SessionBlocked, get_session_pool
+
+logger = logging.getLogger("pipeline_engine")
+
+STAGES = ("fetch", "extract", "normalize", "sink")
+
+DEFAULT_STAGES = {
+    "fetch": {"workers": 2, "queue_size": 4},
+    "extract": {"workers": 2, "queue_size": 4},
+    "normalize": {"workers": 1, "queue_size": 8},
+    "sink": {"workers": 1, "queue_size": 8}
+}
+
+# 会话被封时抛出的异常，租用的会话进入冷却
+BLOCKED_ERRORS = (SessionBlocked, FastPathBlocked)
+
+# 队列结束标记，每个阶段的最后一个工作线程退出时向下游的每个工作线程发送一个
+_DONE = object()
+
+
+@dataclass
+class Source:
+    name: str
+    urls: list
+    schema: dict
+    records: str
+    fetch: dict
+    headers: dict = field(default_factory=dict)
+    timeout: float = 60
+    normalize: list = field(default_factory=list)
+    sinks: list = field(default_factory=list)
+    # 合并后的完整配置，获取方式需要的其他选项（如 investing 的 fast_path）从这里读取
+    options: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, name, spec, config=None):
+        """合并同名的顶层配置和 pipeline.sources 中的声明"""
+        options = dict((config or {}).get(name, {}))
+        options.update(spec)
+        schema = options.get("schema")
+        if isinstance(schema, str):
+            if not hasattr(extraction_schemas, schema):
+                raise ValueError(f"数据源 {name} 的提取规则 {schema} 不存在")
+            schema = getattr(extraction_schemas, schema)
+        if not isinstance(schema, dict) or not schema:
+            raise ValueError(f"数据源 {name} 没有声明提取规则 (schema)")
+        records = options.get("records") or next(
+            (key for key, rule in schema.items() if isinstance(rule, dict) and rule.get("multiple")), None)
+        if records is None:
+            raise ValueError(f"数据源 {name} 没有声明记录字段 (records)")
+        urls = options.get("urls") or ([options["url"]] if options.get("url") else [])
+        if not urls:
+            raise ValueError(f"数据源 {name} 没有声明 url")
+        fetch = options.get("fetch") or {"type": "browser"}
+        spec_chain = fetch
+        while spec_chain:
+            if spec_chain.get("type") not in FETCHERS:
+                raise ValueError(f"数据源 {name} 的获取方式 {spec_chain.get('type')} 未注册")
+            spec_chain = spec_chain.get("fallback")
+        for step in options.get("normalize", []):
+            if step.get("op") not in NORMALIZERS:
+                raise ValueError(f"数据源 {name} 的规范化步骤 {step.get('op')} 未注册")
+        for sink in options.get("sinks", []):
+            if sink.get("type") not in SINKS:
+                raise ValueError(f"数据源 {name} 的输出类型 {sink.get('type')} 未注册")
+        return cls(name=name, urls=list(urls), schema=schema, records=records, fetch=fetch,
+                   headers=dict(options.get("headers", {})), timeout=options.get("timeout", 60),
+                   normalize=list(options.get("normalize", [])), sinks=list(options.get("sinks", [])),
+                   options=options)
+
+
+@dataclass
+class FetchTask:
+    source: Source
+    url: str
+
+
+@dataclass
+class Document:
+    source: Source
+    url: str
+    html: str
+    status: int = 200
+    # 获取方式附带的信息，如筛选接口的 truncated（是否因翻页上限而不完整）
+    metadata: dict = field(default_factory=dict)
+
+
+@dataclass
+class Batch:
+    source: Source
+    url: str
+    records: list
+    metadata: dict = field(default_factory=dict)
+
+
+# ---------------------------------------------------------------- 获取方式
+
+def fetch_browser(engine, source, url, spec, session):
+    """
+    从浏览器池租用 context 渲染页面，返回渲染后的 HTML
+    会话被封（限流状态码或验证页面）时立即抛出 SessionBlocked，不再等待 wait_for 超时
+    """
+    host = urlsplit(url).hostname
+    timeout = spec.get("timeout", source.timeout) * 1000
+    with engine.get_browser_pool().lease(**session.context_options()) as context:
+        engine.blocker(source.name).attach(context)
+        context.add_cookies(session.browser_cookies(host))
+        page = context.new_page()
+        try:
+            page.set_extra_http_headers(dict(source.headers, **session.headers()))
+            with instrumentation.stage(source.name, "navigation"):
+                response = goto(page, url, limiter=engine.rate_limiter, timeout=timeout)
+            archive_response(response, source.name)
+            if response is not None and (response.status in THROTTLE_STATUSES or is_challenge(page.title())):
+                raise SessionBlocked(f"会话 {session.id} 被封: HTTP {response.status}")
+            if spec.get("wait_for"):
+                with instrumentation.stage(source.name, "wait_for"):
+                    page.wait_for_selector(spec["wait_for"], timeout=timeout)
+            session.update_from_browser(context.cookies())
+            return Document(source, url, page.content(), response.status if response is not None else 200)
+        finally:
+            page.close()
+
+
+def fetch_http(engine, source, url, spec, session):
+    """不启动浏览器，直接请求页面，适用于服务端渲染的页面"""
+    host = urlsplit(url).hostname
+    headers = dict(source.headers, **spec.get("headers", {}))
+    headers.update(session.headers())
+    cookies = session.cookies_for(host)
+    if cookies:
+        headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+    handlers = []
+    if session.proxy:
+        handlers.append(urllib.request.ProxyHandler({"http": session.proxy, "https": session.proxy}))
+    opener = urllib.request.build_opener(*handlers)
+
+    engine.rate_limiter.acquire(url)
+    started = time.monotonic()
+    try:
+        with opener.open(urllib.request.Request(url, headers=headers),
+                         timeout=spec.get("timeout", source.timeout)) as response:
+            status, response_headers, body = response.status, response.headers, response.read()
+    except HTTPError as e:
+        status, response_headers, body = e.code, e.headers, e.read()
+    latency = time.monotonic() - started
+    html = body.decode(response_headers.get_content_charset() or "utf-8", errors="replace")
+    challenge = is_challenge(html)
+    engine.rate_limiter.record(url, status, latency, challenge=challenge,
+                               retry_after=retry_after_seconds(response_headers))
+    instrumentation.count(source.name, "bytes_downloaded", len(body))
+
+    archive = get_page_archive()
+    if archive is not None:
+        try:
+            archive.store(url, body, source.name, status=status,
+                          content_type=response_headers.get("Content-Type", ""))
+        except Exception as e:
+            logger.warning(f"保存页面 {url} 失败: {str(e)}")
+    if status in THROTTLE_STATUSES or challenge:
+        raise SessionBlocked(f"会话 {session.id} 被封: HTTP {status}")
+    if status >= 400:
+        raise RuntimeError(f"{url} 返回 HTTP {status}")
+    return Document(source, url, html, status)
+
+
+def fetch_investing_ajax(engine, source, url, spec, session):
+    """
+    调用 Investing.com 日历的筛选接口，返回拼接成日历表格的 HTML
+    spec 中的 form 为筛选参数，默认查询 fast_path.current_tab；接口没有返回数据时抛出 FastPathError 以便回退
+    """
+    fetcher = engine.get_investing_fetcher(source)
+    form = spec.get("form") or {"currentTab": fetcher.current_tab}
+    period = form.get("currentTab", "")
+    if period == "custom":
+        period = f"{form.get('dateFrom', '')} - {form.get('dateTo', '')}"
+    html, truncated = fetcher.fetch_html(form, period=period, session=session)
+    if "<tr" not in html:
+        raise FastPathError("筛选接口没有返回数据")
+    return Document(source, url, html, metadata={"current_period": period, "truncated": truncated})
+
+
+FETCHERS = {
+    "browser": fetch_browser,
+    "http": fetch_http,
+    "investing_ajax": fetch_investing_ajax
+}
+
+
+def register_fetcher(name, func):
+    """注册获取方式，func(engine, source, url, spec, session) 返回 Document"""
+    FETCHERS[name] = func
+
+
+# ---------------------------------------------------------------- 规范化步骤
+
+def require_fields(records, step):
+    """去掉 fields 中任一字段为空的记录"""
+    return [record for record in records if all(record.get(f) for f in step.get("fields", []))]
+
+
+def fill_down(records, step):
+    """
+    把 field 的值向下填充到后续该字段为空的记录
+    设置 header_when_empty 时，field 有值而 header_when_empty 为空的记录视为分组标题行，
+    只用于填充并被去掉，header_when_empty 为空的其他记录也一并去掉
+    （即 extraction_schemas.fill_earnings_dates 的通用形式）
+    """
+    name = step["field"]
+    marker = step.get("header_when_empty")
+    current = ""
+    filled = []
+    for record in records:
+        value = record.get(name, "")
+        if marker is not None:
+            if value and not record.get(marker):
+                current = value
+                continue
+            if not record.get(marker):
+                continue
+        if value:
+            current = value
+            filled.append(record)
+        else:
+            filled.append(dict(record, **{name: current}))
+    return filled
+
+
+def rename_fields(records, step):
+    """按 mapping 重命名字段"""
+    mapping = step.get("mapping", {})
+    return [{mapping.get(k, k): v for k, v in record.items()} for record in records]
+
+
+def default_values(records, step):
+    """字段为空时填入 values 中的默认值"""
+    values = step.get("values", {})
+    return [dict(record, **{k: v for k, v in values.items() if not record.get(k)}) for record in records]
+
+
+NORMALIZERS = {
+    "require": require_fields,
+    "fill_down": fill_down,
+    "rename": rename_fields,
+    "defaults": default_values
+}
+
+
+def register_normalizer(name, func):
+    """注册规范化步骤，func(records, step) 返回新的记录列表"""
+    NORMALIZERS[name] = func
+
+
+def _strip(value):
+    if value is None:
+        return ""
+    return value.strip() if isinstance(value, str) else value
+
+
+# ---------------------------------------------------------------- 输出
+
+def sink_store(engine, batch, spec):
+    """
+    按自然键增量写入 CrawlStore，记录本次运行并把变化写入变更流
+    table 未注册时按 spec 中的 key 和 fields 注册
+    remove_missing: true 删除本批覆盖日期中没有出现的行；"complete" 只在获取方式确认数据完整时删除
+    """
+    table = spec["table"]
+    if table not in TABLES:
+        if not spec.get("key") or not spec.get("fields"):
+            raise ValueError(f"数据表 {table} 未注册，需要在输出中声明 key 和 fields")
+        engine.store.register_table(table, spec["key"], spec["fields"], source=batch.source.name)
+    remove_missing = spec.get("remove_missing", False)
+    if remove_missing == "complete":
+        remove_missing = batch.metadata.get("truncated") is False
+    result = engine.store.upsert(table, batch.records, remove_missing=bool(remove_missing),
+                                 change_source=batch.source.name)
+    metadata = {k: v for k, v in batch.metadata.items() if isinstance(v, (str, int, float, bool))}
+    metadata["source_url"] = batch.url
+    engine.store.record_run(batch.source.name, table, result, metadata)
+    engine.change_log.drain(engine.store)
+    logger.info(f"{batch.source.name} 已保存到 {table}: 新增 {result['inserted']} 条，"
+                f"更新 {result['updated']} 条，未变化 {result['unchanged']} 条，移除 {result['removed']} 条")
+    return result
+
+
+def _sink_path(engine, batch, spec, default):
+    """输出路径模板，可以使用 {output_dir}、{source} 和 {timestamp}（本次运行的开始时间）"""
+    template = spec.get("path", default)
+    return template.format(output_dir=engine.output_dir, source=batch.source.name, timestamp=engine.run_timestamp)
+
+
+def _sink_fields(batch, spec):
+    if spec.get("fields"):
+        return spec["fields"]
+    if spec.get("table") in TABLES:
+        return TABLES[spec["table"]]["fields"]
+    fields = []
+    for record in batch.records:
+        fields.extend(k for k in record if k not in fields)
+    return fields
+
+
+def sink_csv(engine, batch, spec):
+    """每次运行每个数据源写一个带时间戳的 CSV 快照，同一次运行的多份文档追加到同一个文件"""
+    path = _sink_path(engine, batch, spec, "{output_dir}/{source}_{timestamp}.csv")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with engine.file_lock:
+        new_file = not os.path.exists(path)
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=_sink_fields(batch, spec), extrasaction="ignore")
+            if new_file:
+                writer.writeheader()
+            writer.writerows(batch.records)
+    if new_file:
+        logger.info(f"CSV 快照已保存到 {path}")
+
+
+def sink_jsonl(engine, batch, spec):
+    """把记录追加到 JSONL 文件，每行一条，附带数据源和获取时间"""
+    path = _sink_path(engine, batch, spec, "{output_dir}/{source}.jsonl")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fetched_at = datetime.now().isoformat()
+    lines = "".join(json.dumps(dict(record, _source=batch.source.name, _url=batch.url, _fetched_at=fetched_at),
+                               ensure_ascii=False) + "\n" for record in batch.records)
+    with engine.file_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(lines)
+
+
+SINKS = {
+    "store": sink_store,
+    "csv": sink_csv,
+    "jsonl": sink_jsonl
+}
+
+
+def register_sink(name, func):
+    """注册输出类型，func(engine, batch, spec)"""
+    SINKS[name] = func
+
+
+# ---------------------------------------------------------------- 流水线
+
+class PipelineEngine:
+    def __init__(self, sources, stages=None, output_dir="./data", store=None, change_log=None,
+                 browser_pool=None, sessions=None, rate_limiter=None, investing_fetcher=None, config=None):
+        self.sources = {source.name: source for source in sources}
+        self.stages = {}
+        for stage in STAGES:
+            options = dict(DEFAULT_STAGES[stage])
+            options.update((stages or {}).get(stage, {}))
+            self.stages[stage] = options
+        self.output_dir = output_dir
+        self.config = config or {}
+        self.store = store or CrawlStore(os.path.join(output_dir, "crawl_data.db"))
+        self.change_log = change_log or load_change_log(self.config)
+        self.sessions = sessions or get_session_pool()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.file_lock = threading.Lock()
+        self.run_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 浏览器池和筛选接口按需创建，未从外部传入时由流水线在运行结束后关闭
+        self.browser_pool = browser_pool
+        self.investing_fetcher = investing_fetcher
+        self._owned = []
+        self._blockers = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @classmethod
+    def from_config(cls, config, **overrides):
+        pipeline_config = config.get("pipeline", {})
+        sources = [Source.from_config(name, spec, config)
+                   for name, spec in pipeline_config.get("sources", {}).items()]
+        options = {
+            "stages": pipeline_config.get("stages"),
+            "output_dir": config.get("output_directory", "./data"),
+            "config": config
+        }
+        if "store" not in overrides:
+            default_path = os.path.join(options["output_dir"], "crawl_data.db")
+            options["store"] = CrawlStore(config.get("storage", {}).get("path", default_path))
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(sources, **options)
+
+    def get_browser_pool(self):
+        with self._lock:
+            if self.browser_pool is None:
+                self.browser_pool = BrowserPool.from_config(self.config)
+                self._owned.append(self.browser_pool)
+            return self.browser_pool
+
+    def get_investing_fetcher(self, source):
+        with self._lock:
+            if self.investing_fetcher is None:
+                fast_path_config = dict(source.options.get("fast_path", {}))
+                fast_path_config.pop("enabled", None)
+                self.investing_fetcher = InvestingAjaxFetcher(headers=source.headers,
+                                                              rate_limiter=self.rate_limiter, **fast_path_config)
+                self._owned.append(self.investing_fetcher)
+            return self.investing_fetcher
+
+    def blocker(self, name):
+        with self._lock:
+            if name not in self._blockers:
+                self._blockers[name] = ResourceBlocker.for_source(name)
+            return self._blockers[name]
+
+    def _add(self, name, key, value=1):
+        with self._lock:
+            self._stats[name][key] += value
+
+    # 各阶段的处理函数，返回交给下一个阶段的项目列表
+
+    def _fetch(self, task):
+        """按 fetch 声明依次尝试获取方式，每次尝试租用一个会话"""
+        spec = task.source.fetch
+        errors = []
+        while spec:
+            try:
+                with self.sessions.lease() as session:
+                    started = time.monotonic()
+                    try:
+                        document = FETCHERS[spec["type"]](self, task.source, task.url, spec, session)
+                    except BLOCKED_ERRORS:
+                        self.sessions.report(session, ok=False, blocked=True)
+                        raise
+                    self.sessions.report(session, ok=True, latency=time.monotonic() - started)
+                self._add(task.source.name, "documents")
+                return [document]
+            except Exception as e:
+                errors.append(f"{spec['type']}: {str(e)}")
+                if spec.get("fallback"):
+                    logger.warning(f"{task.source.name} 通过 {spec['type']} 获取 {task.url} 失败，"
+                                   f"回退到 {spec['fallback']['type']}: {str(e)}")
+                spec = spec.get("fallback")
+        raise RuntimeError("; ".join(errors))
+
+    def _extract(self, document):
+        data = extract_from_html(document.html, document.source.schema)
+        records = data.pop(document.source.records, None) or []
+        metadata = {k: v for k, v in data.items() if isinstance(v, str)}
+        metadata.update(document.metadata)
+        instrumentation.count(document.source.name, "rows_extracted", len(records))
+        return [Batch(document.source, document.url, records, metadata)]
+
+    def _normalize(self, batch):
+        records = [{k: _strip(v) for k, v in record.items()} for record in batch.records]
+        for step in batch.source.normalize:
+            records = NORMALIZERS[step["op"]](records, step)
+        batch.records = records
+        self._add(batch.source.name, "records", len(records))
+        return [batch]
+
+    def _sink(self, batch):
+        """依次写入声明的输出，一个输出失败不影响其他输出"""
+        name = batch.source.name
+        if not batch.records:
+            # 没有记录时不写入，避免 remove_missing 把已有数据当作已移除
+            logger.warning(f"{name} 的 {batch.url} 没有数据可以保存")
+            return []
+        for spec in batch.source.sinks:
+            try:
+                result = SINKS[spec["type"]](self, batch, spec)
+            except Exception as e:
+                logger.error(f"{name} 写入 {spec['type']} 失败: {str(e)}")
+                self._add(name, "errors")
+                continue
+            if isinstance(result, dict):
+                for key in ("inserted", "updated", "removed"):
+                    self._add(name, key, result.get(key, 0))
+        instrumentation.count(name, "rows_saved", len(batch.records))
+        return []
+
+    def _worker(self, stage, handler, inbox, outbox, remaining):
+        try:
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    break
+                name = item.source.name
+                try:
+                    with instrumentation.stage(name, stage):
+                        results = handler(item)
+                except Exception as e:
+                    logger.error(f"{name} 在 {stage} 阶段失败: {str(e)}")
+                    self._add(name, "errors")
+                    continue
+                for result in results:
+                    outbox.put(result)
+        finally:
+            if stage == "fetch" and self.browser_pool is not None:
+                # 浏览器按线程创建，工作线程结束前关闭本线程的浏览器
+                self.browser_pool.close_thread()
+            with self._lock:
+                remaining[stage] -= 1
+                last = remaining[stage] == 0
+            index = STAGES.index(stage)
+            if last and index + 1 < len(STAGES):
+                for _ in range(self.stages[STAGES[index + 1]]["workers"]):
+                    outbox.put(_DONE)
+
+    def run(self, names=None):
+        """
+        运行指定的数据源（默认全部），返回每个数据源的统计：
+        documents / records / inserted / updated / removed / errors
+        """
+        names = list(names or self.sources)
+        unknown = [name for name in names if name not in self.sources]
+        if unknown:
+            raise ValueError(f"未声明的数据源: {', '.join(unknown)}")
+        self.run_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._stats = {name: {"documents": 0, "records": 0, "inserted": 0, "updated": 0, "removed": 0, "errors": 0}
+                       for name in names}
+        queues = {stage: queue.Queue(maxsize=self.stages[stage]["queue_size"]) for stage in STAGES}
+        queues[None] = None
+        handlers = {"fetch": self._fetch, "extract": self._extract, "normalize": self._normalize, "sink": self._sink}
+        remaining = {stage: self.stages[stage]["workers"] for stage in STAGES}
+
+        threads = []
+        for index, stage in enumerate(STAGES):
+            outbox = queues[STAGES[index + 1] if index + 1 < len(STAGES) else None]
+            for n in range(self.stages[stage]["workers"]):
+                thread = threading.Thread(target=self._worker, name=f"pipeline-{stage}-{n}", daemon=True,
+                                          args=(stage, handlers[stage], queues[stage], outbox, remaining))
+                thread.start()
+                threads.append(thread)
+
+        logger.info(f"开始运行流水线: {', '.join(names)}")
+        started = time.monotonic()
+        try:
+            for name in names:
+                for url in self.sources[name].urls:
+                    queues["fetch"].put(FetchTask(self.sources[name], url))
+            for _ in range(self.stages["fetch"]["workers"]):
+                queues["fetch"].put(_DONE)
+            for thread in threads:
+                thread.join()
+        finally:
+            self._close_owned()
+        for name in names:
+            stats = self._stats[name]
+            logger.info(f"{name}: 获取 {stats['documents']} 个页面，{stats['records']} 条记录，"
+                        f"新增 {stats['inserted']} 条，更新 {stats['updated']} 条，"
+                        f"移除 {stats['removed']} 条，错误 {stats['errors']} 个")
+        logger.info(f"流水线运行完成，耗时 {time.monotonic() - started:.1f}s")
+        for blocker in self._blockers.values():
+            blocker.log_stats()
+        return self._stats
+
+    def _close_owned(self):
+        with self._lock:
+            owned, self._owned = self._owned, []
+        for resource in owned:
+            try:
+                resource.close()
+            except Exception as e:
+                logger.warning(f"关闭 {type(resource).__name__} 失败: {str(e)}")
+        if self.browser_pool in owned:
+            self.browser_pool = None
+        if self.investing_fetcher in owned:
+            self.investing_fetcher = None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="运行 config.json 中声明的数据源流水线")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--sources", nargs="*", help="要运行的数据源，默认全部")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    engine = PipelineEngine.from_config(config)
+    try:
+        stats = engine.run(args.sources)
+    finally:
+        engine.store.close()
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
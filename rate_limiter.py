@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+按主机的自适应限速
+所有爬虫共用一个按主机区分的令牌桶，请求前取令牌，响应后反馈结果（AIMD）：
+- 响应正常且延迟平稳时，每次成功把速率增加 increase（加性增）
+- 遇到 429 / 403 / 503、验证页面（challenge）时速率乘以 backoff（乘性减），
+  并暂停 cooldown 秒（有 Retry-After 时取两者较大值）
+- 请求没有得到响应（超时、连接被重置）时速率乘以 backoff，不暂停
+- 延迟超过基线（指数移动平均）的 latency_factor 倍时速率乘以 latency_backoff
+速率限制在 [min_rate, max_rate] 之间，单位为 请求/秒
+
+配置在 config.json 的 rate_limits 中，default 为所有主机的默认值，
+按主机名配置的字段覆盖默认值（同时匹配子域名）
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import instrumentation
+
+logger = logging.getLogger("rate_limiter")
+
+DEFAULT_LIMITS = {
+    "rate": 1.0,
+    "burst": 2,
+    "min_rate": 0.05,
+    "max_rate": 5.0,
+    "increase": 0.05,
+    "backoff": 0.5,
+    "cooldown": 60,
+    "latency_factor": 2.5,
+    "latency_backoff": 0.8
+}
+
+THROTTLE_STATUSES = (403, 429, 503)
+
+# 反爬验证页面的特征（页面标题或响应内容）
+CHALLENGE_MARKERS = (
+    "cf-chl",
+    "challenge-platform",
+    "just a moment...",
+    "attention required",
+    "px-captcha",
+    "g-recaptcha",
+    "are you a robot",
+    "access denied"
+)
+
+
+def is_challenge(body):
+    """判断响应内容是否为反爬验证页面"""
+    if not body:
+        return False
+    if isinstance(body, bytes):
+        body = body[:20000].decode("utf-8", "replace")
+    text = body[:20000].lower()
+    return any(marker in text for marker in CHALLENGE_MARKERS)
+
+
+def host_of(url_or_host):
+    if "://" in url_or_host:
+        return (urlsplit(url_or_host).hostname or "").lower()
+    return url_or_host.lower()
+
+
+class HostLimiter:
+    """单个主机的令牌桶"""
+
+    def __init__(self, host, limits):
+        self.host = host
+        self.limits = limits
+        self._set_rate(float(limits["rate"]))
+        self.tokens = float(limits["burst"])
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.latency_baseline = None
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # 暂停期间不积累令牌，暂停结束后按当前速率逐个放行
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(float(self.limits["burst"]), self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """预留一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            self.requests += 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(0.0, self.paused_until - now) + wait
+
+    def _set_rate(self, rate):
+        self.rate = min(float(self.limits["max_rate"]), max(float(self.limits["min_rate"]), rate))
+
+    def record(self, status=200, latency=None, challenge=False, retry_after=None, error=False):
+        """反馈一次请求的结果，返回限速原因（未限速时为 None），error 表示请求没有得到响应"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            reason = None
+            if challenge:
+                reason = "challenge"
+            elif status in THROTTLE_STATUSES:
+                reason = f"http_{status}"
+
+            if reason is not None:
+                self._set_rate(self.rate * self.limits["backoff"])
+                cooldown = max(float(self.limits["cooldown"]), float(retry_after or 0))
+                self.paused_until = max(self.paused_until, now + cooldown)
+                self.tokens = min(self.tokens, 0.0)
+                self.throttled += 1
+            elif error:
+                reason = "error"
+                self._set_rate(self.rate * self.limits["backoff"])
+            elif latency is not None and self.latency_baseline is not None \
+                    and latency > self.latency_baseline * self.limits["latency_factor"]:
+                reason = "latency"
+                self._set_rate(self.rate * self.limits["latency_backoff"])
+            elif status is None or status < 400:
+                self._set_rate(self.rate + self.limits["increase"])
+
+            # 基线只用正常响应更新，避免被异常值拉高
+            if latency is not None and reason is None:
+                if self.latency_baseline is None:
+                    self.latency_baseline = latency
+                else:
+                    self.latency_baseline = 0.8 * self.latency_baseline + 0.2 * latency
+            return reason
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": round(self.rate, 4),
+                "tokens": round(self.tokens, 2),
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+                "latency_baseline": round(self.latency_baseline, 3) if self.latency_baseline else None,
+                "requests": self.requests,
+                "throttled": self.throttled
+            }
+
+
+class RateLimiter:
+    """按主机管理令牌桶，线程安全，所有爬虫共用一个实例"""
+
+    def __init__(self, config=None, enabled=True):
+        self.config = dict(config or {})
+        self.enabled = enabled and self.config.get("enabled", True)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _limits_for(self, host):
+        limits = dict(DEFAULT_LIMITS)
+        limits.update({k: v for k, v in self.config.get("default", {}).items() if k in DEFAULT_LIMITS})
+        # 依次匹配父域名，越具体的配置优先级越高
+        parts = host.split(".")
+        for i in range(len(parts) - 1, -1, -1):
+            limits.update(self.config.get(".".join(parts[i:]), {}))
+        return limits
+
+    def host(self, url_or_host):
+        host = host_of(url_or_host)
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                limiter = self._hosts[host] = HostLimiter(host, self._limits_for(host))
+            return limiter
+
+    def acquire(self, url_or_host):
+        """等待直到可以向该主机发送请求，返回等待的秒数"""
+        if not self.enabled:
+            return 0.0
+        wait = self.host(url_or_host).reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, url_or_host):
+        """acquire 的异步版本，等待令牌时不阻塞事件循环"""
+        if not self.enabled:
+            return 0.0
+        wait = self.host(url_or_host).reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def record(self, url_or_host, status=200, latency=None, challenge=False, retry_after=None, error=False):
+        """反馈请求结果，调整该主机的速率"""
+        if not self.enabled:
+            return None
+        limiter = self.host(url_or_host)
+        reason = limiter.record(status, latency, challenge, retry_after, error)
+        if reason is not None:
+            logger.warning(f"[{limiter.host}] 触发限速 ({reason})，速率降至 {limiter.rate:.3f} req/s")
+            instrumentation.count(limiter.host, f"throttled_{reason}")
+        instrumentation.emit({"type": "gauge", "source": limiter.host, "name": "rate_limit", "value": limiter.rate})
+        return reason
+
+    def stats(self):
+        """每个主机当前的速率和状态"""
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: limiter.stats() for host, limiter in hosts.items()}
+
+    def log_stats(self):
+        for host, stats in self.stats().items():
+            logger.info(f"[{host}] 当前速率 {stats['rate']} req/s，请求 {stats['requests']} 次，"
+                        f"限速 {stats['throttled']} 次")
+
+
+def load_rate_limit_config(config_path="config.json"):
+    """读取 config.json 中的 rate_limits 配置"""
+    try:
+        with open(config_path, 'r') as f:
+            return json.load(f).get("rate_limits", {})
+    except Exception as e:
+        logger.warning(f"加载限速配置失败，使用默认限速: {str(e)}")
+        return {}
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """进程内共享的限速器，第一次调用时按 config.json 创建"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RateLimiter(load_rate_limit_config())
+        return _shared
+
+
+def set_rate_limiter(limiter):
+    """替换共享的限速器（例如基准测试中关闭限速）"""
+    global _shared
+    with _shared_lock:
+        _shared = limiter
+
+
+def retry_after_seconds(headers):
+    """读取 Retry-After 响应头（秒数），没有或不是秒数时返回 None"""
+    value = {k.lower(): v for k, v in (headers or {}).items()}.get("retry-after")
+    try:
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def goto(page, url, limiter=None, **kwargs):
+    """限速后打开页面，并根据响应状态和内容调整速率，返回 page.goto 的结果；打开失败时降速后重新抛出"""
+    limiter = limiter or get_rate_limiter()
+    limiter.acquire(url)
+    started = time.monotonic()
+    try:
+        response = page.goto(url, **kwargs)
+    except Exception:
+        limiter.record(url, None, time.monotonic() - started, error=True)
+        raise
+    latency = time.monotonic() - started
+    if response is not None:
+        # 验证页面通常只有标题可以区分，只检查标题避免读取整个页面
+        challenge = is_challenge(page.title())
+        limiter.record(url, response.status, latency, challenge=challenge,
+                       retry_after=retry_after_seconds(response.headers))
+    return response
+
+
+async def goto_async(page, url, limiter=None, **kwargs):
+    """goto 的异步版本，等待令牌时不阻塞事件循环"""
+    limiter = limiter or get_rate_limiter()
+    await limiter.acquire_async(url)
+    started = time.monotonic()
+    try:
+        response = await page.goto(url, **kwargs)
+    except Exception:
+        limiter.record(url, None, time.monotonic() - started, error=True)
+        raise
+    latency = time.monotonic() - started
+    if response is not None:
+        challenge = is_challenge(await page.title())
+        limiter.record(url, response.status, latency, challenge=challenge,
+                       retry_after=retry_after_seconds(response.headers))
+    return response
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+按经济数据发布时间自适应调度 MarketWatch 爬取
+从最近一次爬取的日历中读取每个事件的发布时间（美国东部时间），
+在发布时间前后的窗口内（before_seconds / after_seconds）按 interval_seconds 密集爬取，
+直到该时间点的所有事件都有了 actual 或窗口结束；其他时间按 baseline_seconds 低频爬取。
+
+config.json:
+    "schedule": {"mode": "release_aware", "release_polling": {"interval_seconds": 5, ...}}
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger("release_poller")
+
+DEFAULT_POLLING = {
+    "timezone": "America/New_York",
+    "before_seconds": 60,
+    "after_seconds": 600,
+    "interval_seconds": 5,
+    "baseline_seconds": 3600
+}
+
+MONTHS = {name: i + 1 for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"])}
+
+# "MONDAY, OCT. 14" / "Oct 14, 2026" / "Sept. 9"
+MONTH_DAY_PATTERN = re.compile(r"\b([a-z]{3})[a-z]*\.?\s+(\d{1,2})(?:,?\s+(\d{4}))?", re.IGNORECASE)
+ISO_DATE_PATTERN = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+TIME_PATTERN = re.compile(r"(\d{1,2}):(\d{2})\s*([ap])\.?\s*m\.?|(\d{1,2}):(\d{2})", re.IGNORECASE)
+
+
+def parse_release_date(text, today):
+    """解析日历中的日期，没有年份时取离 today 最近的年份"""
+    text = (text or "").strip()
+    match = ISO_DATE_PATTERN.search(text)
+    if match:
+        return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3))).date()
+    match = MONTH_DAY_PATTERN.search(text)
+    if not match or match.group(1).lower() not in MONTHS:
+        return None
+    month, day = MONTHS[match.group(1).lower()], int(match.group(2))
+    if match.group(3):
+        return datetime(int(match.group(3)), month, day).date()
+    candidates = []
+    for year in (today.year - 1, today.year, today.year + 1):
+        try:
+            candidates.append(datetime(year, month, day).date())
+        except ValueError:
+            continue
+    return min(candidates, key=lambda d: abs(d - today)) if candidates else None
+
+
+def parse_release_time(text):
+    """解析 "8:30 am" / "10:00 AM ET" / "14:00"，无法解析（如 "All Day"）时返回 None"""
+    match = TIME_PATTERN.search(text or "")
+    if not match:
+        return None
+    if match.group(3):
+        hour, minute = int(match.group(1)) % 12, int(match.group(2))
+        if match.group(3).lower() == "p":
+            hour += 12
+    else:
+        hour, minute = int(match.group(4)), int(match.group(5))
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+
+def pending_releases(rows, now):
+    """
+    日历中尚未公布 actual 的事件，按发布时间分组，返回 {发布时间: [事件名, ...]}
+    只有第一行带日期时，日期向下填充到同一天的其他行；
+    forecast 和 previous 都为空的事件（如官员讲话）不会有 actual，不参与密集爬取
+    """
+    tz = now.tzinfo
+    releases = {}
+    current_date = None
+    for row in rows:
+        parsed_date = parse_release_date(row.get("date"), now.date())
+        if parsed_date is not None:
+            current_date = parsed_date
+        clock = parse_release_time(row.get("time"))
+        if current_date is None or clock is None or (row.get("actual") or "").strip():
+            continue
+        if not (row.get("forecast") or "").strip() and not (row.get("previous") or "").strip():
+            continue
+        release = datetime(current_date.year, current_date.month, current_date.day, *clock, tzinfo=tz)
+        releases.setdefault(release, []).append(row.get("event", ""))
+    return releases
+
+
+class ReleasePoller:
+    """
+    在调度器主循环中调用 tick()，到时间时通过 submit 提交爬取任务
+    load_rows 返回最近一次爬取的日历行（如 CrawlStore.latest("economic_data")）
+    """
+
+    def __init__(self, submit, load_rows, timezone="America/New_York", before_seconds=60,
+                 after_seconds=600, interval_seconds=5, baseline_seconds=3600):
+        self.submit = submit
+        self.load_rows = load_rows
+        self.tz = ZoneInfo(timezone)
+        self.before = timedelta(seconds=before_seconds)
+        self.after = timedelta(seconds=after_seconds)
+        self.interval = timedelta(seconds=interval_seconds)
+        self.baseline = timedelta(seconds=baseline_seconds)
+        self.next_run = None
+        self.last_run = None
+        self._active = None
+
+    @classmethod
+    def from_config(cls, config, submit, load_rows):
+        options = dict(DEFAULT_POLLING)
+        options.update(config.get("schedule", {}).get("release_polling", {}))
+        return cls(submit, load_rows, **options)
+
+    def _now(self):
+        return datetime.now(self.tz)
+
+    def plan(self, now):
+        """
+        根据待发布事件计算下一次爬取时间，返回 (下一次时间, 当前所在窗口的发布时间或 None)
+        """
+        try:
+            releases = pending_releases(self.load_rows(), now)
+        except Exception as e:
+            logger.error(f"读取发布时间失败，按基础间隔爬取: {str(e)}")
+            releases = {}
+
+        # 启动后立即爬取一次
+        baseline_next = now if self.last_run is None else self.last_run + self.baseline
+        active = [t for t in releases if t - self.before <= now <= t + self.after]
+        if active:
+            next_run = now if self.last_run is None else max(now, self.last_run + self.interval)
+            return next_run, min(active)
+
+        upcoming = [t - self.before for t in releases if t - self.before > now]
+        if upcoming:
+            return min(min(upcoming), baseline_next), None
+        return baseline_next, None
+
+    def tick(self):
+        """到时间时提交一次爬取，返回距离下一次爬取的秒数"""
+        now = self._now()
+        self.next_run, active = self.plan(now)
+        if active != self._active:
+            if active is not None:
+                events = pending_releases(self.load_rows(), now).get(active, [])
+                logger.info(f"进入发布窗口 {active.strftime('%Y-%m-%d %H:%M %Z')}: {', '.join(events[:5])}"
+                            f"{' 等' if len(events) > 5 else ''}，每 {self.interval.total_seconds():.0f}s 爬取一次")
+            else:
+                logger.info(f"离开发布窗口，下一次爬取时间 {self.next_run.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            self._active = active
+        if now >= self.next_run:
+            self.last_run = now
+            self.submit()
+            self.next_run, _ = self.plan(now)
+        return max(0.0, (self.next_run - self._now()).total_seconds())
+
+
+def _demo():
+    """打印根据当前数据库计算出的发布窗口，便于检查日期和时间解析"""
+    import json
+    import os
+    from datastore import CrawlStore
+
+    with open("config.json", 'r') as f:
+        config = json.load(f)
+    default_path = os.path.join(config.get("output_directory", "./data"), "crawl_data.db")
+    store = CrawlStore(config.get("storage", {}).get("path", default_path))
+    options = dict(DEFAULT_POLLING)
+    options.update(config.get("schedule", {}).get("release_polling", {}))
+    now = datetime.now(ZoneInfo(options["timezone"]))
+    for release, events in sorted(pending_releases(store.latest("economic_data"), now).items()):
+        print(f"{release.isoformat()}  {len(events):3d}  {', '.join(events[:3])}")
+
+
+if __name__ == "__main__":
+    _demo()
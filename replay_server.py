@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+本地回放服务器
+按录制目录中的 index.json 回放之前保存的 HTTP 响应，用来在不访问真实网站的情况下
+测试和压测爬虫（例如 Investing.com 筛选接口的快速通道）。
+
+录制目录结构：
+    index.json      [{"method": "POST", "path": "/...", "match": {"dateFrom": "..."},
+                      "status": 200, "headers": {...}, "body_file": "0001.json"}, ...]
+    0001.json       响应体
+match 中的字段需要与请求的查询参数或表单参数全部一致，按顺序取第一个匹配的记录
+
+用法：
+python replay_server.py recordings/investing --port 8765
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger("replay_server")
+
+
+class Recorder:
+    """把响应保存到录制目录，供 ReplayServer 回放"""
+
+    def __init__(self, recordings_dir):
+        self.recordings_dir = recordings_dir
+        self._lock = threading.Lock()
+        os.makedirs(recordings_dir, exist_ok=True)
+
+    def _index_path(self):
+        return os.path.join(self.recordings_dir, "index.json")
+
+    def add(self, method, path, body, status=200, headers=None, match=None, extension="html"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        with self._lock:
+            entries = load_index(self.recordings_dir)
+            body_file = f"{len(entries) + 1:04d}.{extension}"
+            with open(os.path.join(self.recordings_dir, body_file), 'wb') as f:
+                f.write(body)
+            entries.append({
+                "method": method.upper(),
+                "path": path,
+                "match": match or {},
+                "status": status,
+                "headers": headers or {},
+                "body_file": body_file
+            })
+            with open(self._index_path(), 'w') as f:
+                json.dump(entries, f, indent=4, ensure_ascii=False)
+
+
+def load_index(recordings_dir):
+    index_path = os.path.join(recordings_dir, "index.json")
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def route_to_replay(context, replay_url):
+    """
+    把 Playwright 同步 API 的 BrowserContext 中的请求转发到回放服务器
+    只保留路径和查询参数（忽略原始主机名），没有录制的请求由回放服务器返回 404
+    与 ResourceBlocker 一起使用时先调用本函数，被拦截的请求不会再转发
+    """
+    replay_url = replay_url.rstrip("/")
+
+    def handle(route):
+        url = route.request.url
+        if url.startswith(replay_url):
+            route.fallback()
+            return
+        parts = urlsplit(url)
+        target = replay_url + (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        try:
+            route.fulfill(response=route.fetch(url=target))
+        except Exception as e:
+            logger.debug(f"转发到回放服务器失败 {url}: {str(e)}")
+            route.abort()
+
+    context.route("**/*", handle)
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    # 支持 keep-alive，与真实站点的连接复用行为一致
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _params(self, body):
+        parts = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        if body:
+            form = parse_qs(body.decode("utf-8", "replace"), keep_blank_values=True)
+            params.update({k: v[-1] for k, v in form.items()})
+        return parts.path, params
+
+    def _replay(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        path, params = self._params(body)
+        entry = self.server.find(self.command, path, params)
+
+        if entry is None:
+            payload = b"no recording"
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain")
+        else:
+            payload = self.server.body(entry)
+            self.send_response(entry.get("status", 200))
+            for name, value in entry.get("headers", {}).items():
+                if name.lower() not in ("content-length", "transfer-encoding", "content-encoding"):
+                    self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.count(len(payload))
+
+    do_GET = _replay
+    do_POST = _replay
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, recordings_dir, host="127.0.0.1", port=0):
+        super().__init__((host, port), _ReplayHandler)
+        self.recordings_dir = recordings_dir
+        self.entries = load_index(recordings_dir)
+        self._bodies = {}
+        self._lock = threading.Lock()
+        self.requests_served = 0
+        self.bytes_served = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def find(self, method, path, params):
+        for entry in self.entries:
+            if entry.get("method", "GET").upper() != method.upper() or entry["path"] != path:
+                continue
+            if all(params.get(k) == str(v) for k, v in entry.get("match", {}).items()):
+                return entry
+        return None
+
+    def body(self, entry):
+        body_file = entry["body_file"]
+        with self._lock:
+            if body_file not in self._bodies:
+                with open(os.path.join(self.recordings_dir, body_file), 'rb') as f:
+                    self._bodies[body_file] = f.read()
+            return self._bodies[body_file]
+
+    def count(self, size):
+        with self._lock:
+            self.requests_served += 1
+            self.bytes_served += size
+
+    def start(self):
+        """在后台线程中启动服务器"""
+        self._thread = threading.Thread(target=self.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回放录制的 HTTP 响应")
+    parser.add_argument("recordings_dir", help="录制目录")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = ReplayServer(args.recordings_dir, host=args.host, port=args.port)
+    logger.info(f"回放服务器已启动: {server.url}，共 {len(server.entries)} 条录制")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
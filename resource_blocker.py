@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+请求拦截 / 资源屏蔽
+爬虫只读取表格单元格和 <article> 中的文本，图片、字体、视频以及广告/追踪脚本
+都是无用的下载。这里提供一个供 google_finance、MarketWatch、Investing.com
+三个爬虫共用的拦截层，规则按来源配置在 config.json 的 resource_blocking 中。
+
+规则优先级：
+1. allow_hosts 命中的请求一律放行
+2. block_hosts 命中的请求拦截
+3. allow_resource_types 命中的请求放行
+4. block_resource_types 命中的请求拦截
+5. 其余放行
+
+host 规则支持 fnmatch 通配（如 "*.doubleclick.net"），不带通配符的规则
+同时匹配该域名本身及其子域名。
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import json
+import logging
+import threading
+from collections import defaultdict
+from fnmatch import fnmatch
+from urllib.parse import urlsplit
+
+import instrumentation
+
+logger = logging.getLogger("resource_blocker")
+
+DEFAULT_RULES = {
+    "enabled": True,
+    "block_resource_types": ["image", "font", "media"],
+    "allow_resource_types": [],
+    "block_hosts": [],
+    "allow_hosts": []
+}
+
+# 被拦截的请求无法得知真实大小，按资源类型估算节省的字节数
+DEFAULT_ESTIMATED_BYTES = {
+    "image": 40000,
+    "font": 30000,
+    "media": 500000,
+    "stylesheet": 20000,
+    "script": 60000,
+    "xhr": 5000,
+    "fetch": 5000,
+    "other": 5000
+}
+
+
+def load_blocking_config(config_path="config.json"):
+    """读取 config.json 中的 resource_blocking 配置"""
+    try:
+        with open(config_path, 'r') as f:
+            return json.load(f).get("resource_blocking", {})
+    except Exception as e:
+        logger.warning(f"加载资源屏蔽配置失败，使用默认规则: {str(e)}")
+        return {}
+
+
+def _host_matches(host, pattern):
+    pattern = pattern.lower()
+    if any(c in pattern for c in "*?["):
+        return fnmatch(host, pattern)
+    return host == pattern or host.endswith("." + pattern)
+
+
+class ResourceBlocker:
+    """按来源规则拦截请求，并统计拦截数量和节省的流量"""
+
+    def __init__(self, source, rules=None, estimated_bytes=None):
+        self.source = source
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+        self.estimated_bytes = dict(DEFAULT_ESTIMATED_BYTES)
+        self.estimated_bytes.update(estimated_bytes or {})
+
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def for_source(cls, source, config=None):
+        """
+        根据配置创建某个来源的拦截器
+        来源配置覆盖 default 配置中的同名字段
+        """
+        if config is None:
+            config = load_blocking_config()
+        rules = dict(config.get("default", {}))
+        rules.update(config.get(source, {}))
+        return cls(source, rules, config.get("estimated_bytes"))
+
+    @property
+    def enabled(self):
+        return bool(self.rules.get("enabled", True))
+
+    def reset_stats(self):
+        with self._lock:
+            self.blocked_requests = 0
+            self.allowed_requests = 0
+            self.saved_bytes = 0
+            self.downloaded_bytes = 0
+            self.blocked_by_type = defaultdict(int)
+
+    def should_block(self, url, resource_type):
+        """判断一个请求是否应被拦截"""
+        if not self.enabled:
+            return False
+        host = (urlsplit(url).hostname or "").lower()
+
+        if any(_host_matches(host, p) for p in self.rules.get("allow_hosts", [])):
+            return False
+        if any(_host_matches(host, p) for p in self.rules.get("block_hosts", [])):
+            return True
+        if resource_type in self.rules.get("allow_resource_types", []):
+            return False
+        return resource_type in self.rules.get("block_resource_types", [])
+
+    def _record(self, blocked, resource_type):
+        with self._lock:
+            if blocked:
+                self.blocked_requests += 1
+                self.blocked_by_type[resource_type] += 1
+                self.saved_bytes += self.estimated_bytes.get(
+                    resource_type, self.estimated_bytes.get("other", 0))
+            else:
+                self.allowed_requests += 1
+
+    def _on_response(self, response):
+        try:
+            length = int(response.headers.get("content-length", 0))
+        except (TypeError, ValueError):
+            length = 0
+        with self._lock:
+            self.downloaded_bytes += length
+        if length:
+            instrumentation.count(self.source, "bytes_downloaded", length)
+
+    def _handle_route(self, route):
+        request = route.request
+        blocked = self.should_block(request.url, request.resource_type)
+        self._record(blocked, request.resource_type)
+        if blocked:
+            route.abort()
+        else:
+            route.fallback()
+
+    async def _handle_route_async(self, route):
+        request = route.request
+        blocked = self.should_block(request.url, request.resource_type)
+        self._record(blocked, request.resource_type)
+        if blocked:
+            await route.abort()
+        else:
+            await route.fallback()
+
+    def attach(self, context):
+        """在 Playwright 同步 API 的 BrowserContext（或 Page）上安装拦截"""
+        if not self.enabled:
+            return
+        context.route("**/*", self._handle_route)
+        context.on("response", self._on_response)
+
+    async def attach_async(self, context):
+        """在 Playwright 异步 API 的 BrowserContext（或 Page）上安装拦截"""
+        if not self.enabled:
+            return
+        await context.route("**/*", self._handle_route_async)
+        context.on("response", self._on_response)
+
+    def install_on_crawler(self, crawler):
+        """
+        在 crawl4ai 爬虫上安装拦截
+        crawl4ai 的 Playwright 策略在创建页面上下文时会调用 on_page_context_created 钩子
+        """
+        if not self.enabled:
+            return False
+        strategy = getattr(crawler, "crawler_strategy", None)
+        if strategy is None or not hasattr(strategy, "set_hook"):
+            logger.warning(f"[{self.source}] 当前 crawl4ai 版本不支持页面钩子，未安装资源屏蔽")
+            return False
+
+        async def on_page_context_created(page, context=None, **kwargs):
+            await self.attach_async(context if context is not None else page)
+            return page
+
+        strategy.set_hook("on_page_context_created", on_page_context_created)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "source": self.source,
+                "blocked_requests": self.blocked_requests,
+                "allowed_requests": self.allowed_requests,
+                "blocked_by_type": dict(self.blocked_by_type),
+                "estimated_saved_bytes": self.saved_bytes,
+                "downloaded_bytes": self.downloaded_bytes
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"[{self.source}] 拦截请求 {stats['blocked_requests']} 个，"
+            f"放行 {stats['allowed_requests']} 个，"
+            f"估计节省 {stats['estimated_saved_bytes'] / 1024:.1f} KB，"
+            f"实际下载 {stats['downloaded_bytes'] / 1024:.1f} KB"
+        )
+        return stats
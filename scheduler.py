@@ -14,6 +14,7 @@ import schedule
 from datetime import datetime
 from marketwatch_crawler import MarketWatchCrawler
 from investing_crawler import InvestingEarningsCrawler
+from async_crawlers import run_all
 
 # 设置日志
 logging.basicConfig(
@@ -86,9 +87,11 @@ def setup_schedule():
     for job in jobs:
         logger.info(f"计划任务: {job}, 下一次执行时间: {job.next_run}")
     
-    # 立即执行一次每个爬虫
-    crawl_marketwatch()
-    crawl_investing()
+    # 立即执行一次每个爬虫，两个数据源在同一个事件循环中并发执行
+    try:
+        run_all(config=config)
+    except Exception as e:
+        logger.error(f"首次爬取失败: {str(e)}")
 
     # 持续运行调度器
     while True:
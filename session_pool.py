@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+会话池
+每个会话有自己的 Cookie、User-Agent 和可选的代理。爬取前按健康度租用一个会话：
+- 健康度 = 成功率（指数移动平均） / (1 + 平均延迟 / slow_seconds)，新会话按满分参与选择
+- 被封（403 / 429 / 503、验证页面）的会话冷却 cooldown 秒，连续被封时冷却时间加倍，
+  最长 max_cooldown 秒；连续失败 max_failures 次也会冷却
+- 服务器设置的 Cookie 写回会话，状态保存到 state_path，重启后继续使用
+
+多个进程共用同一个状态文件时以最后写入的为准，只影响健康度统计的精度
+
+config.json:
+    "sessions": {"size": 4, "user_agents": [...], "proxies": [], "cooldown": 600, ...}
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("session_pool")
+
+DEFAULT_USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:131.0) Gecko/20100101 Firefox/131.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.6 Safari/605.1.15"
+)
+
+# 成功率和延迟的指数移动平均系数
+EWMA_ALPHA = 0.3
+
+
+class NoSessionAvailable(Exception):
+    """等待超时仍没有可用的会话（全部在使用或冷却中）"""
+
+
+class SessionBlocked(Exception):
+    """会话被目标站点封禁（返回限流状态码或验证页面）"""
+
+
+class Session:
+    def __init__(self, session_id, user_agent, proxy=None, cookies=None):
+        self.id = session_id
+        self.user_agent = user_agent
+        self.proxy = proxy
+        # {域名: {Cookie 名: 值}}
+        self.cookies = {domain: dict(values) for domain, values in (cookies or {}).items()}
+        self.success_rate = 1.0
+        self.latency = None
+        self.requests = 0
+        self.blocks = 0
+        self.consecutive_blocks = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_used = 0.0
+        self.in_use = 0
+        self.reported = False
+
+    def headers(self):
+        return {"User-Agent": self.user_agent}
+
+    def cookies_for(self, host):
+        """适用于该主机的 Cookie，父域名在前，越具体的域名优先"""
+        host = host.lower()
+        result = {}
+        for domain in sorted(self.cookies, key=len):
+            bare = domain.lstrip(".")
+            if host == bare or host.endswith("." + bare):
+                result.update(self.cookies[domain])
+        return result
+
+    def update_cookies(self, domain, values):
+        if values:
+            self.cookies.setdefault(domain, {}).update(values)
+
+    def update_from_browser(self, cookies):
+        """保存浏览器上下文的 Cookie（context.cookies() 的结果）"""
+        for cookie in cookies:
+            self.update_cookies(cookie["domain"], {cookie["name"]: cookie["value"]})
+
+    def browser_cookies(self, host):
+        """转换为 context.add_cookies 的格式，只包含适用于该主机的 Cookie"""
+        host = host.lower()
+        cookies = []
+        for domain, values in self.cookies.items():
+            bare = domain.lstrip(".")
+            if host == bare or host.endswith("." + bare):
+                cookies.extend({"name": name, "value": value, "domain": domain, "path": "/"}
+                               for name, value in values.items())
+        return cookies
+
+    def context_options(self):
+        """创建浏览器上下文（BrowserPool.lease）的参数"""
+        options = {"user_agent": self.user_agent}
+        if self.proxy:
+            options["proxy"] = {"server": self.proxy}
+        return options
+
+    def score(self, slow_seconds):
+        return self.success_rate / (1 + (self.latency or 0) / slow_seconds)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_agent": self.user_agent,
+            "proxy": self.proxy,
+            "cookies": self.cookies,
+            "success_rate": self.success_rate,
+            "latency": self.latency,
+            "requests": self.requests,
+            "blocks": self.blocks,
+            "consecutive_blocks": self.consecutive_blocks,
+            # 冷却截止时间保存为墙钟时间，重启后仍然有效
+            "cooldown_until": time.time() + max(0.0, self.cooldown_until - time.monotonic())
+        }
+
+    def restore(self, state):
+        """从状态文件恢复 Cookie 和健康度（User-Agent 和代理以配置为准）"""
+        self.cookies = {domain: dict(values) for domain, values in state.get("cookies", {}).items()}
+        self.success_rate = state.get("success_rate", 1.0)
+        self.latency = state.get("latency")
+        self.requests = state.get("requests", 0)
+        self.blocks = state.get("blocks", 0)
+        self.consecutive_blocks = state.get("consecutive_blocks", 0)
+        remaining = state.get("cooldown_until", 0) - time.time()
+        if remaining > 0:
+            self.cooldown_until = time.monotonic() + remaining
+
+
+class SessionPool:
+    def __init__(self, sessions, state_path=None, cooldown=600, max_cooldown=7200, slow_seconds=30,
+                 max_failures=3, max_concurrent=1, lease_timeout=120):
+        if not sessions:
+            raise ValueError("会话池至少需要一个会话")
+        self.sessions = list(sessions)
+        self.state_path = state_path
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.slow_seconds = slow_seconds
+        self.max_failures = max_failures
+        self.max_concurrent = max_concurrent
+        self.lease_timeout = lease_timeout
+        self._condition = threading.Condition()
+        self._load()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据 config.json 的 sessions 配置创建，会话按序轮流使用 user_agents 和 proxies"""
+        session_config = dict(config.get("sessions", {}))
+        user_agents = session_config.pop("user_agents", None) or list(DEFAULT_USER_AGENTS)
+        proxies = session_config.pop("proxies", None) or [None]
+        size = session_config.pop("size", max(len(user_agents), len(proxies)))
+        initial_cookies = session_config.pop("initial_cookies", {})
+        created = str(int(time.time()))
+        sessions = []
+        for i in range(size):
+            cookies = {domain: {name: value.format(created=created) for name, value in values.items()}
+                       for domain, values in initial_cookies.items()}
+            sessions.append(Session(f"session-{i}", user_agents[i % len(user_agents)],
+                                    proxies[i % len(proxies)], cookies))
+        return cls(sessions, **session_config)
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                states = {state["id"]: state for state in json.load(f)}
+        except Exception as e:
+            logger.warning(f"读取会话状态失败，使用新会话: {str(e)}")
+            return
+        for session in self.sessions:
+            if session.id in states:
+                session.restore(states[session.id])
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._condition:
+            states = [session.to_dict() for session in self.sessions]
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(states, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.warning(f"保存会话状态失败: {str(e)}")
+
+    def _pick(self, now):
+        candidates = [s for s in self.sessions if s.cooldown_until <= now and s.in_use < self.max_concurrent]
+        if not candidates:
+            return None
+        # 健康度相同时优先使用最久未用的会话
+        return max(candidates, key=lambda s: (s.score(self.slow_seconds), -s.last_used))
+
+    def acquire(self, timeout=None):
+        """租用健康度最高的空闲会话，全部在使用或冷却中时最多等待 timeout 秒"""
+        timeout = self.lease_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                session = self._pick(now)
+                if session is not None:
+                    session.in_use += 1
+                    session.last_used = now
+                    session.reported = False
+                    return session
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise NoSessionAvailable(f"{timeout}s 内没有可用的会话（共 {len(self.sessions)} 个）")
+                # 等待其他会话归还，或最早结束冷却的会话
+                cooling = [s.cooldown_until - now for s in self.sessions if s.cooldown_until > now]
+                self._condition.wait(min([remaining] + cooling))
+
+    def release(self, session):
+        with self._condition:
+            session.in_use = max(0, session.in_use - 1)
+            self._condition.notify_all()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """
+        租用一个会话，结束时归还
+        租用期间没有调用 report 时按是否抛出异常记录一次结果
+        """
+        session = self.acquire(timeout)
+        started = time.monotonic()
+        try:
+            yield session
+        except BaseException:
+            self.report(session, ok=False, unless_reported=True)
+            raise
+        else:
+            self.report(session, ok=True, latency=time.monotonic() - started, unless_reported=True)
+        finally:
+            self.release(session)
+
+    def report(self, session, ok, latency=None, blocked=False, unless_reported=False):
+        """
+        记录一次使用结果，更新健康度；被封或连续失败时进入冷却
+        unless_reported 为 True 时，本次租用已经记录过结果则不再记录（在锁内检查，
+        多个线程共用一个会话时也只记录一次），返回是否记录了结果
+        """
+        with self._condition:
+            if unless_reported and session.reported:
+                return False
+            session.reported = True
+            session.requests += 1
+            session.success_rate += EWMA_ALPHA * ((1.0 if ok else 0.0) - session.success_rate)
+            if latency is not None:
+                session.latency = latency if session.latency is None \
+                    else session.latency + EWMA_ALPHA * (latency - session.latency)
+            cooldown = None
+            if blocked:
+                session.blocks += 1
+                session.consecutive_blocks += 1
+                cooldown = min(self.cooldown * 2 ** (session.consecutive_blocks - 1), self.max_cooldown)
+            elif ok:
+                session.consecutive_blocks = 0
+                session.consecutive_failures = 0
+            else:
+                session.consecutive_failures += 1
+                if session.consecutive_failures >= self.max_failures:
+                    session.consecutive_failures = 0
+                    cooldown = self.cooldown
+            if cooldown is not None:
+                session.cooldown_until = time.monotonic() + cooldown
+                logger.warning(f"会话 {session.id} {'被封' if blocked else '连续失败'}，冷却 {cooldown:.0f}s")
+            self._condition.notify_all()
+        self.save()
+        return True
+
+    def stats(self):
+        now = time.monotonic()
+        with self._condition:
+            return {
+                session.id: {
+                    "score": round(session.score(self.slow_seconds), 3),
+                    "success_rate": round(session.success_rate, 3),
+                    "latency": round(session.latency, 2) if session.latency is not None else None,
+                    "requests": session.requests,
+                    "blocks": session.blocks,
+                    "cooling_for": round(max(0.0, session.cooldown_until - now)),
+                    "proxy": session.proxy
+                }
+                for session in self.sessions
+            }
+
+    def log_stats(self):
+        for session_id, stats in self.stats().items():
+            logger.info(f"[{session_id}] 健康度 {stats['score']}，成功率 {stats['success_rate']}，"
+                        f"延迟 {stats['latency']}s，被封 {stats['blocks']} 次，冷却剩余 {stats['cooling_for']}s")
+
+
+def load_session_config(config_path="config.json"):
+    """读取 config.json 中的 sessions 配置"""
+    try:
+        with open(config_path, 'r') as f:
+            return json.load(f).get("sessions", {})
+    except Exception as e:
+        logger.warning(f"加载会话配置失败，使用默认会话: {str(e)}")
+        return {}
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_session_pool():
+    """进程内共享的会话池，第一次调用时按 config.json 创建"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SessionPool.from_config({"sessions": load_session_config()})
+        return _shared
+
+
+def set_session_pool(pool):
+    """替换共享的会话池（例如基准测试中使用不保存状态的会话）"""
+    global _shared
+    with _shared_lock:
+        _shared = pool
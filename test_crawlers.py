@@ -9,7 +9,9 @@ import os
 import csv
 import json
 import logging
+import tempfile
 from pathlib import Path
+from datastore import CrawlStore
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -93,16 +95,25 @@ def validate_investing_data(data_file):
 def main():
     """主函数"""
     data_dir = Path("./data")
+    store_path = data_dir / "crawl_data.db"
+    marketwatch_file = data_dir / "latest_economic_data.csv"
+    investing_file = data_dir / "latest_earnings_data.csv"
+    
+    # 数据保存在增量数据库中时，把最新数据导出到临时目录再验证
+    if store_path.exists():
+        export_dir = Path(tempfile.mkdtemp())
+        store = CrawlStore(str(store_path))
+        marketwatch_file = Path(store.export_csv("economic_data", export_dir / marketwatch_file.name))
+        investing_file = Path(store.export_csv("earnings_data", export_dir / investing_file.name))
+        store.close()
     
     # 验证最新的MarketWatch数据
-    marketwatch_file = data_dir / "latest_economic_data.csv"
     if marketwatch_file.exists():
         validate_marketwatch_data(marketwatch_file)
     else:
         logger.error(f"MarketWatch数据文件不存在: {marketwatch_file}")
     
     # 验证最新的Investing.com数据
-    investing_file = data_dir / "latest_earnings_data.csv"
     if investing_file.exists():
         validate_investing_data(investing_file)
     else:
@@ -114,12 +125,9 @@ if __name__ == "__main__":
 """
 运行测试
 
-测试所有爬虫
-python test_crawlers.py --all
-
-单独测试 MarketWatch 爬虫
-python test_crawlers.py --marketwatch
+验证最新的 MarketWatch 和 Investing.com 数据
+python test_crawlers.py
 
-单独测试 Investing.com 爬虫
-python test_crawlers.py --investing
+爬虫性能测试（离线回放录制的页面）见 benchmark.py
+python benchmark.py run --recordings benchmarks/recordings
 """
\ No newline at end of file
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+爬取任务的持久化工作队列
+调度器只负责把任务放入队列，由一个或多个 crawl_worker 进程租用并执行：
+- 租约有超时时间，执行期间工作进程定期续约（心跳）
+- 工作进程崩溃或失联时租约过期，任务自动重新投递给其他工作进程（至少一次）
+- 执行失败的任务按指数退避重新排队，超过 max_attempts 次后标记为 dead
+
+WorkQueue 定义了队列接口，SQLiteWorkQueue 是单机多进程的实现（WAL 模式，
+租用在 BEGIN IMMEDIATE 事务中完成）。其他后端用 register_backend 注册后，
+在 config.json 的 work_queue.backend 中选择。
+Author: kelesit
+Date: 2026-10-18
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+logger = logging.getLogger("work_queue")
+
+
+@dataclass
+class Task:
+    id: int
+    task_type: str
+    payload: dict
+    attempts: int
+    lease_token: str
+
+
+class WorkQueue(ABC):
+    """工作队列接口，register_backend 注册的后端需要实现全部抽象方法"""
+
+    @abstractmethod
+    def enqueue(self, task_type, payload=None, dedupe_key=None, delay=0):
+        """
+        放入一个任务，返回任务 id
+        dedupe_key 相同的任务尚未完成（排队中或执行中）时不重复放入，返回 None
+        """
+
+    @abstractmethod
+    def lease(self, worker_id, task_types=None, lease_seconds=300):
+        """租用一个可执行的任务，没有任务时返回 None"""
+
+    @abstractmethod
+    def heartbeat(self, task, lease_seconds=300):
+        """续约，租约已经失效（被其他工作进程接手）时返回 False"""
+
+    @abstractmethod
+    def complete(self, task):
+        """标记任务完成，租约已失效时返回 False"""
+
+    @abstractmethod
+    def fail(self, task, error, retry_delay=0):
+        """标记本次执行失败，未超过最大次数时延迟 retry_delay 秒后重新排队"""
+
+    @abstractmethod
+    def stats(self):
+        """各状态的任务数量"""
+
+    def close(self):
+        """释放连接等资源，默认不需要"""
+
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path="./data/work_queue.db", max_attempts=4):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # 手动管理事务；多个进程共享同一个文件，写锁冲突时最多等待 30 秒
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedupe_key TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_token TEXT,
+                lease_expires_at REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, available_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_dedupe ON tasks (dedupe_key, status)")
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn, self._lock)
+
+    def enqueue(self, task_type, payload=None, dedupe_key=None, delay=0):
+        now = time.time()
+        with self._transaction():
+            if dedupe_key is not None:
+                pending = self._conn.execute(
+                    "SELECT id FROM tasks WHERE dedupe_key = ? AND status IN ('queued', 'leased') LIMIT 1",
+                    (dedupe_key,)).fetchone()
+                if pending is not None:
+                    logger.warning(f"任务 {dedupe_key} 尚未完成（id={pending['id']}），跳过本次入队")
+                    return None
+            cursor = self._conn.execute(
+                "INSERT INTO tasks (task_type, payload, dedupe_key, status, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (task_type, json.dumps(payload or {}), dedupe_key, now + delay, now, now))
+            return cursor.lastrowid
+
+    def _expire_leases(self, now):
+        """租约过期的任务重新排队；已达到最大次数的标记为 dead"""
+        self._conn.execute(
+            "UPDATE tasks SET status = 'dead', last_error = 'lease expired', lease_token = NULL, updated_at = ? "
+            "WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= ?",
+            (now, now, self.max_attempts))
+        expired = self._conn.execute(
+            "UPDATE tasks SET status = 'queued', available_at = ?, last_error = 'lease expired', "
+            "lease_token = NULL, updated_at = ? WHERE status = 'leased' AND lease_expires_at < ?",
+            (now, now, now))
+        if expired.rowcount:
+            logger.warning(f"{expired.rowcount} 个任务的租约已过期，重新排队")
+
+    def lease(self, worker_id, task_types=None, lease_seconds=300):
+        now = time.time()
+        with self._transaction():
+            self._expire_leases(now)
+            query = "SELECT * FROM tasks WHERE status = 'queued' AND available_at <= ?"
+            params = [now]
+            if task_types:
+                query += f" AND task_type IN ({', '.join('?' for _ in task_types)})"
+                params.extend(task_types)
+            row = self._conn.execute(query + " ORDER BY available_at, id LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            self._conn.execute(
+                "UPDATE tasks SET status = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                "lease_token = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (worker_id, token, now + lease_seconds, now, row["id"]))
+        return Task(row["id"], row["task_type"], json.loads(row["payload"]), row["attempts"] + 1, token)
+
+    def heartbeat(self, task, lease_seconds=300):
+        now = time.time()
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE tasks SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_token = ?",
+                (now + lease_seconds, now, task.id, task.lease_token))
+            return cursor.rowcount == 1
+
+    def complete(self, task):
+        now = time.time()
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = 'done', lease_token = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_token = ?",
+                (now, task.id, task.lease_token))
+            return cursor.rowcount == 1
+
+    def fail(self, task, error, retry_delay=0):
+        now = time.time()
+        status = "dead" if task.attempts >= self.max_attempts else "queued"
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = ?, available_at = ?, last_error = ?, lease_token = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_token = ?",
+                (status, now + retry_delay, str(error), now, task.id, task.lease_token))
+        if cursor.rowcount == 1 and status == "dead":
+            logger.error(f"任务 {task.id} ({task.task_type}) 执行 {task.attempts} 次后仍然失败，不再重试")
+        return cursor.rowcount == 1
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def purge(self, older_than_days=7):
+        """删除已完成或 dead 且超过指定天数的任务"""
+        cutoff = time.time() - older_than_days * 86400
+        with self._transaction():
+            cursor = self._conn.execute(
+                "DELETE FROM tasks WHERE status IN ('done', 'dead') AND updated_at < ?", (cutoff,))
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE 事务：开始时即取得写锁，避免多个工作进程租到同一个任务"""
+
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._lock.release()
+            raise
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        finally:
+            self._lock.release()
+
+
+BACKENDS = {
+    "sqlite": SQLiteWorkQueue
+}
+
+
+def register_backend(name, factory):
+    """注册其他队列后端，factory 接收 config.json 中 work_queue.options 的参数"""
+    BACKENDS[name] = factory
+
+
+def create_queue(config):
+    """根据 config.json 的 work_queue 配置创建队列，未启用时返回 None"""
+    queue_config = config.get("work_queue", {})
+    if not queue_config.get("enabled", False):
+        return None
+    backend = queue_config.get("backend", "sqlite")
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的工作队列后端: {backend}")
+    return BACKENDS[backend](**queue_config.get("options", {}))